@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import print_function
+
+
+import sys
+import timeit
+
+from pymads.record import Record, CompactRecord
+from pymads.request import Request
+
+def make_response(record_class):
+    '''
+    Answer to a typical query: a few addresses for the queried name.
+    '''
+    req = Request(1, [], 'A')
+    req.name = 'www.example.com'
+    records = [
+        record_class('www.example.com', '9.9.9.%d' % i) for i in range(4)
+    ] + [
+        record_class('www.example.com', 'fcd9::%d' % i, 'AAAA')
+        for i in range(2)
+    ] + [
+        record_class('www.example.com', 'ns%d.example.com' % i, 'NS')
+        for i in range(2)
+    ]
+    return req.respond(0, records)
+
+def main(number=20000):
+    '''
+    Micro-benchmark of answer packing, per packet and per record.
+
+    usage: PYTHONPATH=. python benchmarks/pack.py [iterations]
+    '''
+    number = int(number)
+    for record_class in (Record, CompactRecord):
+        resp = make_response(record_class)
+        record = resp.records[0]
+        for label, func in (
+                    ('Packet.pack', resp.pack),
+                    ('Record.pack', record.pack),
+                ):
+            seconds = min(timeit.repeat(func, number=number, repeat=3))
+            print('%-14s %-12s %8.2f us' % (
+                record_class.__name__, label, seconds / number * 1e6
+            ))
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import print_function
+
+import sys
+import timeit
+
+from persei import RawData
+
+from pymads.packet import Packet
+from pymads.record import Record, SOAType
+from pymads.request import Request
+
+def make_packets():
+    '''
+    A typical query, and a response with a mix of record types.
+    '''
+    req = Request(1, [], 'A')
+    req.name = 'www.example.com'
+
+    records = [
+        Record('www.example.com', '9.9.9.%d' % i) for i in range(4)
+    ] + [
+        Record('www.example.com', 'fcd9::%d' % i, 'AAAA') for i in range(2)
+    ] + [
+        Record('www.example.com', 'ns%d.example.com' % i, 'NS')
+        for i in range(2)
+    ] + [
+        Record('example.com', SOAType('ns1.example.com',
+            'hostmaster.example.com', 1, 7200, 900, 1209600, 300), 'SOA'),
+    ]
+    resp = req.respond(0, records)
+    return [
+        ('query',    req.pack()),
+        ('response', resp.pack()),
+    ]
+
+def parse_rawdata(data):
+    packet = Packet()
+    raw = RawData(data)
+    packet.unpack_header(raw)
+    packet.unpack_body(raw)
+
+def parse_memoryview(data):
+    Packet().unpack(data)
+
+def parse_query(data):
+    Request().unpack(data)
+
+PARSERS = [
+    ('RawData',    parse_rawdata),
+    ('memoryview', parse_memoryview),
+]
+
+def main(number=2000):
+    '''
+    Micro-benchmark of parse cost per packet, RawData vs memoryview paths.
+
+    usage: PYTHONPATH=. python benchmarks/parse.py [iterations]
+    '''
+    number = int(number)
+    for label, data in make_packets():
+        parsers = list(PARSERS)
+        if label == 'query':
+            parsers.append(('Request', parse_query))
+        for name, func in parsers:
+            seconds = min(timeit.repeat(
+                lambda: func(data), number=number, repeat=3
+            ))
+            print('%-8s %4d bytes  %-10s %8.1f us/packet' % (
+                label, len(data), name, seconds / number * 1e6
+            ))
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import print_function
+
+
+import gc
+import sys
+import time
+import tracemalloc
+
+from pymads.record import Record, CompactRecord
+
+def make_fields(count):
+    '''
+    Field tuples for a synthetic zone, an A and an AAAA record per name.
+    Owner names are separate strings per record, as json.load makes them.
+    '''
+    for i in range(count // 2):
+        for rtype, rdata in (
+                    ('A', '10.%d.%d.%d' % (i >> 16 & 0xff, i >> 8 & 0xff,
+                        i & 0xff)),
+                    ('AAAA', 'fcd9::%x:%x' % (i >> 16, i & 0xffff)),
+                ):
+            yield ('host%d.example.com' % i, rdata, rtype, 300)
+
+def measure(record_class, count):
+    gc.collect()
+    tracemalloc.start()
+    started = time.time()
+    records = [record_class(*fields) for fields in make_fields(count)]
+    elapsed = time.time() - started
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(records), size, elapsed
+
+def main(count=500000):
+    '''
+    Memory per record for Record and CompactRecord, over a synthetic zone.
+    Counts everything allocated while building the records, including
+    owner names and rdata.
+
+    usage: PYTHONPATH=. python benchmarks/records.py [records]
+    '''
+    for record_class in (Record, CompactRecord):
+        number, size, elapsed = measure(record_class, int(count))
+        print('%-14s %8d records %6.1f MB %6.1f bytes/record %5.2fs' % (
+            record_class.__name__, number, size / 1e6,
+            float(size) / number, elapsed
+        ))
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+
+from __future__ import print_function
+
+import multiprocessing
+import select
+import socket
+import sys
+import time
+
+from pymads.chain  import Chain
+from pymads.record import Record
+from pymads.request import Request
+from pymads.server import DnsServer
+from pymads.sources.dict import DictSource
+
+HOST = '127.0.0.1'
+PORT = 53100
+
+MODES = [
+    ('recvfrom loop', {}),
+    ('batched I/O',   {'batch_io': True}),
+]
+
+def run_server(config):
+    record = Record('example.com', '9.9.9.9')
+    server = DnsServer(
+        listen_host = HOST,
+        listen_port = PORT,
+        chains = [Chain([DictSource({'example.com': [record]})])],
+        **config
+    )
+    server.serve()
+
+def hammer(seconds, window):
+    '''
+    Keep `window` queries in flight for `seconds`. Returns answers/sec.
+    '''
+    req = Request(1, [], 'A')
+    req.name = 'example.com'
+    query = req.pack()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect((HOST, PORT))
+    sock.setblocking(False)
+
+    answered = 0
+    in_flight = 0
+    start = time.time()
+    deadline = start + seconds
+    while time.time() < deadline:
+        while in_flight < window:
+            sock.send(query)
+            in_flight += 1
+        if not select.select([sock], [], [], 0.05)[0]:
+            in_flight = 0 # Assume the window was dropped, refill
+            continue
+        while True:
+            try:
+                sock.recv(512)
+            except socket.error:
+                break
+            answered += 1
+            in_flight -= 1
+    sock.close()
+    return answered / (time.time() - start)
+
+def main(seconds=5, window=32):
+    '''
+    Loopback throughput benchmark for DnsServer.
+
+    Starts a server in a child process for each I/O mode, and hammers it
+    from this process with a window of outstanding queries.
+
+    usage: PYTHONPATH=. python benchmarks/serve_qps.py [seconds] [window]
+    '''
+    for label, config in MODES:
+        proc = multiprocessing.Process(target=run_server, args=(config,))
+        proc.start()
+        time.sleep(0.5)
+        try:
+            hammer(0.5, window) # Warm up
+            qps = hammer(float(seconds), int(window))
+        finally:
+            proc.terminate()
+            proc.join()
+        print('%-16s %10.0f qps' % (label, qps))
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import print_function
+
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import threading
+
+from pymads.request import Request
+from pymads.sources.sqlite import SQLiteSource, SCHEMA, INSERT
+
+def make_database(path, rows):
+    '''
+    A table of `rows` A records, one per name.
+    '''
+    connection = sqlite3.connect(path)
+    for statement in SCHEMA:
+        connection.execute(statement)
+    connection.executemany(INSERT, (
+        ('host%d.example.com' % i, 'A', 300,
+            '10.%d.%d.%d' % (i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff))
+        for i in range(rows)
+    ))
+    connection.commit()
+    connection.close()
+
+def make_requests(rows, count, hot):
+    '''
+    Requests for random names. With hot, 90% go to 1000 popular names.
+    '''
+    requests = []
+    for _ in range(count):
+        if hot and random.random() < 0.9:
+            i = random.randrange(min(rows, 1000))
+        else:
+            i = random.randrange(rows)
+        request = Request()
+        request.name = 'host%d.example.com' % i
+        requests.append(request)
+    return requests
+
+def run(source, requests, threads):
+    '''
+    Lookups per second, with the requests split over some threads.
+    '''
+    def lookup(part):
+        for request in part:
+            source.get(request)
+    workers = [
+        threading.Thread(target=lookup, args=(requests[i::threads],))
+        for i in range(threads)
+    ]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(requests) / (time.time() - started)
+
+def main(rows=1000000, lookups=50000):
+    '''
+    Lookups per second from SQLiteSource, against a table of `rows` rows.
+
+    usage: PYTHONPATH=. python benchmarks/sqlite.py [rows] [lookups]
+    '''
+    rows, lookups = int(rows), int(lookups)
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        started = time.time()
+        make_database(path, rows)
+        print('Built %d rows in %.1fs' % (rows, time.time() - started))
+        for cache_size, hot in ((0, False), (0, True), (10000, True)):
+            requests = make_requests(rows, lookups, hot)
+            for threads in (1, 4):
+                source = SQLiteSource(path, cache_size=cache_size)
+                qps = run(source, requests, threads)
+                source.close()
+                print('cache %5d, %s names, %d threads: %8.0f lookups/s' % (
+                    cache_size, 'hot' if hot else 'random', threads, qps
+                ))
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
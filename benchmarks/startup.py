@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import print_function
+
+
+import os
+import sys
+import json
+import time
+import timeit
+import tempfile
+
+from pymads.record import CompactRecord
+from pymads.request import Request
+from pymads.sources.json import JSONSource
+from pymads.sources.compiled import CompiledSource, compile_zone
+
+def make_zone(count):
+    '''
+    A JSON zone with count names, each with an A and an AAAA record.
+    '''
+    zone = {}
+    for i in range(count):
+        zone['host%d.example.com' % i] = [
+            {'rdata': '10.%d.%d.%d' % (i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff)},
+            {'rtype': 'AAAA', 'rdata': 'fcd9::%x:%x' % (i >> 16, i & 0xffff)},
+        ]
+    return zone
+
+def main(count=100000, number=20000):
+    '''
+    Time to first answer for a JSON zone against its compiled form, and
+    lookup cost once loaded.
+
+    usage: PYTHONPATH=. python benchmarks/startup.py [names] [lookups]
+    '''
+    count, number = int(count), int(number)
+    workdir = tempfile.mkdtemp()
+    json_path = os.path.join(workdir, 'zone.json')
+    compiled_path = os.path.join(workdir, 'zone.bin')
+    with open(json_path, 'w') as output:
+        json.dump(make_zone(count), output)
+
+    started = time.time()
+    json_source = JSONSource(json_path, CompactRecord)
+    print('JSONSource     loaded in %7.3fs' % (time.time() - started))
+
+    started = time.time()
+    compile_zone(json_source.data, compiled_path)
+    print('compile_zone   wrote  in %7.3fs, %.1f MB' % (
+        time.time() - started, os.path.getsize(compiled_path) / 1e6))
+
+    started = time.time()
+    compiled_source = CompiledSource(compiled_path)
+    print('CompiledSource opened in %7.3fs' % (time.time() - started))
+
+    request = Request()
+    request.name = 'host%d.example.com' % (count // 2)
+    for source in (json_source, compiled_source):
+        seconds = min(timeit.repeat(
+            lambda: source.get(request), number=number, repeat=3
+        ))
+        print('%-14s %6.2f us/lookup' % (
+            type(source).__name__, seconds / number * 1e6))
+
+    os.remove(json_path)
+    os.remove(compiled_path)
+    os.rmdir(workdir)
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import print_function
+
+
+import sys
+import time
+import timeit
+import tracemalloc
+
+from pymads.record import Record
+from pymads.request import Request
+from pymads.sources.dict import DictSource
+from pymads.sources.trie import TrieSource
+
+def make_data(count):
+    '''
+    count hosts spread over a thousand zones, plus a wildcard per zone.
+    '''
+    data = {}
+    for i in range(count):
+        name = 'host%d.zone%d.example.com' % (i, i % 1000)
+        data[name] = [Record(name, '10.%d.%d.%d' % (
+            i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff))]
+    for zone in range(1000):
+        name = '*.zone%d.example.com' % zone
+        data[name] = [Record(name, '10.255.255.255')]
+    return data
+
+def query(name):
+    request = Request()
+    request.name = name
+    return request
+
+def main(count=200000, number=100000):
+    '''
+    Build time, memory and lookup cost of TrieSource against DictSource.
+
+    usage: PYTHONPATH=. python benchmarks/trie.py [names] [lookups]
+    '''
+    count, number = int(count), int(number)
+    data = make_data(count)
+    queries = [
+        ('exact',    query('host%d.zone%d.example.com' % (count-1, (count-1) % 1000))),
+        ('wildcard', query('missing.zone7.example.com')),
+        ('nxdomain', query('missing.example.org')),
+    ]
+
+    for cls in (DictSource, TrieSource):
+        tracemalloc.start()
+        started = time.time()
+        source = cls(data)
+        elapsed = time.time() - started
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('%-10s built %d names in %.2fs, %.1f MB' % (
+            cls.__name__, len(data), elapsed, size / 1e6))
+        for label, request in queries:
+            seconds = min(timeit.repeat(
+                lambda: source.get(request), number=number, repeat=3
+            ))
+            print('  %-8s %6.2f us/lookup' % (label, seconds / number * 1e6))
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
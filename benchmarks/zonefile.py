@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import print_function
+
+
+import os
+import sys
+import time
+import tempfile
+
+from pymads.record import Record, CompactRecord
+from pymads.sources.zone import ZoneFileSource
+
+def write_zone(path, lines):
+    '''
+    A synthetic zone of about `lines` lines: an SOA, then hosts with an
+    A record and, for every other host, an AAAA record on an owner-less
+    line.
+    '''
+    with open(path, 'w') as zonefile:
+        zonefile.write('$ORIGIN example.com.\n$TTL 1h\n')
+        zonefile.write('@ IN SOA ns1 hostmaster ( 1 2h 15m 2w 5m )\n')
+        written = 3
+        i = 0
+        while written < lines:
+            zonefile.write('host%d IN A 10.%d.%d.%d\n' % (
+                i, i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff))
+            written += 1
+            if i % 2 == 0:
+                zonefile.write('    300 AAAA fcd9::%x:%x\n' % (
+                    i >> 16, i & 0xffff))
+                written += 1
+            i += 1
+
+def main(lines=1000000):
+    '''
+    Load time of ZoneFileSource on a synthetic zone.
+
+    usage: PYTHONPATH=. python benchmarks/zonefile.py [lines]
+    '''
+    lines = int(lines)
+    fd, path = tempfile.mkstemp(suffix='.zone')
+    os.close(fd)
+    try:
+        write_zone(path, lines)
+        for record_class in (Record, CompactRecord):
+            started = time.time()
+            source = ZoneFileSource(path, record_class=record_class)
+            elapsed = time.time() - started
+            print('%-14s %d lines, %d names in %.2fs, %.0f lines/s' % (
+                record_class.__name__, lines, len(source.data), elapsed,
+                lines / elapsed
+            ))
+            del source
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
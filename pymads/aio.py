@@ -0,0 +1,361 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import absolute_import
+
+import asyncio
+import functools
+
+from pymads.errors import DnsError, NegativeAnswer
+from pymads.extern import monotonic
+from pymads.filters.cache import CacheFilter
+from pymads.packet import TCP_MAX_SIZE
+from pymads.request import Request
+from pymads.response import Response
+from pymads.server import DnsServer
+from pymads.sources.dns import DnsSource
+from pymads.tcp import LENGTH
+
+# Python 3.5+ only. Import pymads.aio explicitly if you want it.
+
+def is_async(chain):
+    '''
+    True if any source in the chain has to be awaited.
+    '''
+    return any(hasattr(source, 'aget') for source in chain.sources)
+
+async def resolve(chain, request):
+    '''
+    Coroutine equivalent of chain.get(request).
+
+    Sources with an aget() coroutine are awaited, the rest are called
+    normally. Filters wrap the sources as in Chain.get, so a CacheFilter
+    answers hits without awaiting anything. Other filters may provide an
+    aget(request, fetch) coroutine, where fetch is the next stage in.
+    Filters with neither get the next stage's records handed to them.
+    '''
+    fetch = functools.partial(from_sources, chain)
+    for filt in chain.filters:
+        if isinstance(filt, CacheFilter):
+            fetch = functools.partial(cached, filt, fetch=fetch)
+        elif hasattr(filt, 'aget'):
+            fetch = functools.partial(filt.aget, fetch=fetch)
+        else:
+            fetch = functools.partial(filtered, filt, fetch=fetch)
+    return list(await fetch(request))
+
+async def from_sources(chain, request):
+    records = []
+    for source in chain.sources:
+        if hasattr(source, 'aget'):
+            records.extend(await source.aget(request))
+        else:
+            records.extend(source.get(request))
+    return records
+
+async def filtered(filt, request, fetch):
+    '''
+    Run a synchronous filter over the records of the stage behind it.
+    Its source is only swapped for the call, which never yields.
+    '''
+    records = await fetch(request)
+    previous = getattr(filt, 'source', None)
+    filt.source = lambda req: records
+    try:
+        return list(filt.get(request))
+    finally:
+        filt.source = previous
+
+async def cached(filt, request, fetch):
+    '''
+    CacheFilter.get for an awaited stage. Concurrent misses for a key
+    share one fetch, through the filter's async_inflight futures.
+    '''
+    key, entry, result = filt.lookup(request, prefetch=False)
+    if result is not None:
+        return result
+    filt.misses += 1
+    try:
+        return await cached_fetch(filt, key, request, fetch)
+    except NegativeAnswer:
+        raise
+    except Exception:
+        result = filt.fallback(key, entry)
+        if result is None:
+            raise
+        return result
+
+async def cached_fetch(filt, key, request, fetch):
+    future = filt.async_inflight.get(key)
+    if future is not None:
+        filt.coalesced += 1
+        try:
+            return await asyncio.shield(future)
+        except NegativeAnswer as exc:
+            raise NegativeAnswer(exc.label, exc.soa)
+
+    future = asyncio.get_event_loop().create_future()
+    filt.async_inflight[key] = future
+    now = monotonic()
+    try:
+        try:
+            result = list(await fetch(request))
+        except NegativeAnswer as exc:
+            filt.store_negative(key, exc, now)
+            raise
+        result = filt.store(key, result, now)
+    except Exception as exc:
+        future.set_exception(exc)
+        future.exception() # Retrieved, even if nobody was waiting
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        del filt.async_inflight[key]
+
+class DnsProtocol(asyncio.DatagramProtocol):
+    '''
+    Hands datagrams from the event loop to an AsyncDnsServer.
+    '''
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.server.queries += 1
+        self.server.handle(data, addr)
+
+    def error_received(self, exc):
+        self.server.logger.debug('Socket error: %r' % exc)
+
+class AsyncDnsServer(DnsServer):
+    '''
+    DnsServer driven by an asyncio event loop.
+
+    There is no queue: a query is parsed, resolved and answered inside the
+    datagram callback. Only when a chain holds async sources does the query
+    get its own task, so slow upstreams never hold up other queries.
+
+    With tcp, connections are served on the same loop, each by a task
+    that answers its queries in order. The consumers option is ignored.
+    '''
+    def __init__(self, **kwargs):
+        DnsServer.__init__(self, **kwargs)
+        self.loop      = None
+        self.transport = None
+        self.pending   = set()
+        self.streams   = set() # Writers of open TCP connections
+        self.tcp_server = None
+        self._done     = None
+
+    def handle(self, data, addr):
+        '''
+        Answer one datagram, inline if possible.
+        '''
+        if any(is_async(chain) for chain in self.config['chains']):
+            task = self.loop.create_task(self.handle_async(data, addr))
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+        else:
+            self.send(self._default_consumer.process(data), addr)
+
+    async def handle_async(self, data, addr):
+        '''
+        Answer one datagram, awaiting async sources along the way.
+        '''
+        self.send(await self.process(data), addr)
+
+    async def handle_stream(self, reader, writer):
+        '''
+        Answer length-prefixed queries from one TCP connection, until the
+        client hangs up or is quiet for tcp_idle_timeout seconds. Writes
+        wait for the client to read, without holding up anyone else.
+        '''
+        if len(self.streams) >= self.config['tcp_max_connections']:
+            writer.close()
+            return
+        self.streams.add(writer)
+        timeout = self.config['tcp_idle_timeout']
+        try:
+            while self.serving:
+                length, = LENGTH.unpack(await asyncio.wait_for(
+                    reader.readexactly(2), timeout))
+                packet = await asyncio.wait_for(
+                    reader.readexactly(length), timeout)
+                self.queries += 1
+                data = await self.process(packet, TCP_MAX_SIZE)
+                writer.write(LENGTH.pack(len(data)) + data)
+                await asyncio.wait_for(writer.drain(), timeout)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError,
+                ConnectionError):
+            pass
+        finally:
+            self.streams.discard(writer)
+            writer.close()
+
+    async def process(self, packet, max_size=None):
+        '''
+        Coroutine equivalent of Consumer.process().
+        '''
+        consumer = self._default_consumer
+        req = Request()
+        try:
+            with self.guard:
+                req.unpack(packet)
+                if req.edns_version > 0:
+                    return consumer.bad_version(req)
+                records = []
+                for chain in self.config['chains']:
+                    if is_async(chain):
+                        records = await resolve(chain, req)
+                    else:
+                        records = chain.get(req)
+                    if records:
+                        break
+                resp_pkt = consumer.answer(req, records,
+                    max_size or consumer.udp_limit(req))
+
+        except DnsError as exc:
+            resp_pkt = consumer.make_error(req, exc)
+
+        return resp_pkt
+
+    def send(self, data, addr):
+        '''
+        Send a response datagram through the transport.
+        '''
+        self.transport.sendto(data, addr)
+
+    async def start(self):
+        '''
+        Bind and start receiving on the running event loop.
+        '''
+        self.bind()
+        self.socket.setblocking(False)
+        self.loop = asyncio.get_event_loop()
+        self._done = self.loop.create_future()
+        self.transport, protocol = await self.loop.create_datagram_endpoint(
+            lambda: DnsProtocol(self),
+            sock = self.socket,
+        )
+        if self.tcp:
+            self.tcp_server = await asyncio.start_server(
+                self.handle_stream,
+                sock = self.tcp.socket,
+            )
+
+    async def serve_async(self):
+        '''
+        Serve until stop() is called.
+        '''
+        await self.start()
+        try:
+            if self.serving:
+                await self._done
+        finally:
+            self.transport.close()
+            if self.tcp_server:
+                self.tcp_server.close()
+                for writer in list(self.streams):
+                    writer.close()
+            for task in list(self.pending):
+                task.cancel()
+
+    def serve(self):
+        '''
+        Run a private event loop, and serve on it until stop() is called.
+        '''
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.serve_async())
+        finally:
+            loop.close()
+
+    def _finish(self):
+        if self._done and not self._done.done():
+            self._done.set_result(None)
+
+    def stop(self):
+        '''
+        Stop a running server. Safe to call from any thread.
+        '''
+        self.serving = False
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._finish)
+
+class ReplyProtocol(asyncio.DatagramProtocol):
+    '''
+    Resolves a future with the first datagram received.
+    '''
+    def __init__(self, future):
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        if not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+class AsyncDnsSource(DnsSource):
+    '''
+    DnsSource that can be awaited, so recursion doesn't tie up a thread.
+
+    As in DnsSource, each query uses its own ephemeral socket, so any
+    number of them may be in flight at once.
+    '''
+    timeout = 1
+
+    async def aget(self, req_in):
+        req_out = self._make_request(req_in.name, req_in.qtype, req_in.qclass)
+        return self.records_from(await self.aexchange(req_out))
+
+    async def aexchange(self, request):
+        '''
+        Coroutine equivalent of exchange().
+        '''
+        resp_pkt = await self._aexchange_data(request.pack())
+
+        resp = Response()
+        resp.unpack(resp_pkt)
+        return resp
+
+    async def _aexchange_data(self, req_pkt):
+        '''
+        Takes a request packet, returns the response packet from server.
+        '''
+        loop = asyncio.get_event_loop()
+        for _ in range(1 + self.retries):
+            future = loop.create_future()
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda: ReplyProtocol(future),
+                remote_addr = self.remote_addr,
+            )
+            try:
+                transport.sendto(req_pkt)
+                return await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                continue
+            finally:
+                transport.close()
+
+        raise Exception('External resolution timed out')
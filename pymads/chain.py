@@ -24,6 +24,10 @@ class Chain(Source):
     def __init__(self, sources=None, filters=None):
         self.sources = sources or []
         self.filters = filters or []
+        # Filters that cache need to hear about changes in our sources
+        for filt in self.filters:
+            if hasattr(filt, 'invalidate'):
+                self.subscribe(filt.invalidate)
 
     def get_from_sources(self, request):
         '''
@@ -42,3 +46,26 @@ class Chain(Source):
             filt.source = source
             source = filt.get
         return list(source(request))
+
+    def owns(self, request):
+        '''
+        Whether any source owns the requested name.
+        '''
+        return any(
+            source.owns(request)
+            for source in self.sources
+            if hasattr(source, 'owns')
+        )
+
+    def subscribe(self, callback):
+        '''
+        Subscribe to changes in every source that supports it.
+        '''
+        for source in self.sources:
+            if hasattr(source, 'subscribe'):
+                source.subscribe(callback)
+
+    def unsubscribe(self, callback):
+        for source in self.sources:
+            if hasattr(source, 'unsubscribe'):
+                source.unsubscribe(callback)
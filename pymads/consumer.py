@@ -15,10 +15,13 @@ You should have received a copy of the GNU Lesser General Public License
 along with Pymads.  If not, see <http://www.gnu.org/licenses/>
 '''
 import sys
+import logging
+import threading
 
 from pymads import request
+from pymads.packet import UDP_MAX_SIZE, EDNS_BADVERS
 from pymads.errors import DnsError
-from pymads.extern import queue as queue_module
+from pymads.extern import queue as queue_module, monotonic
 import traceback
 
 class Consumer(object):
@@ -28,6 +31,8 @@ class Consumer(object):
     def __init__(self, server, timeout=0.1):
         self.server  = server
         self.timeout = timeout
+        self.handled = 0
+        self.busy_time = 0.0 # Seconds spent handling requests
 
     @property
     def queue(self):
@@ -66,40 +71,211 @@ class Consumer(object):
         except (queue_module.Empty, TypeError):
             return
 
+        started = monotonic()
+        try:
+            if hasattr(source, 'reply'):
+                # Stream connection, such as pymads.tcp.TcpConnection
+                source.reply(self.process(packet, source.max_size))
+            else:
+                self.server.send(self.process(packet), source)
+        finally:
+            self.queue.task_done()
+            self.handled += 1
+            self.busy_time += monotonic() - started
+
+    def process(self, packet, max_size=None):
+        '''
+        Turn a raw request packet into raw response data.
+
+        Answers that don't fit in max_size bytes are truncated. The default
+        of None means UDP, where the limit depends on the client's EDNS0
+        payload size (see udp_limit).
+        '''
+        cache = self.server.wire_cache
+        key = None
+        if cache is not None:
+            if cache.chains is not self.server.config['chains']:
+                cache.attach(self.server.config['chains'])
+            key = cache.key(packet, max_size)
+            if key is not None:
+                cached = cache.get(key, packet)
+                if cached is not None:
+                    return cached
+
+        req = request.Request()
         try:
             with self.server.guard:
-                req = request.Request()
                 req.unpack(packet)
-                resp_pkt = self.make_response(req)
+                if req.edns_version > 0:
+                    return self.bad_version(req)
+                records = self.find_records(req)
+                resp_pkt = self.answer(req, records,
+                    max_size or self.udp_limit(req))
 
         except DnsError as exc:
-            try:
-                resp = req.respond(exc.code)
-                resp_pkt = resp.pack()
-            except Exception: # Shit has completely hit the fan
-                traceback.print_exc()
-                self.queue.task_done()
-                raise
+            resp_pkt = self.make_error(req, exc)
+        else:
+            if key is not None:
+                cache.put(key, req.name, records, resp_pkt)
 
-        try:
-            self.socket.sendto(resp_pkt.export(), source)
-        finally:
-            self.queue.task_done()
+        return resp_pkt
 
     def make_response(self, req):
         '''
         Process and respond to a request packet.
         '''
+        return self.answer(req, self.find_records(req))
+
+    def find_records(self, req):
+        '''
+        Ask each chain in turn for records, until one has some.
+        '''
+        records = []
         for chain in self.server.config['chains']:
             records = chain.get(req)
             if records:
-                self.server.logger.debug('Found %r%s' % (
-                    req,
-                    ''.join("\n * %r" % r for r in records)
-                ))
+                break
+        return records
+
+    def owns(self, req):
+        '''
+        Whether any chain owns the requested name.
+        '''
+        return any(
+            chain.owns(req)
+            for chain in self.server.config['chains']
+            if hasattr(chain, 'owns')
+        )
+
+    def udp_limit(self, req):
+        '''
+        Largest UDP answer we may send for this request.
+
+        Without EDNS0 that's 512 bytes. With it, the client's advertised
+        payload size, capped by our own edns_max_udp.
+        '''
+        if req.edns_size is None:
+            return UDP_MAX_SIZE
+        return max(UDP_MAX_SIZE,
+            min(req.edns_size, self.server.config['edns_max_udp']))
+
+    def respond(self, req, code=0, records=None, authority=None):
+        '''
+        Create a response to req, with an OPT record if req had one.
+        '''
+        resp = req.respond(code, records)
+        if authority:
+            resp.set_sections(resp.records, authority)
+        if req.edns_size is not None:
+            resp.edns_size = self.server.config['edns_max_udp']
+            resp.edns_do   = req.edns_do
+        return resp
+
+    def bad_version(self, req):
+        '''
+        Pack a BADVERS response, for EDNS versions we don't speak.
+        '''
+        resp = self.respond(req)
+        resp.edns_rcode = EDNS_BADVERS >> 4
+        return resp.pack()
+
+    def answer(self, req, records, max_size=UDP_MAX_SIZE):
+        '''
+        Pack the answer to a request, given the records the chains found.
 
-                resp = req.respond(0, records)
-                return resp.pack()
+        A name that exists without records of the requested type gets an
+        empty NOERROR answer (NODATA) rather than NXDOMAIN.
+        '''
+        if records or self.owns(req):
+            self.server.logger.debug('Found %r%s' % (
+                req,
+                ''.join("\n * %r" % r for r in records)
+            ))
+
+            resp = self.respond(req, 0, records)
+            return resp.pack(max_size=max_size)
         # No records found
         self.server.logger.debug('Unknown %r' % req)
         raise DnsError('NXDOMAIN', "query is not for our domain: %r" % req)
+
+    def make_error(self, req, exc):
+        '''
+        Pack an error response for a DnsError raised while handling req.
+        Negative answers bring their SOA along, for the authority section.
+        '''
+        try:
+            resp = self.respond(req, exc.code,
+                authority=getattr(exc, 'authority', None))
+            return resp.pack()
+        except Exception: # Shit has completely hit the fan
+            traceback.print_exc()
+            raise
+
+class ConsumerPool(object):
+    '''
+    A fixed number of Consumer threads, owned and supervised by a server.
+    '''
+    def __init__(self, server, size):
+        self.server    = server
+        self.size      = int(size)
+        self.consumers = [Consumer(server) for _ in range(self.size)]
+        self.threads   = [None] * self.size
+        self.restarts  = 0
+        self.logger    = logging.getLogger('server')
+
+    def start(self):
+        '''
+        Start every consumer thread.
+        '''
+        for index in range(self.size):
+            self.threads[index] = self._start_thread(index)
+
+    def _start_thread(self, index):
+        thread = threading.Thread(
+            target = self.consumers[index].listen,
+            name   = 'pymads-consumer-%d' % index,
+        )
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def check(self):
+        '''
+        Restart any consumer thread that has died.
+        '''
+        if not self.server.serving:
+            return
+        for index, thread in enumerate(self.threads):
+            if thread is not None and not thread.is_alive():
+                self.logger.warning('%s died, restarting' % thread.name)
+                self.restarts += 1
+                self.threads[index] = self._start_thread(index)
+
+    def stop(self, timeout=2):
+        '''
+        Wait for the threads to notice the server stopped, then throw away
+        whatever they left in the queue.
+        '''
+        for thread in self.threads:
+            if thread is not None:
+                thread.join(timeout)
+        while True:
+            try:
+                self.server.queue.get_nowait()
+            except queue_module.Empty:
+                break
+            self.server.queue.task_done()
+
+    def stats(self):
+        '''
+        Per-thread counters, for sizing the pool.
+        '''
+        return [
+            {
+                'name'      : thread.name if thread else None,
+                'alive'     : bool(thread and thread.is_alive()),
+                'handled'   : consumer.handled,
+                'busy_time' : consumer.busy_time,
+            }
+            for (consumer, thread) in zip(self.consumers, self.threads)
+        ]
@@ -30,6 +30,31 @@ class DnsError(Exception):
         self.label = const.get_label(const.ERROR_CODES, errtype)
         Exception.__init__(self, self.label, self.code, *args)
 
+class NegativeAnswer(DnsError):
+    '''
+    The name doesn't exist (NXDOMAIN), or has no records of the requested
+    type (NODATA, raised as NOERROR). Carries the SOA record from the
+    authority section, if there was one, which is sent back along with
+    the error and says how long it may be cached (RFC 2308).
+    '''
+    def __init__(self, errtype, soa=None, *args):
+        DnsError.__init__(self, errtype, *args)
+        self.soa = soa
+
+    @property
+    def authority(self):
+        return [self.soa] if self.soa is not None else []
+
+    @property
+    def ttl(self):
+        '''
+        Seconds the answer may be cached: the lesser of the SOA's own TTL
+        and its MINIMUM field, or 0 without an SOA.
+        '''
+        if self.soa is None:
+            return 0
+        return min(self.soa.rttl, self.soa.rdata.minimum)
+
 class ErrorConverter(object):
     '''
     Converts all non-DnsError exceptions to DnsError exceptions.
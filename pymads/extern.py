@@ -19,6 +19,7 @@ along with Pymads.  If not, see <http://www.gnu.org/licenses/>
 # Your version-specific import errors are meaningless, Pylint!
 
 import sys
+import time
 if (2, 7) <= sys.version_info[:2] < (3, 0) or sys.version_info >= (3, 2):
     import unittest
 else:
@@ -28,3 +29,12 @@ try:
     import Queue as queue
 except ImportError:
     import queue
+
+# Wall clock on Python < 3.3, which has no monotonic clock
+monotonic = getattr(time, 'monotonic', time.time)
+
+try:
+    intern = sys.intern
+except AttributeError: # Python 2
+    intern = __builtins__['intern'] if isinstance(__builtins__, dict) \
+        else __builtins__.intern
@@ -15,24 +15,361 @@ You should have received a copy of the GNU Lesser General Public License
 along with Pymads.  If not, see <http://www.gnu.org/licenses/>
 '''
 
-from datetime import datetime, timedelta
+import heapq
+import logging
+import threading
+
+from pymads.errors import NegativeAnswer
+from pymads.extern import monotonic, queue as queue_module
+from pymads.lru import LRU
+from pymads.request import Request
+
+ENTRY_OVERHEAD = 200 # Rough bytes per entry, beyond the packed records
+REFRESH_BACKLOG = 1000 # Prefetches waiting for a refresh thread, at most
+
+def entry_size(entry):
+    '''
+    Approximate memory cost of a cache entry, from the wire size of its
+    records, which is cached on them anyway.
+    '''
+    result, expires, lifetime = entry
+    return ENTRY_OVERHEAD + sum(len(r.pack()) + ENTRY_OVERHEAD for r in result)
+
+class Flight(object):
+    '''
+    One fetch from the source, which any number of threads can wait on.
+    '''
+    def __init__(self):
+        self.done   = threading.Event()
+        self.result = None
+        self.error  = None
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error  = error
+        self.done.set()
+
+    def wait(self):
+        '''
+        Block until the fetch is done, then return its result or raise
+        its error.
+        '''
+        self.done.wait()
+        if isinstance(self.error, NegativeAnswer):
+            raise NegativeAnswer(self.error.label, self.error.soa)
+        elif self.error is not None:
+            raise self.error
+        return self.result
 
 class CacheFilter(object):
     '''
     Doesn't hit the next layer of filtering if we already retrieved the data.
+
+    Holds at most `size` answers, and if max_bytes is given, roughly that
+    much memory; the least recently used answers are evicted first.
+
+    Answers are keyed by (name, qtype, qclass), and expire on a monotonic
+    deadline set by their shortest TTL. Deadlines also go on a heap, so
+    expired answers are dropped as time passes, at the cost of a peek per
+    lookup. Records are handed out as the source returned them.
+
+    NegativeAnswers (NXDOMAIN and NODATA) are cached too, for as long as
+    their SOA allows (RFC 2308), and raised again on a hit. They are kept
+    apart, at most negative_size of them, so a flood of queries for
+    random names can't push out real answers.
+
+    With prefetch, a hit in the last `prefetch` fraction of an answer's
+    lifetime (0.1 is a good value) queues it to be refreshed by one of
+    refresh_threads background threads, so popular names never expire.
+    The source must then be safe to call from several threads. When the
+    refresh threads fall too far behind, prefetches are skipped. With
+    max_stale, expired answers are kept that many seconds longer, and
+    served with a TTL of stale_ttl while they're being refreshed, or when
+    refreshing fails (RFC 8767). After a failure, the source isn't asked
+    again for stale_ttl seconds.
+
+    Concurrent misses for the same key are coalesced: one thread asks the
+    source, and the rest wait for its result or error.
     '''
 
-    def __init__(self):
-        self.cache = {}
+    def __init__(self, size=10000, max_bytes=None, negative_size=1000,
+                 prefetch=0, max_stale=0, stale_ttl=30, refresh_threads=2):
+        self.cache = LRU(size, max_bytes, entry_size)
+        self.negative = LRU(negative_size)
+        self.heap  = [] # (deadline, key, negative), may hold stale entries
+        self.lock  = threading.Lock()
+        self.prefetch  = prefetch
+        self.refresh_threads = refresh_threads
+        self.refresh_queue = None # Started with the first prefetch
+        self.max_stale = max_stale
+        self.stale_ttl = stale_ttl
+        self.inflight = {} # Key -> Flight, for keys being fetched
+        self.async_inflight = {} # Key -> asyncio future, see pymads.aio
+        self.retry = {} # Key -> when to ask again, after failed refreshes
+        self.logger = logging.getLogger('server')
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.stale_hits = 0
+        self.prefetches = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(request):
+        return (request.name, request.qtype, request.qclass)
 
     def get(self, request):
-        key = request.pack_question()
-        now = datetime.now()
-        if key in self.cache and now < min(r.ttl for r in self.cache[key]):
-            return self.cache[key]
-        else:
-            result = list(self.source(request))
-            for r in result:
-                r.ttl = now + timedelta(0, r.rttl)
-            self.cache[key] = result
+        key, entry, result = self.lookup(request)
+        if result is not None:
             return result
+        self.misses += 1
+        try:
+            return self.fetch(self.source, key, request)
+        except NegativeAnswer:
+            raise
+        except Exception:
+            result = self.fallback(key, entry)
+            if result is None:
+                raise
+            return result
+
+    def lookup(self, request, prefetch=True):
+        '''
+        Look for an answer we can give without asking the source.
+
+        Returns (key, entry, result), where result is None on a miss.
+        Cached negative answers are raised. pymads.aio uses this to put
+        the cache in front of sources it awaits, without prefetching.
+        '''
+        key = self.key(request)
+        now = monotonic()
+        heap = self.heap
+        if heap and heap[0][0] <= now:
+            self.purge(now)
+        entry = self.cache.get(key)
+        if entry is not None:
+            result, expires, lifetime = entry
+            if now < expires:
+                self.hits += 1
+                if prefetch and self.prefetch and \
+                        now >= expires - lifetime * self.prefetch:
+                    self.start_prefetch(key)
+                return key, entry, result
+            if now < expires + self.max_stale and (
+                    now < self.retry.get(key, 0) or self.fetching(key)):
+                return key, entry, self.stale(result)
+        negative = self.negative.get(key)
+        if negative is not None and now < negative[1]:
+            self.negative_hits += 1
+            label, soa = negative[0]
+            raise NegativeAnswer(label, soa)
+        return key, entry, None
+
+    def fallback(self, key, entry):
+        '''
+        After the source failed, the stale answer to serve instead, or
+        None if there isn't one.
+        '''
+        now = monotonic()
+        if entry is None or now >= entry[1] + self.max_stale:
+            return None
+        self.failures += 1
+        self.retry[key] = now + self.stale_ttl
+        self.logger.warning('Serving stale answer for %r' % (key,),
+            exc_info=True)
+        return self.stale(entry[0])
+
+    def fetching(self, key):
+        return key in self.inflight or key in self.async_inflight
+
+    def fetch(self, source, key, request=None):
+        '''
+        Ask the source for a fresh answer and cache it, or wait for the
+        answer if another thread is already asking.
+        '''
+        with self.lock:
+            flight = self.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.inflight[key] = Flight()
+        if not leader:
+            self.coalesced += 1
+            return flight.wait()
+        return self.lead(flight, source, key, request)
+
+    def lead(self, flight, source, key, request=None):
+        '''
+        Fetch for a registered Flight, and let its waiters know how it went.
+        '''
+        try:
+            result = self.load(source, key, request)
+        except Exception as exc:
+            self.land(flight, key, error=exc)
+            raise
+        self.land(flight, key, result)
+        return result
+
+    def land(self, flight, key, result=None, error=None):
+        with self.lock:
+            del self.inflight[key]
+        flight.finish(result, error)
+
+    def load(self, source, key, request=None):
+        if request is None:
+            name, qtype, qclass = key
+            request = Request(qtype=qtype, qclass=qclass)
+            request.name = name
+
+        now = monotonic()
+        try:
+            result = list(source(request))
+        except NegativeAnswer as exc:
+            self.store_negative(key, exc, now)
+            raise
+        return self.store(key, result, now)
+
+    def store(self, key, result, now):
+        '''
+        Cache a fresh answer from the source, fetched at `now`.
+        '''
+        self.negative.pop(key)
+        self.retry.pop(key, None)
+        ttl = min(r.rttl for r in result) if result else 0
+        if ttl > 0:
+            self.put(self.cache, key, result, now + ttl, ttl)
+        else:
+            self.cache.pop(key)
+        return result
+
+    def store_negative(self, key, exc, now):
+        '''
+        Cache a NegativeAnswer from the source, raised at `now`.
+        '''
+        self.cache.pop(key)
+        if exc.ttl > 0:
+            self.put(self.negative, key, (exc.label, exc.soa),
+                now + exc.ttl, exc.ttl)
+
+    def start_prefetch(self, key):
+        '''
+        Queue a cached answer to be refreshed in the background, unless
+        that's already happening, or the queue is full.
+        '''
+        with self.lock:
+            if key in self.inflight:
+                return
+            if self.refresh_queue is None:
+                self.start_refreshers()
+            flight = Flight()
+            try:
+                self.refresh_queue.put_nowait((flight, self.source, key))
+            except queue_module.Full:
+                return
+            self.inflight[key] = flight
+        self.prefetches += 1
+
+    def start_refreshers(self):
+        self.refresh_queue = queue_module.Queue(REFRESH_BACKLOG)
+        for index in range(self.refresh_threads):
+            thread = threading.Thread(
+                target = self.refresh_forever,
+                name   = 'pymads-refresh-%d' % index,
+            )
+            thread.daemon = True
+            thread.start()
+
+    def refresh_forever(self):
+        while True:
+            self.prefetch_quietly(*self.refresh_queue.get())
+
+    def prefetch_quietly(self, flight, source, key):
+        try:
+            self.lead(flight, source, key)
+        except NegativeAnswer:
+            pass
+        except Exception:
+            self.failures += 1
+            self.logger.warning('Prefetch failed for %r' % (key,),
+                exc_info=True)
+
+    def stale(self, result):
+        '''
+        Copies of expired records, with a TTL of stale_ttl.
+        '''
+        self.stale_hits += 1
+        return [r.copy(rttl=self.stale_ttl) for r in result]
+
+    def put(self, cache, key, value, expires, lifetime):
+        cache.put(key, (value, expires, lifetime))
+        negative = cache is self.negative
+        with self.lock:
+            heapq.heappush(self.heap,
+                (self.deadline(expires, negative), key, negative))
+            if len(self.heap) > 2 * (len(self.cache) + len(self.negative)) \
+                    + 100:
+                # Mostly deadlines of evicted or replaced answers
+                self.heap = [
+                    (self.deadline(entry[1], negative), entry_key, negative)
+                    for cache, negative in ((self.cache, False),
+                                            (self.negative, True))
+                    for entry_key, entry in cache.items()
+                ]
+                heapq.heapify(self.heap)
+
+    def deadline(self, expires, negative):
+        '''
+        When an entry that expires at the given time can be dropped.
+        '''
+        return expires if negative else expires + self.max_stale
+
+    def purge(self, now=None):
+        '''
+        Drop every answer that's expired, and too old to be served stale.
+        '''
+        now = now or monotonic()
+        with self.lock:
+            heap = self.heap
+            while heap and heap[0][0] <= now:
+                deadline, key, negative = heapq.heappop(heap)
+                cache = self.negative if negative else self.cache
+                entry = cache.peek(key)
+                if entry is not None and \
+                        self.deadline(entry[1], negative) == deadline:
+                    cache.pop(key)
+                    self.retry.pop(key, None)
+                    self.expirations += 1
+
+    def invalidate(self, names=None):
+        '''
+        Forget cached results for the given names, or all of them for None.
+        Their heap entries go stale, and are skipped when they come up.
+        '''
+        if names is None:
+            self.cache.clear()
+            self.negative.clear()
+            with self.lock:
+                self.heap = []
+            return
+        names = set(name.lower() for name in names)
+        for cache in (self.cache, self.negative):
+            for key, entry in cache.items():
+                if key[0] in names:
+                    cache.pop(key)
+
+    def stats(self):
+        return {
+            'entries'         : len(self.cache),
+            'negative_entries': len(self.negative),
+            'bytes'           : self.cache.bytes,
+            'hits'            : self.hits,
+            'negative_hits'   : self.negative_hits,
+            'stale_hits'      : self.stale_hits,
+            'misses'          : self.misses,
+            'prefetches'      : self.prefetches,
+            'coalesced'       : self.coalesced,
+            'failures'        : self.failures,
+            'evictions'       : self.cache.evictions + self.negative.evictions,
+            'expirations'     : self.expirations,
+        }
@@ -0,0 +1,106 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+import threading
+from collections import OrderedDict
+
+class LRU(object):
+    '''
+    Thread-safe mapping that forgets its least recently used entries once
+    it holds more than `size` of them.
+
+    With sizeof, the sizes of the values are kept as a running total, and
+    given max_bytes too, old entries are also evicted to keep that total
+    under max_bytes.
+    '''
+    def __init__(self, size, max_bytes=None, sizeof=None):
+        self.size  = int(size)
+        self.data  = OrderedDict()
+        self.lock  = threading.Lock()
+        self.evictions = 0
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        '''
+        Retrieve a value, marking it as recently used.
+        '''
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                return default
+            self.data[key] = value
+            return value
+
+    def peek(self, key, default=None):
+        '''
+        Retrieve a value without marking it as used.
+        '''
+        return self.data.get(key, default)
+
+    def put(self, key, value):
+        '''
+        Store a value, evicting the oldest entries if we're over size.
+        '''
+        sizeof = self.sizeof
+        with self.lock:
+            self._remove(key)
+            self.data[key] = value
+            if sizeof:
+                self.bytes += sizeof(value)
+            while len(self.data) > self.size or (
+                    self.max_bytes is not None and
+                    self.bytes > self.max_bytes):
+                old_key, old_value = self.data.popitem(last=False)
+                if sizeof:
+                    self.bytes -= sizeof(old_value)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        '''
+        Remove and return a value.
+        '''
+        with self.lock:
+            return self._remove(key, default)
+
+    def _remove(self, key, default=None):
+        value = self.data.pop(key, self)
+        if value is self:
+            return default
+        if self.sizeof:
+            self.bytes -= self.sizeof(value)
+        return value
+
+    def items(self):
+        '''
+        Snapshot of (key, value) pairs, oldest first.
+        '''
+        with self.lock:
+            return list(self.data.items())
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.bytes = 0
@@ -22,10 +22,20 @@ import logging
 from persei import String, RawData
 from pymads import const
 from pymads import utils
+from pymads import wire
 from pymads.record import Record
 from pymads.errors import DnsError, ErrorConverter
 
 HEADER_LENGTH = 12
+UDP_MAX_SIZE  = 512
+TCP_MAX_SIZE  = 65535
+FLAG_TC       = 0x0200
+NXDOMAIN      = const.ERROR_CODES['NXDOMAIN']
+
+OPT_TYPE      = const.RECORD_TYPES['OPT']
+OPT_FLAG_DO   = 0x8000
+EDNS_BADVERS  = 16 # Extended rcode, doesn't fit in the header
+MAX_ADDITIONAL = 4 # How far into the additional section we look for OPT
 
 PARSE_GUARD = ErrorConverter(['FORMERR'])
 
@@ -69,6 +79,12 @@ class Packet(object):
         self.arcount  = 0
         self.records  = records or []
 
+        # EDNS0 (RFC 6891) data from the OPT pseudo-record, if any
+        self.edns_size    = None # Max UDP payload. None means no OPT.
+        self.edns_version = 0
+        self.edns_do      = False
+        self.edns_rcode   = 0 # Upper 8 bits of the extended rcode
+
     @property
     def question(self):
         '''
@@ -126,6 +142,17 @@ class Packet(object):
         self.nscount = len(self.ns_records)
         self.arcount = len(self.ar_records)
 
+    def set_sections(self, answers, authority=()):
+        '''
+        Set the payload with explicit ANSWER and AUTHORITY sections,
+        rather than sorting records into them by type.
+        '''
+        self.records = list(answers) + list(authority)
+        self.an_records = list(answers)
+        self.ns_records = list(authority)
+        self.ancount = len(self.an_records)
+        self.nscount = len(self.ns_records)
+
     # Flags data ------------------------------------------
 
     flag_qr = flag_property(15, 0x1,
@@ -183,26 +210,69 @@ class Packet(object):
 
     # Packing and unpacking -------------------------------
 
-    def pack(self):
+    def pack(self, compress=True, max_size=None):
         '''
-        Returns serialized packet string.
+        Returns serialized packet bytes.
+
+        Names are compressed unless you ask otherwise. If the packet would
+        be bigger than max_size, the records are left out and the TC flag
+        is set instead, so the client knows to retry over TCP.
         '''
         resources = []
         resources.extend(self.an_records)
         num_an = len(self.an_records)
         num_ns = num_ar = 0
 
-        if self.flag_rcode == 0:
+        if self.flag_rcode in (0, NXDOMAIN):
+            # NXDOMAIN answers carry the zone's SOA in authority
             resources.extend(self.ns_records)
             resources.extend(self.ar_records)
             num_ns = len(self.ns_records)
             num_ar = len(self.ar_records)
 
-        pkt =  self.pack_header(num_an, num_ns, num_ar)
-        pkt += self.pack_question()
+        if self.edns_size is not None:
+            num_ar += 1
+
+        builder = self.pack_start(compress, self.flags, num_an, num_ns, num_ar)
         for resource in resources:
-            pkt += resource.pack()
-        return pkt
+            resource.pack_into(builder)
+        self.pack_opt(builder)
+
+        if max_size is not None and len(builder) > max_size:
+            num_ar = 1 if self.edns_size is not None else 0
+            builder = self.pack_start(compress, self.flags | FLAG_TC,
+                0, 0, num_ar)
+            self.pack_opt(builder)
+        return builder.getvalue()
+
+    def pack_start(self, compress, flags, ancount, nscount, arcount):
+        '''
+        Returns a wire.Builder holding the header and question.
+        '''
+        builder = wire.Builder(compress)
+        builder.write(wire.HEADER.pack(
+            self.qid,
+            flags,
+            1,
+            ancount,
+            nscount,
+            arcount
+        ))
+        builder.write_domain(self.name)
+        builder.write(wire.QUESTION.pack(self.qtype, self.qclass))
+        return builder
+
+    def pack_opt(self, builder):
+        '''
+        Write the EDNS0 OPT pseudo-record, if this packet has one.
+        '''
+        if self.edns_size is None:
+            return
+        ttl = (self.edns_rcode << 24) | (self.edns_version << 16)
+        if self.edns_do:
+            ttl |= OPT_FLAG_DO
+        builder.write(b'\x00') # Root name
+        builder.write(wire.RR.pack(OPT_TYPE, self.edns_size, ttl, 0))
 
     def pack_header(self, ancount, nscount, arcount):
         """
@@ -240,14 +310,76 @@ class Packet(object):
         Parse a DNS packet and set object properties from it.
         '''
 
-        packet = RawData(packet)
+        view = wire.as_view(packet)
         with PARSE_GUARD:
-            self.unpack_header(packet)
-            self.unpack_body(packet)
+            offset = self.unpack_header_from(view)
+            self.unpack_body_from(view, offset)
         if self.qclass != 1:
-            raise DnsError('FORMERR', "Invalid class: " + self.qclass)
+            raise DnsError('FORMERR', "Invalid class: %d" % self.qclass)
         logging.debug(self)
 
+    def unpack_header_from(self, view):
+        '''
+        Parse the header data from a memoryview. Returns the next offset.
+        '''
+        (
+            self.qid,
+            self.flags,
+            self.qdcount,
+            self.ancount,
+            self.nscount,
+            self.arcount
+        ) = wire.HEADER.unpack_from(view)
+        return HEADER_LENGTH
+
+    def unpack_question_from(self, view, offset):
+        '''
+        Parse the question from a memoryview. Returns the next offset.
+        '''
+        offset, labels = wire.read_name(view, offset)
+        self.question = [label.decode('utf-8') for label in labels]
+        self.qtype, self.qclass = wire.QUESTION.unpack_from(view, offset)
+        return offset + 4
+
+    def unpack_body_from(self, view, offset):
+        '''
+        Parse the body data from a memoryview.
+        '''
+        offset = self.unpack_question_from(view, offset)
+
+        # Only the OPT record is read from the ADDITIONAL section
+        ancount = self.ancount
+        arcount = self.arcount
+        records = []
+        for _ in range(self.ancount + self.nscount):
+            rec, offset = Record.from_wire(view, offset)
+            records.append(rec)
+        self.set_sections(records[:ancount], records[ancount:])
+
+        if arcount:
+            self.unpack_edns_from(view, offset, arcount)
+
+    def unpack_edns_from(self, view, offset, arcount):
+        '''
+        Find the OPT pseudo-record among the first few of arcount
+        additional records, starting at the given offset.
+        '''
+        for _ in range(min(arcount, MAX_ADDITIONAL)):
+            offset, labels = wire.read_name(view, offset)
+            rtype, rclass, ttl, rdata_len = wire.RR.unpack_from(view, offset)
+            offset += 10 + rdata_len
+            if offset > len(view):
+                raise DnsError('FORMERR', 'Truncated additional record')
+            if rtype != OPT_TYPE:
+                continue
+            if labels or self.edns_size is not None:
+                raise DnsError('FORMERR', 'Bad OPT record')
+            self.edns_size    = rclass
+            self.edns_rcode   = ttl >> 24
+            self.edns_version = (ttl >> 16) & 0xff
+            self.edns_do      = bool(ttl & OPT_FLAG_DO)
+
+    # RawData-based parsing, kept for compatibility and benchmarks.
 
     def unpack_header(self, packet):
         '''
@@ -22,6 +22,8 @@ from socket import inet_pton, inet_ntop, AF_INET, AF_INET6
 from persei import String, RawData, RawDataDecorator
 from pymads import const
 from pymads import utils
+from pymads import wire
+from pymads.extern import intern
 
 soa_namedtuple = namedtuple(
     'SOAType',
@@ -32,8 +34,23 @@ class SOAType(soa_namedtuple):
     def __str__(self):
         return "%s.\t%s.\t%d\t%d\t%d\t%d\t%d" % self
 
-class Record(object):
-    ''' Represents a DNS record. '''
+# Labels for type and class codes, as Record would store them
+TYPE_LABELS  = dict(
+    (code, const.lookup_str(const.RECORD_TYPES, code))
+    for code in set(const.RECORD_TYPES.values())
+)
+CLASS_LABELS = dict(
+    (code, const.lookup_str(const.RECORD_CLASSES, code))
+    for code in set(const.RECORD_CLASSES.values())
+)
+
+class BaseRecord(object):
+    '''
+    Behaviour shared by Record and CompactRecord. Subclasses decide how
+    the fields are stored, through the domain_name, rdata, rtype, rclass,
+    rtypecode and rclasscode attributes.
+    '''
+    __slots__ = ()
 
     def __init__(self, domain_name, rdata, 
                     rtype="A", rttl=1800, rclass="IN"):
@@ -51,65 +68,24 @@ class Record(object):
         # Set last because implicit packing depends on type and class
         self.rdata  = rdata
 
-    @property
-    def rdata(self):
-        '''
-        Field that contains the "contents" of the record.
-        '''
-        return self._rdata
-
-    @rdata.setter
-    def rdata(self, value):
-        '''
-        Setter for rdata that also sets up self.rdata_packed eagerly.
-        '''
-        self._rdata = value
-        self.rdata_packed = self.pack_rdata()
-
-    @property
-    def rtype(self):
+    def copy(self, **changes):
         '''
-        Record type. Usually A or AAAA.
-        '''
-        return self._rtype
+        A new Record like this one, with the given fields changed.
 
-    @rtype.setter
-    def rtype(self, value):
+        rec.copy(domain_name='www.example.com')
         '''
-        Setter for record type. Accepts either textual or int code.
-        '''
-        self._rtype = const.get_label(const.RECORD_TYPES, value)
-
-    @property
-    def rclass(self):
-        '''
-        Record class. Almost always IN.
-        '''
-        return self._rclass
-
-    @rclass.setter
-    def rclass(self, value):
-        '''
-        Setter for record class. Accepts either textual or int code.
-        '''
-        self._rclass = const.get_label(const.RECORD_CLASSES, value)
-
-    @property
-    def rtypecode(self):
-        '''
-        Numeric code for this record's type.
-        '''
-        return const.RECORD_TYPES[self._rtype]
-
-    @property
-    def rclasscode(self):
-        '''
-        Numeric code for this record's class.
-        '''
-        return const.RECORD_CLASSES[self._rclass]
+        fields = dict(
+            domain_name = self.domain_name,
+            rdata  = self.rdata,
+            rtype  = self.rtype,
+            rttl   = self.rttl,
+            rclass = self.rclass,
+        )
+        fields.update(changes)
+        return type(self)(**fields)
 
     def __eq__(self, other):
-        return (isinstance(other, Record) and hash(self) == hash(other))
+        return (isinstance(other, BaseRecord) and hash(self) == hash(other))
 
     def __hash__(self):
         return hash((
@@ -257,22 +233,80 @@ class Record(object):
             *struct.unpack("!IiiiI", data[offset:offset+20].export())
         )
 
+    def unpack_rdata_from(self, view, offset, length):
+        '''
+        Decode binary rdata from a memoryview.
+        '''
+        funcname = 'unpack_rdata_from_' + self.packtype
+        if hasattr(self, funcname):
+            return getattr(self, funcname)(view, offset, length)
+        else:
+            return view[offset:offset+length].tobytes()
+
+    def unpack_rdata_from_IPv4(self, view, offset, length):
+        return inet_ntop(AF_INET, view[offset:offset+length].tobytes())
+
+    def unpack_rdata_from_IPv6(self, view, offset, length):
+        return inet_ntop(AF_INET6, view[offset:offset+length].tobytes())
+
+    def unpack_rdata_from_domain(self, view, offset, length):
+        return wire.read_domain(view, offset)[1]
+
+    def unpack_rdata_from_zone(self, view, offset, length):
+        offset, mname = wire.read_domain(view, offset)
+        offset, rname = wire.read_domain(view, offset)
+        return SOAType(mname, rname, *wire.SOA.unpack_from(view, offset))
+
+    def owner_wire(self):
+        '''
+        The owner name as returned by wire.encode_domain().
+        '''
+        return wire.encode_domain(self.domain_name)
+
+    def wire_tail(self):
+        '''
+        Everything after the owner name, with uncompressed rdata.
+        '''
+        rdata = self.rdata_packed
+        if isinstance(rdata, RawData):
+            rdata = rdata.export()
+        return wire.RR.pack(
+            self.rtypecode,
+            self.rclasscode,
+            self.rttl,
+            len(rdata)
+        ) + rdata
+
     def pack(self):
         '''
         Formats the resource fields to be used in the response packet.
         '''
+        return RawData(self.owner_wire()[1] + self.wire_tail())
 
-        packed  = utils.labels2str(
-            RawData(x) for x in self.domain_name.split('.')
-        )
-        packed += struct.pack(
-            "!HHIH",
-             self.rtypecode,
-             self.rclasscode,
-             self.rttl,
-             len(self.rdata_packed)
-        )
-        return RawData(packed) + self.rdata_packed
+    def pack_into(self, builder):
+        '''
+        Write the resource to a wire.Builder, compressing names.
+        '''
+        builder.write_encoded(*self.owner_wire())
+        packtype = self.packtype
+        if packtype not in ('domain', 'zone'):
+            # Nothing to compress in the rdata
+            builder.write(self.wire_tail())
+            return
+
+        builder.write(wire.RR_HEAD.pack(
+            self.rtypecode,
+            self.rclasscode,
+            self.rttl
+        ))
+        marker = builder.start_rdata()
+        if packtype == 'domain':
+            builder.write_domain(self.rdata)
+        else:
+            builder.write_domain(self.rdata.mname)
+            builder.write_domain(self.rdata.rname)
+            builder.write(wire.SOA.pack(*self.rdata[2:]))
+        builder.end_rdata(marker)
 
     def unpack(self, source, offset=0):
         '''
@@ -290,3 +324,224 @@ class Record(object):
         offset += 10
         self.rdata = self.unpack_rdata(source, offset, rdata_len)
         return offset + rdata_len
+
+    def unpack_from(self, view, offset=0):
+        '''
+        Like unpack(), but works directly on a memoryview.
+        '''
+        offset, self.domain_name = wire.read_domain(view, offset)
+        (
+            self.rtype,
+            self.rclass,
+            self.rttl,
+            rdata_len
+        ) = wire.RR.unpack_from(view, offset)
+        offset += 10
+        if offset + rdata_len > len(view):
+            raise ValueError('Truncated rdata')
+        self.rdata = self.unpack_rdata_from(view, offset, rdata_len)
+        return offset + rdata_len
+
+    @classmethod
+    def from_wire(cls, view, offset=0):
+        '''
+        Create a Record from a memoryview. Returns (record, next offset).
+        '''
+        record = cls.__new__(cls)
+        offset = record.unpack_from(view, offset)
+        return record, offset
+
+class Record(BaseRecord):
+    '''
+    Represents a DNS record.
+
+    The wire encoding is computed on first use and kept, so packing the
+    same record again is a byte copy. Setting any field drops it.
+    '''
+
+    @property
+    def domain_name(self):
+        '''
+        A straightforward FQDN or PQDN.
+        '''
+        return self._domain_name
+
+    @domain_name.setter
+    def domain_name(self, value):
+        self._domain_name = value
+        self._owner_wire = None
+
+    @property
+    def rttl(self):
+        '''
+        Time-to-live, in seconds.
+        '''
+        return self._rttl
+
+    @rttl.setter
+    def rttl(self, value):
+        self._rttl = value
+        self._wire_tail = None
+
+    @property
+    def rdata(self):
+        '''
+        Field that contains the "contents" of the record.
+        '''
+        return self._rdata
+
+    @rdata.setter
+    def rdata(self, value):
+        '''
+        Setter for rdata that also sets up self.rdata_packed eagerly.
+        '''
+        self._rdata = value
+        self._wire_tail = None
+        self.rdata_packed = self.pack_rdata()
+
+    @property
+    def rtype(self):
+        '''
+        Record type. Usually A or AAAA.
+        '''
+        return self._rtype
+
+    @rtype.setter
+    def rtype(self, value):
+        '''
+        Setter for record type. Accepts either textual or int code.
+        '''
+        self._rtype = const.get_label(const.RECORD_TYPES, value)
+        self._wire_tail = None
+
+    @property
+    def rclass(self):
+        '''
+        Record class. Almost always IN.
+        '''
+        return self._rclass
+
+    @rclass.setter
+    def rclass(self, value):
+        '''
+        Setter for record class. Accepts either textual or int code.
+        '''
+        self._rclass = const.get_label(const.RECORD_CLASSES, value)
+        self._wire_tail = None
+
+    @property
+    def rtypecode(self):
+        '''
+        Numeric code for this record's type.
+        '''
+        return const.RECORD_TYPES[self._rtype]
+
+    @property
+    def rclasscode(self):
+        '''
+        Numeric code for this record's class.
+        '''
+        return const.RECORD_CLASSES[self._rclass]
+
+    def owner_wire(self):
+        if self._owner_wire is None:
+            self._owner_wire = BaseRecord.owner_wire(self)
+        return self._owner_wire
+
+    def wire_tail(self):
+        if self._wire_tail is None:
+            self._wire_tail = BaseRecord.wire_tail(self)
+        return self._wire_tail
+
+class CompactRecord(BaseRecord):
+    '''
+    A Record that takes as little memory as possible, for big zones.
+
+    No per-instance __dict__, owner names are interned so records for the
+    same name share one string, type and class are kept as int codes, and
+    rdata_packed is plain bytes. Addresses are only kept packed, and
+    turned back into text when rdata is read.
+
+    Works anywhere a Record does, except that it takes no extra attributes.
+    '''
+    __slots__ = (
+        '_domain_name',
+        '_rtype',
+        '_rclass',
+        'rttl',
+        '_rdata',
+        'rdata_packed',
+    )
+
+    @property
+    def domain_name(self):
+        return self._domain_name
+
+    @domain_name.setter
+    def domain_name(self, value):
+        self._domain_name = intern(value)
+
+    @property
+    def rdata(self):
+        if self._rdata is None:
+            return self.unpack_rdata_from(
+                memoryview(self.rdata_packed), 0, len(self.rdata_packed)
+            )
+        return self._rdata
+
+    @rdata.setter
+    def rdata(self, value):
+        self._rdata = value
+        packed = self.pack_rdata()
+        if isinstance(packed, RawData):
+            packed = packed.export()
+        self.rdata_packed = packed
+        if self.packtype in ('IPv4', 'IPv6'):
+            self._rdata = None
+
+    @property
+    def rtype(self):
+        return TYPE_LABELS[self._rtype]
+
+    @rtype.setter
+    def rtype(self, value):
+        self._rtype = const.get_code(const.RECORD_TYPES, value)
+
+    @property
+    def rclass(self):
+        return CLASS_LABELS[self._rclass]
+
+    @rclass.setter
+    def rclass(self, value):
+        self._rclass = const.get_code(const.RECORD_CLASSES, value)
+
+    @property
+    def rtypecode(self):
+        return self._rtype
+
+    @property
+    def rclasscode(self):
+        return self._rclass
+
+    def unpack_from(self, view, offset=0):
+        '''
+        Like Record.unpack_from(), but addresses are kept as they come,
+        without a round trip through text.
+        '''
+        offset, self.domain_name = wire.read_domain(view, offset)
+        (
+            self._rtype,
+            self._rclass,
+            self.rttl,
+            rdata_len
+        ) = wire.RR.unpack_from(view, offset)
+        offset += 10
+        end = offset + rdata_len
+        if end > len(view):
+            raise ValueError('Truncated rdata')
+        if self.packtype in ('IPv4', 'IPv6'):
+            self._rdata = None
+            self.rdata_packed = view[offset:end].tobytes()
+        else:
+            self.rdata = self.unpack_rdata_from(view, offset, rdata_len)
+        return end
@@ -37,7 +37,7 @@ class Request(Packet):
         '''
         Create a response packet based on this request.
         '''
-        return Response(
+        resp = Response(
             self.qid,
             self.question,
             self.qtype,
@@ -45,6 +45,8 @@ class Request(Packet):
             code,
             records
         )
+        resp.flag_rd = self.flag_rd
+        return resp
 
     def __repr__(self):
         return "<request question=%s qtype=%s qclass=%s>" % (
@@ -53,6 +55,18 @@ class Request(Packet):
             self.qclass
         )
 
+    def unpack_body_from(self, view, offset):
+        '''
+        Queries only need their question parsed, plus the OPT record if
+        the client uses EDNS0. Nothing else is read, so the cost of parsing
+        doesn't depend on what clients append.
+        '''
+        if self.qdcount != 1 or self.ancount or self.nscount:
+            raise DnsError('FORMERR', "Invalid query counts")
+        offset = self.unpack_question_from(view, offset)
+        if self.arcount:
+            self.unpack_edns_from(view, offset, self.arcount)
+
     def unpack(self, packet):
         '''
         Regular packet serialization, but with some extra validation.
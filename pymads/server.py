@@ -19,13 +19,19 @@ along with Pymads.  If not, see <http://www.gnu.org/licenses/>
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import errno
+import select
 import socket
 import sys
 import logging
+import threading
 
-from pymads.consumer import Consumer
+from pymads.consumer import Consumer, ConsumerPool
 from pymads.errors import ErrorConverter
-from pymads.extern import queue
+from pymads.extern import queue, monotonic
+from pymads.packet import UDP_MAX_SIZE
+from pymads.wirecache import WireCache
+from pymads.tcp import TcpListener
 
 DEFAULT_CONFIG = {
     'listen_host' : '0.0.0.0',
@@ -34,6 +40,15 @@ DEFAULT_CONFIG = {
     'log' : 'WARN',
     'queue_class' : queue.Queue,
     'own_consumer': True, # Set to False for multithread/extern consumer
+    'batch_io'    : False, # Drain many datagrams per wakeup
+    'batch_size'  : 64,
+    'reuse_port'  : False, # Let several processes bind the same address
+    'consumers'   : 0, # Size of the managed Consumer thread pool
+    'wire_cache'  : 0, # Max packed answers to cache, 0 to disable
+    'tcp'         : False, # Also answer over TCP, on the same port
+    'tcp_idle_timeout'    : 10, # Seconds before closing quiet connections
+    'tcp_max_connections' : 128,
+    'edns_max_udp' : 1232, # Largest EDNS0 UDP answer we'll send
 }
 
 class DnsServer(object):
@@ -52,10 +67,18 @@ class DnsServer(object):
         self.logger  = logging.getLogger('server')
         self.logger.setLevel(self.log)
         self.serving = True
+        self.queries = 0 # Datagrams received, for throughput reporting
         self.socket  = None
         self.guard   = ErrorConverter(['SERVFAIL'])
         self.queue   = self.config['queue_class']()
         self._default_consumer = Consumer(self)
+        self.pool    = None
+        self.tcp     = None
+        self.wire_cache = None
+        self.loop_done  = None # Set once serve() returns
+        if self.config['wire_cache']:
+            self.wire_cache = WireCache(self.config['wire_cache'])
+        self._last_check = 0
 
     def __repr__(self):
         return '<pymads dns serving on %s:%d>' % (
@@ -114,41 +137,204 @@ class DnsServer(object):
         Bind socket (allows privelege dropping between bind and service).
         """
         if not self.socket:
-            if isinstance(self.listen_host, tuple):
-                host, flow, scope = self.listen_host
-                self.socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-                self.socket.bind((host, self.listen_port, flow, scope))
-            else:
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                self.socket.bind((self.listen_host, self.listen_port))
+            family, address = self.address
+            self.socket = socket.socket(family, socket.SOCK_DGRAM)
+            if self.config['reuse_port']:
+                self.socket.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_REUSEPORT, 1
+                )
+            self.socket.bind(address)
             self.socket.settimeout(1)
+        if self.config['tcp'] and not self.tcp:
+            self.tcp = TcpListener(self)
+            self.tcp.bind()
+
+    @property
+    def address(self):
+        """
+        Socket family and address to bind, as a tuple.
+        """
+        if isinstance(self.listen_host, tuple):
+            host, flow, scope = self.listen_host
+            return socket.AF_INET6, (host, self.listen_port, flow, scope)
+        else:
+            return socket.AF_INET, (self.listen_host, self.listen_port)
 
     def serve(self):
         """
         Serves forever. Or at least until you call server.stop().
         """
 
+        self.loop_done = threading.Event()
         self.bind()
+        self.start_consumers()
+        if self.tcp:
+            self.tcp.start()
+        try:
+            if self.config['batch_io']:
+                self.serve_batched()
+            else:
+                self.serve_simple()
+        finally:
+            self.loop_done.set()
+
+    def serve_simple(self):
+        """
+        Receive one datagram at a time, with a blocking recvfrom.
+        """
         udps = self.socket
         while self.serving:
+            self.check_consumers()
             try:
-                # max UDP DNS pkt size = 512
-                req_pkt, src_addr = udps.recvfrom(512)
+                req_pkt, src_addr = udps.recvfrom(self.recv_size)
             except socket.error:
                 continue
 
+            self.queries += 1
             self.queue.put((req_pkt, src_addr))
-            if self.config['own_consumer']:
+            if self.consume_inline:
                 self._default_consumer.consume()
 
+    def serve_batched(self):
+        """
+        Like serve(), but uses a non-blocking socket, and handles every
+        datagram that is waiting each time the socket wakes us up.
+
+        With own_consumer, answers skip the queue entirely and are flushed
+        together once the whole batch has been processed.
+        """
+        udps = self.socket
+        udps.setblocking(False)
+        consumer = self._default_consumer
+        while self.serving:
+            self.check_consumers()
+            try:
+                readable = select.select([udps], [], [], 1)[0]
+            except (select.error, socket.error, ValueError):
+                # Socket closed underneath us by stop()
+                continue
+            if not readable:
+                continue
+
+            batch = self.recv_batch()
+            self.queries += len(batch)
+            if self.consume_inline:
+                self.send_batch(
+                    (consumer.process(req_pkt), src_addr)
+                    for (req_pkt, src_addr) in batch
+                )
+            else:
+                for item in batch:
+                    self.queue.put(item)
+
+    def recv_batch(self):
+        """
+        Read datagrams until the socket would block, or batch_size is hit.
+
+        Returns a list of (packet, address) tuples.
+        """
+        batch = []
+        limit = self.config['batch_size']
+        while len(batch) < limit:
+            try:
+                batch.append(self.socket.recvfrom(self.recv_size))
+            except socket.error as exc:
+                if exc.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self.logger.debug('recvfrom failed: %r' % exc)
+                break
+        return batch
+
+    def send_batch(self, replies):
+        """
+        Send an iterable of (data, address) tuples.
+        """
+        for data, addr in replies:
+            self.send(data, addr)
+
+    def send(self, data, addr):
+        """
+        Send a response datagram.
+
+        If the socket is non-blocking and its buffer is full, wait up to
+        a second for room. After that, the answer is dropped - the client
+        will retry, which is the normal UDP failure mode anyway.
+        """
+        try:
+            return self.socket.sendto(data, addr)
+        except socket.error as exc:
+            if exc.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+        select.select([], [self.socket], [], 1)
+        try:
+            return self.socket.sendto(data, addr)
+        except socket.error as exc:
+            if exc.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+            self.logger.debug('Dropped answer to %r: %r' % (addr, exc))
+
+    @property
+    def recv_size(self):
+        '''
+        Size of the buffer we receive datagrams into. Room for EDNS0
+        queries, but never less than the classic 512 bytes.
+        '''
+        return max(UDP_MAX_SIZE, self.config['edns_max_udp'])
+
+    @property
+    def consume_inline(self):
+        '''
+        Whether the serve loop answers queries itself.
+        '''
+        return self.config['own_consumer'] and not self.pool
+
+    def start_consumers(self):
+        '''
+        Start the managed consumer threads, if configured.
+        '''
+        if self.config['consumers'] and not self.pool:
+            self.pool = ConsumerPool(self, self.config['consumers'])
+            self.pool.start()
+
+    def check_consumers(self):
+        '''
+        Restart dead consumer threads. Runs at most once a second.
+        '''
+        now = monotonic()
+        if self.pool and now - self._last_check >= 1:
+            self._last_check = now
+            self.pool.check()
+
+    def stats(self):
+        '''
+        Counters for monitoring and sizing the server.
+        '''
+        return {
+            'queries'     : self.queries,
+            'queue_depth' : self.queue.qsize(),
+            'restarts'    : self.pool.restarts if self.pool else 0,
+            'consumers'   : self.pool.stats() if self.pool else [],
+            'wire_cache'  : self.wire_cache.stats() if self.wire_cache else {},
+        }
+
     def stop(self):
         '''
         Stop a running server.
+
+        The socket is closed first, and the serve loop given time to exit,
+        so nothing is queued after the pool throws the leftovers away.
+        Without a pool, wait for whoever consumes the queue to empty it.
         '''
         self.serving = False
-        if hasattr(self, 'socket'):
+        if self.tcp:
+            self.tcp.stop()
+        if self.socket:
             self.socket.close()
-        self.queue.join()
+        if self.loop_done is not None:
+            self.loop_done.wait(2)
+        if self.pool:
+            self.pool.stop()
+        else:
+            self.queue.join()
 
 def die(msg):
     """
@@ -162,10 +348,34 @@ def serve_standalone(*args):
     usage: server.py [options] <source_path>
 
     Source path should be the location of a JSON file, or '-' for STDIN.
+    With --format compiled, it's a file made by pymads.sources.compiled,
+    and with --format zone, a BIND-style master file.
 
     options:
         -P, --listen-port PORT   Port to listen on         [default: 53]
         -H, --listen-host HOST   Host address to listen on [default: 0.0.0.0]
+        -w, --workers N          Worker processes, sharing the port via
+                                 SO_REUSEPORT              [default: 1]
+        --preload                Load the source once, before forking the
+                                 workers, and compile it into a flat image
+                                 they all share
+        --report SECONDS         Seconds between per-worker qps and
+                                 memory reports, 0 for none [default: 10]
+        -c, --consumers N        Consumer threads per process; 0 answers
+                                 in the receive loop       [default: 0]
+        --wire-cache N           Packed answers to cache, 0 for no cache
+                                                           [default: 0]
+        -t, --tcp                Also answer over TCP
+        --compact                Keep records as CompactRecord, which
+                                 takes less memory for big zones
+        -f, --format FORMAT      One of 'json', 'zone' or 'compiled'
+                                                      [default: json]
+        --origin NAME            Origin for relative names in zone files
+        --watch SECONDS          Reload the source file when it changes,
+                                 checking this often; 0 to never reload
+                                                      [default: 0]
+        -e, --engine ENGINE      Either 'socket' (recvfrom loop and queue)
+                                 or 'asyncio'         [default: socket]
 
         -v --verbose             Verbose output
         -d, --log LEVEL          Logging level [default: WARN]
@@ -176,6 +386,7 @@ def serve_standalone(*args):
 
     from pymads.chain import Chain
     from pymads.sources.json import JSONSource
+    from pymads.record import Record, CompactRecord
 
     options = docopt(serve_standalone.__doc__, argv=list(args), version='0.1.0')
 
@@ -183,19 +394,83 @@ def serve_standalone(*args):
     config['listen_port'] = int(options['--listen-port'])
     config['listen_host'] = options['--listen-host']
     config['log']         = options['--log']
-
-    path   = options['<source_path>']
-    if path == '-':
-        source_file = sys.stdin
+    config['consumers']   = int(options['--consumers'])
+    config['wire_cache']  = int(options['--wire-cache'])
+    config['tcp']         = options['--tcp']
+
+    path    = options['<source_path>']
+    workers = int(options['--workers'])
+    record_class = CompactRecord if options['--compact'] else Record
+    if options['--engine'] == 'asyncio':
+        if config['consumers']:
+            die("The asyncio engine has no consumer threads.\n")
+        from pymads.aio import AsyncDnsServer as server_class
+    elif options['--engine'] == 'socket':
+        server_class = DnsServer
     else:
-        source_file = open(path)
-
-    source = JSONSource(source_file)
-    chain  = Chain([source])
-    config['chains'] = [chain]
-
-    server = DnsServer(**config)
-    server.serve()
+        die("Unknown engine %r\n" % options['--engine'])
+    if path == '-' and workers > 1:
+        die("Can't share STDIN between workers, use a file instead.\n")
+    watch = float(options['--watch'])
+    if path == '-' and options['--format'] != 'json':
+        die("Only JSON can be read from STDIN.\n")
+    if path == '-' and watch:
+        die("Can't watch STDIN for changes, use a file instead.\n")
+    if options['--format'] not in ('json', 'zone', 'compiled'):
+        die("Unknown format %r\n" % options['--format'])
+    if options['--preload'] and watch and options['--format'] != 'compiled':
+        die("Preloaded sources can't be watched, compile them instead.\n")
+
+    # Loading a big zone takes a while, so always show its progress
+    logging.basicConfig()
+    level = logging.getLevelName(config['log'].upper())
+    if not isinstance(level, int):
+        die("Unknown log level %r\n" % config['log'])
+    logging.getLogger('loader').setLevel(min(level, logging.INFO))
+
+    def make_source():
+        if options['--format'] == 'compiled':
+            from pymads.sources.compiled import CompiledSource
+            source = CompiledSource(path)
+        elif options['--format'] == 'zone':
+            from pymads.sources.zone import ZoneFileSource
+            source = ZoneFileSource(path, options['--origin'], record_class)
+        elif path == '-':
+            source = JSONSource(sys.stdin, record_class)
+        else:
+            source = JSONSource(path, record_class)
+        return source
+
+    def preload():
+        # Dicts of record objects get their pages copied into every
+        # worker as lookups touch refcounts, so share one flat image.
+        from pymads.sources.compiled import CompiledSource, compile_data
+        source = make_source()
+        if isinstance(source, CompiledSource):
+            return source
+        return CompiledSource.from_buffer(compile_data(source.data))
+
+    def make_server(source=None):
+        if source is None:
+            source = make_source()
+        if watch:
+            # Per process, since threads don't survive a fork
+            source.watch(watch)
+        chain  = Chain([source])
+        config['chains'] = [chain]
+        return server_class(**config)
+
+    if workers > 1:
+        from pymads.workers import Supervisor
+
+        factory = make_server
+        if options['--preload']:
+            shared = preload()
+            factory = lambda: make_server(shared)
+        Supervisor(factory, workers, float(options['--report']),
+            log=config['log']).run()
+    else:
+        make_server().serve()
 
 if __name__ == '__main__':
     serve_standalone(*sys.argv[1:])
@@ -0,0 +1,280 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import sys
+import mmap
+import zlib
+import struct
+
+from pymads import const
+from pymads.record import CompactRecord
+from pymads.sources.source import Source
+from pymads.wire import Builder
+
+ANY   = const.RECORD_TYPES['ANY']
+CNAME = const.RECORD_TYPES['CNAME']
+
+# File layout, all big-endian:
+#
+#   HEADER   magic, bucket count B, name count N
+#   BUCKETS  B+1 entry indexes; bucket b holds entries [b] to [b+1]
+#   ENTRIES  N (name hash, block offset) pairs, grouped by bucket
+#   blocks   one per name: name length and bytes, RRset count, then per
+#            RRset its type, record count, byte length and the records
+#            as uncompressed wire-format RRs.
+MAGIC   = b'PYMADSZ1'
+HEADER  = struct.Struct('!8sII')
+BUCKET  = struct.Struct('!I')
+ENTRY   = struct.Struct('!II')
+NAME    = struct.Struct('!B')
+COUNT   = struct.Struct('!H')
+RRSET   = struct.Struct('!HHI')
+
+def name_key(name):
+    '''
+    Lookup key for a domain name: lowercase, no trailing dot, as bytes.
+    '''
+    return name.lower().rstrip('.').encode('utf-8')
+
+def name_hash(key):
+    return zlib.crc32(key) & 0xffffffff
+
+def encode_block(key, records):
+    '''
+    Binary block for one name, with its records grouped into RRsets.
+    '''
+    rrsets = {}
+    for record in records:
+        rrsets.setdefault(record.rtypecode, []).append(record)
+
+    parts = [NAME.pack(len(key)), key, COUNT.pack(len(rrsets))]
+    for rtype, rrset in rrsets.items():
+        builder = Builder(compress=False)
+        for record in rrset:
+            record.pack_into(builder)
+        data = builder.getvalue()
+        parts.append(RRSET.pack(rtype, len(rrset), len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+def encode_zone(data):
+    '''
+    Encode a dict of {name: [records]}, as DictSource takes, in the
+    compiled format. Returns the number of names and a list of byte
+    strings that make up the image when concatenated.
+    '''
+    blocks = []
+    entries = []
+    offset = 0
+    for name, records in data.items():
+        key = name_key(name)
+        block = encode_block(key, records)
+        entries.append((name_hash(key), offset))
+        blocks.append(block)
+        offset += len(block)
+
+    bucket_count = max(1, len(entries))
+    entries.sort(key=lambda entry: entry[0] % bucket_count)
+    starts = [0] * (bucket_count + 1)
+    for entry_hash, _ in entries:
+        starts[entry_hash % bucket_count + 1] += 1
+    for bucket in range(bucket_count):
+        starts[bucket + 1] += starts[bucket]
+
+    base = HEADER.size + BUCKET.size * len(starts) + ENTRY.size * len(entries)
+    chunks = [
+        HEADER.pack(MAGIC, bucket_count, len(entries)),
+        b''.join(BUCKET.pack(start) for start in starts),
+        b''.join(
+            ENTRY.pack(entry_hash, base + block_offset)
+            for entry_hash, block_offset in entries
+        ),
+    ]
+    return len(entries), chunks + blocks
+
+def compile_zone(data, path):
+    '''
+    Write a dict of {name: [records]}, as DictSource takes, to path in
+    the compiled format. The file is replaced atomically, so sources
+    reading the old one are never exposed to a partial file.
+    '''
+    count, chunks = encode_zone(data)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as output:
+        for chunk in chunks:
+            output.write(chunk)
+    os.rename(tmp_path, path)
+    return count
+
+def compile_data(data):
+    '''
+    Compile a dict of {name: [records]} into a single bytes object,
+    for CompiledSource.from_buffer.
+    '''
+    return b''.join(encode_zone(data)[1])
+
+class CompiledSource(Source):
+    '''
+    Serves a zone compiled with compile_zone, straight from a read-only
+    memory map of the file.
+
+    Opening costs next to nothing whatever the size of the zone, only the
+    RRsets that are asked for get decoded (into CompactRecords), and
+    worker processes mapping the same file share its page cache.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.view = self.open(path)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        '''
+        Serve a compiled image held in memory, such as the result of
+        compile_data. The image is one flat object, so lookups only read
+        from it; forked workers can share it without copying pages.
+        '''
+        source = cls.__new__(cls)
+        source.path = None
+        source.view = cls.check(memoryview(buffer), '<buffer>')
+        return source
+
+    @classmethod
+    def open(cls, path):
+        '''
+        Map a compiled zone file, and check that it is one.
+        '''
+        with open(path, 'rb') as source_file:
+            mapped = mmap.mmap(source_file.fileno(), 0,
+                access=mmap.ACCESS_READ)
+        return cls.check(memoryview(mapped), path)
+
+    @staticmethod
+    def check(view, path):
+        if len(view) < HEADER.size or \
+                HEADER.unpack_from(view)[0] != MAGIC:
+            raise ValueError("%s is not a compiled zone file" % path)
+        return view
+
+    def load(self, path=None):
+        '''
+        Switch to a new file (or reopen the current one, after it was
+        recompiled), and notify subscribers.
+        '''
+        self.path = path or self.path
+        self.view = self.open(self.path)
+        self.changed()
+
+    reload = load
+
+    def find(self, name):
+        '''
+        Offset of the RRsets for name, or None if it's not in the zone.
+        '''
+        view = self.view
+        magic, bucket_count, count = HEADER.unpack_from(view)
+        key = name_key(name)
+        wanted = name_hash(key)
+        bucket = HEADER.size + BUCKET.size * (wanted % bucket_count)
+        start, = BUCKET.unpack_from(view, bucket)
+        end,   = BUCKET.unpack_from(view, bucket + BUCKET.size)
+
+        entries = HEADER.size + BUCKET.size * (bucket_count + 1)
+        for index in range(start, end):
+            entry_hash, offset = ENTRY.unpack_from(
+                view, entries + ENTRY.size * index
+            )
+            if entry_hash != wanted:
+                continue
+            length, = NAME.unpack_from(view, offset)
+            offset += NAME.size
+            if view[offset:offset+length] == key:
+                return offset + length
+        return None
+
+    def rrsets(self, offset):
+        '''
+        Generate (type, record count, offset) for each RRset in a block.
+        '''
+        view = self.view
+        count, = COUNT.unpack_from(view, offset)
+        offset += COUNT.size
+        for _ in range(count):
+            rtype, number, length = RRSET.unpack_from(view, offset)
+            offset += RRSET.size
+            yield rtype, number, offset
+            offset += length
+
+    def decode(self, number, offset):
+        records = []
+        for _ in range(number):
+            record, offset = CompactRecord.from_wire(self.view, offset)
+            records.append(record)
+        return records
+
+    def get(self, request):
+        offset = self.find(request.name)
+        if offset is None:
+            return []
+        qtype = request.qtype
+        records = []
+        cname = None
+        for rtype, number, rrset in self.rrsets(offset):
+            if qtype == ANY:
+                records.extend(self.decode(number, rrset))
+            elif rtype == qtype:
+                return self.decode(number, rrset)
+            elif rtype == CNAME:
+                cname = (number, rrset)
+        if not records and cname:
+            return self.decode(*cname)
+        return records
+
+    def owns(self, request):
+        return self.find(request.name) is not None
+
+def compile_standalone(*args):
+    '''
+    usage: compiled.py [options] <source_path> <output_path>
+
+    Compile a JSON zone (as read by JSONSource) or a BIND-style master
+    file into a file that CompiledSource can serve.
+
+    options:
+        -f, --format FORMAT      Either 'json' or 'zone' [default: json]
+        --origin NAME            Origin for relative names in zone files
+        -h --help                Show help
+    '''
+    from docopt import docopt
+
+    from pymads.sources.json import JSONSource
+    from pymads.sources.zone import ZoneFileSource
+
+    options = docopt(compile_standalone.__doc__, argv=list(args))
+    if options['--format'] == 'zone':
+        source = ZoneFileSource(options['<source_path>'], options['--origin'],
+            CompactRecord)
+    else:
+        source = JSONSource(options['<source_path>'], CompactRecord)
+    count = compile_zone(source.data, options['<output_path>'])
+    print('Compiled %d names into %s' % (count, options['<output_path>']))
+
+if __name__ == '__main__':
+    compile_standalone(*sys.argv[1:])
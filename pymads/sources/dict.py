@@ -15,8 +15,12 @@ You should have received a copy of the GNU Lesser General Public License
 along with Pymads.  If not, see <http://www.gnu.org/licenses/>
 '''
 
+from pymads import const
 from pymads.sources.source import Source
 
+ANY   = const.RECORD_TYPES['ANY']
+CNAME = const.RECORD_TYPES['CNAME']
+
 class DictSource(Source):
     '''
     Simplest source. All data in memory, in the form of a dict.
@@ -31,9 +35,77 @@ class DictSource(Source):
                 <pymads.record.Record>,
             ]
         }
+
+    The records are indexed by (name, type code) whenever the data is set,
+    so a query only gets the RRset it asked for. ANY queries get every
+    record for the name, and a CNAME answers queries for any other type.
+
+    The data and its index are swapped in together, as one attribute, so
+    readers on other threads never see one without the other.
     '''
     def __init__(self, data = {}):
         self.data = dict(data)
 
+    @property
+    def data(self):
+        '''
+        The dict of records this source serves.
+        '''
+        return self.state[0]
+
+    @data.setter
+    def data(self, value):
+        '''
+        Replace the data, and rebuild the index for it.
+        '''
+        self.state = (value, self.build_index(value))
+
+    @property
+    def index(self):
+        '''
+        RRsets keyed by (name, type code), see build_index.
+        '''
+        return self.state[1]
+
+    @staticmethod
+    def build_index(data):
+        '''
+        Group each name's records into RRsets, keyed by (name, type code).
+        '''
+        index = {}
+        for name, records in data.items():
+            for record in records:
+                index.setdefault((name, record.rtypecode), []).append(record)
+        return index
+
+    @staticmethod
+    def diff(old, new):
+        '''
+        Set of names whose records differ between two data dicts.
+        '''
+        return set(
+            name for name in set(old) | set(new)
+            if old.get(name) != new.get(name)
+        )
+
+    def load(self, data):
+        '''
+        Replace all data in the source, and notify subscribers of the
+        names that changed.
+        '''
+        old = self.data
+        self.data = dict(data)
+        names = self.diff(old, self.data)
+        if names:
+            self.changed(names)
+
     def get(self, request):
-        return self.data.get(request.name, [])
+        data, index = self.state
+        name = request.name
+        if request.qtype == ANY:
+            return data.get(name, [])
+        return index.get((name, request.qtype)) \
+            or index.get((name, CNAME), [])
+
+    def owns(self, request):
+        return request.name in self.data
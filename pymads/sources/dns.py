@@ -16,16 +16,21 @@ along with Pymads.  If not, see <http://www.gnu.org/licenses/>
 '''
 
 import socket
-from persei import RawData
 from pymads.request import Request
 from pymads.response import Response
 from pymads.sources.source import Source
+from pymads.errors import NegativeAnswer
+from pymads.packet import NXDOMAIN
 
 class DnsSource(Source):
     '''
     Used for recursive resolution. Pulls data from external DNS server.
+
+    Only the host of the local address is used: every exchange gets its
+    own socket on an ephemeral port, so any number can run at once, from
+    consumer threads and cache refreshes alike.
     '''
-    def __init__(self, local =('0.0.0.0', 9822),
+    def __init__(self, local =('0.0.0.0', 0),
                        remote=('8.8.8.8', 53),
                        retries = 5):
 
@@ -35,17 +40,17 @@ class DnsSource(Source):
         self.retries = retries
 
     def make_socket(self):
-        if '.' in self.local_addr[0]:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        '''
+        A new UDP socket for one exchange, bound to an ephemeral port.
+        '''
+        host = self.local_addr[0]
+        if '.' in host:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         else:
-            self.socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-        self.socket.bind(self.local_addr)
-        self.socket.settimeout(1)
-
-    def close_socket(self):
-        if hasattr(self, 'socket'):
-            self.socket.close()
-            self.socket = None
+            sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        sock.bind((host, 0))
+        sock.settimeout(1)
+        return sock
 
     def exchange(self, request):
         '''
@@ -61,31 +66,52 @@ class DnsSource(Source):
 
     def _exchange_data(self, req_pkt):
         '''
-        Takes a RawData request, returns RawData response from server.
+        Takes a request packet, returns the response packet from server.
         '''
         tries = 0
-        self.make_socket()
+        sock = self.make_socket()
         try:
             while tries < 1 + self.retries:
-                self.socket.sendto(req_pkt.export(), self.remote_addr)
+                sock.sendto(req_pkt, self.remote_addr)
                 try:
-                    return RawData(self.socket.recv(512))
+                    return sock.recv(512)
                 except socket.timeout:
                     tries += 1
         finally:
-            self.close_socket()
+            sock.close()
 
         raise Exception('External resolution timed out')
 
     def get(self, req_in):
         req_out = self._make_request(req_in.name, req_in.qtype, req_in.qclass)
 
-        resp = self.exchange(req_out)
-        if resp.flag_rcode != 0:
+        return self.records_from(self.exchange(req_out))
+
+    def records_from(self, resp):
+        '''
+        Extract the records from an upstream Response, or fail.
+
+        NXDOMAIN and empty answers (NODATA) raise NegativeAnswer, with
+        the SOA from the authority section, so they can be relayed and
+        cached as such. Referrals (NS records but no SOA) are returned.
+        '''
+        soa = self.soa_from(resp)
+        if resp.flag_rcode == NXDOMAIN:
+            raise NegativeAnswer('NXDOMAIN', soa)
+        elif resp.flag_rcode != 0:
             raise Exception("Query failed with code %d" % resp.flag_rcode)
+        elif not resp.an_records and (soa or not resp.ns_records):
+            raise NegativeAnswer('NOERROR', soa)
         else:
             return list(resp.records)
 
+    @staticmethod
+    def soa_from(resp):
+        for record in resp.ns_records:
+            if record.rtype == 'SOA':
+                return record
+        return None
+
     def _make_request(self, domain, qtype=None, qclass=None):
         '''
         Create a Request object for exchange based on a given domain.
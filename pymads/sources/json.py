@@ -17,7 +17,10 @@ along with Pymads.  If not, see <http://www.gnu.org/licenses/>
 
 from __future__ import absolute_import
 
+import os
+import re
 import json
+import logging
 
 from pymads.record import Record
 from pymads.sources.dict import DictSource
@@ -27,6 +30,10 @@ try:
 except:
     basestring = str
 
+CHUNK_SIZE = 1 << 20 # Characters read from the file at a time
+PROGRESS_INTERVAL = 64 << 20 # Report progress every this many characters
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
 class JSONSource(DictSource):
     '''
     Subclass of DictSource, pulls data from JSON file.
@@ -48,24 +55,48 @@ class JSONSource(DictSource):
                 }
             ]
         }
+
+    Files are read as a stream, one domain at a time (see
+    streamRecordDict), so a big zone never exists as a parsed JSON tree
+    and a dict of Records at the same time. Pass a progress callback to
+    follow along; by default, progress is logged to the 'loader' logger.
+
+    Sources read from a path can be reloaded, or watch()ed for changes.
+    The new records are built on the side and swapped in at once.
     '''
-    def __init__(self, source):
+    def __init__(self, source, record_class=Record, progress=None):
+        self.path = None
+        self.record_class = record_class
+        self.progress = progress
         if isinstance(source, basestring):
             # Source is a path
-            jsonfile = open(source)
-            data = json.load(jsonfile)
+            self.path = source
+            with open(source) as jsonfile:
+                data = streamRecordDict(jsonfile, record_class, progress)
         elif hasattr(source, 'read'):
             # Source is a file-like object
-            data = json.load(source)
+            data = streamRecordDict(source, record_class, progress)
         elif isinstance(source, dict):
             # Source is a dict
-            data = source
+            data = toRecordDict(source, record_class)
+
+        DictSource.__init__(self, data)
 
-        DictSource.__init__(self, toRecordDict(data))
+    def reload(self):
+        '''
+        Read the file again, and swap in its records.
+        '''
+        if self.path is None:
+            raise ValueError("JSONSource wasn't loaded from a path")
+        with open(self.path) as jsonfile:
+            data = streamRecordDict(jsonfile, self.record_class, self.progress)
+        self.load(data)
 
-def toRecordDict(data):
+def toRecordDict(data, record_class=Record):
     '''
     Turn a JSON dict source dict into a dict of Records.
+
+    Pass record_class=pymads.record.CompactRecord for big zones.
     '''
     if not isinstance(data, dict):
         raise TypeError("JSONSource expects top-level object to be a dict")
@@ -74,11 +105,139 @@ def toRecordDict(data):
         records = data[k]
         if not isinstance(records, list):
             raise TypeError("JSONSource expects each top-level value to be a list of records")
-        data[k] = [toRecord(r, k) for r in records]
+        data[k] = [toRecord(r, k, record_class) for r in records]
 
     return data
 
-def toRecord(record, fallback_domain):
+class EntryStream(object):
+    '''
+    Reads the top-level object of a JSON file one (key, value) pair at a
+    time, holding no more than a chunk or one value's text in memory.
+
+    for name, records in EntryStream(open('zone.json')): ...
+    '''
+    def __init__(self, source_file, chunk_size=CHUNK_SIZE):
+        self.file       = source_file
+        self.chunk_size = chunk_size
+        self.decoder    = json.JSONDecoder()
+        self.buffer     = ''
+        self.pos        = 0
+        self.eof        = False
+        self.read_size  = 0 # Characters read so far
+
+    def fill(self):
+        '''
+        Read another chunk, dropping what was already parsed. Returns
+        False at the end of the file.
+        '''
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.read_size += len(chunk)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        '''
+        Skip whitespace, and return the next character ('' at the end).
+        '''
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        '''
+        Consume one of the given punctuation characters, and return it.
+        '''
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("Expected %r at character %d, got %r" % (
+                chars, self.read_size - len(self.buffer) + self.pos, char
+            ))
+        self.pos += 1
+        return char
+
+    def decode(self):
+        '''
+        Decode the next JSON value, reading more of the file if the
+        buffer ends partway through it.
+        '''
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self.fill():
+                    raise
+                continue
+            self.pos = end
+            return value
+
+    def __iter__(self):
+        if self.peek() != '{':
+            raise TypeError("JSONSource expects top-level object to be a dict")
+        self.pos += 1
+        if self.peek() == '}':
+            self.pos += 1
+        else:
+            while True:
+                key = self.decode()
+                self.expect(':')
+                yield key, self.decode()
+                if self.expect(',}') == '}':
+                    break
+        if self.peek():
+            raise ValueError("Extra data after the top-level object")
+
+def streamRecordDict(source_file, record_class=Record, progress=None):
+    '''
+    Like toRecordDict(json.load(source_file)), but converts each domain
+    to records as soon as it's read.
+
+    progress(characters read, file size or None, domains loaded) is
+    called every PROGRESS_INTERVAL characters, and once at the end.
+    '''
+    if progress is None:
+        progress = logProgress
+    try:
+        total = os.fstat(source_file.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        total = None # Not a real file
+
+    stream = EntryStream(source_file)
+    data = {}
+    next_report = PROGRESS_INTERVAL
+    for name, records in stream:
+        if not isinstance(records, list):
+            raise TypeError("JSONSource expects each top-level value to be a list of records")
+        data[name] = [toRecord(r, name, record_class) for r in records]
+        if stream.read_size >= next_report:
+            progress(stream.read_size, total, len(data))
+            next_report += PROGRESS_INTERVAL
+    progress(stream.read_size, total, len(data))
+    return data
+
+def logProgress(read_size, total, count):
+    '''
+    Default progress callback for streamRecordDict.
+    '''
+    if total:
+        logging.getLogger('loader').info('Loaded %d domains, %d%% of %d MB' % (
+            count, 100 * read_size // total, total >> 20
+        ))
+    else:
+        logging.getLogger('loader').info('Loaded %d domains, %d MB' % (
+            count, read_size >> 20
+        ))
+
+def toRecord(record, fallback_domain, record_class=Record):
     '''
     Turn an individual record data dict into a Record object.
     '''
@@ -86,4 +245,4 @@ def toRecord(record, fallback_domain):
         raise TypeError("JSONSource expects each top-level value to be a list of record dicts")
     if not 'domain_name' in record:
         record['domain_name'] = fallback_domain
-    return Record(**record)
+    return record_class(**record)
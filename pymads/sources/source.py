@@ -36,3 +36,46 @@ class Source(object):
         request.name = domain
         return self.get(request)
 
+    def owns(self, request):
+        '''
+        Whether the requested name exists in this source, even if get()
+        has no records of the requested type. Lets the server answer
+        NODATA instead of NXDOMAIN.
+        '''
+        return False
+
+    def subscribe(self, callback):
+        '''
+        Register callback(names) to be called when this source's data
+        changes. names is a set of changed domain names, or None if
+        anything might have changed.
+        '''
+        if not hasattr(self, 'subscribers'):
+            self.subscribers = []
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        '''
+        Stop calling a callback registered with subscribe().
+        '''
+        if callback in getattr(self, 'subscribers', []):
+            self.subscribers.remove(callback)
+
+    def watch(self, interval=1.0):
+        '''
+        For sources backed by a file (self.path), call self.reload()
+        whenever the file changes. Returns the pymads.watch.FileWatcher,
+        which runs in a background thread until stopped.
+        '''
+        from pymads.watch import FileWatcher
+
+        self.watcher = FileWatcher(self.path, self.reload, interval)
+        self.watcher.start()
+        return self.watcher
+
+    def changed(self, names=None):
+        '''
+        Tell subscribers that data has changed.
+        '''
+        for callback in list(getattr(self, 'subscribers', [])):
+            callback(names)
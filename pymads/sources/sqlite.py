@@ -0,0 +1,175 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import absolute_import
+
+import sqlite3
+import threading
+
+from pymads import const
+from pymads.extern import monotonic
+from pymads.lru import LRU
+from pymads.record import Record, SOAType, TYPE_LABELS
+from pymads.sources.source import Source
+
+ANY = const.RECORD_TYPES['ANY']
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS records (
+        name  TEXT    NOT NULL,
+        type  TEXT    NOT NULL,
+        ttl   INTEGER NOT NULL,
+        rdata TEXT    NOT NULL
+    )''',
+    # Covers every lookup, so they never touch the table itself
+    '''CREATE INDEX IF NOT EXISTS records_lookup
+        ON records (name, type, ttl, rdata)''',
+]
+
+# Constant SQL, so sqlite3's per-connection statement cache keeps these
+# prepared for the life of each connection.
+SELECT_TYPE = '''SELECT type, ttl, rdata FROM records
+    WHERE name = ? AND type IN (?, 'CNAME')'''
+SELECT_ALL  = 'SELECT type, ttl, rdata FROM records WHERE name = ?'
+SELECT_NAME = 'SELECT 1 FROM records WHERE name = ? LIMIT 1'
+INSERT      = 'INSERT INTO records (name, type, ttl, rdata) VALUES (?, ?, ?, ?)'
+
+def parse_rdata(rtype, text):
+    '''
+    Turn rdata from the database into what Record takes. SOA rdata is
+    stored as its seven fields, separated by spaces.
+    '''
+    if rtype == 'SOA':
+        fields = text.split()
+        return SOAType(fields[0], fields[1], *[int(f) for f in fields[2:]])
+    return text
+
+def format_rdata(record):
+    '''
+    Inverse of parse_rdata.
+    '''
+    if record.rtype == 'SOA':
+        return ' '.join(str(field) for field in record.rdata)
+    return record.rdata
+
+def create_database(path, data=None):
+    '''
+    Create the records table and its index, and fill it from a dict of
+    {name: [records]}, as DictSource takes.
+    '''
+    connection = sqlite3.connect(path)
+    try:
+        for statement in SCHEMA:
+            connection.execute(statement)
+        if data:
+            connection.executemany(INSERT, (
+                (name, record.rtype, record.rttl, format_rdata(record))
+                for name, records in data.items()
+                for record in records
+            ))
+        connection.commit()
+    finally:
+        connection.close()
+
+class SQLiteSource(Source):
+    '''
+    Serves records from a SQLite database, see SCHEMA and create_database.
+
+    Other programs may update the database while we serve it; each lookup
+    sees the latest committed data (use WAL mode to keep writers from
+    blocking lookups). Every thread gets its own connection, so any number
+    of Consumer threads can share one source.
+
+    With cache_size, up to that many answers are kept in an LRU for
+    cache_ttl seconds, which bounds how stale they can get.
+    '''
+    def __init__(self, path, cache_size=0, cache_ttl=1.0,
+            record_class=Record):
+        self.path = path
+        self.record_class = record_class
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.cache = LRU(cache_size) if cache_size else None
+        self.cache_ttl = cache_ttl
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def connection(self):
+        '''
+        This thread's connection, opened on first use.
+        '''
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            # Only ever used by this thread, but close() may come from
+            # another one
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def query(self, request):
+        '''
+        Fetch (type, ttl, rdata) rows for a request.
+        '''
+        if request.qtype == ANY:
+            return self.connection.execute(
+                SELECT_ALL, (request.name,)
+            ).fetchall()
+        rtype = TYPE_LABELS.get(request.qtype)
+        rows = self.connection.execute(
+            SELECT_TYPE, (request.name, rtype)
+        ).fetchall()
+        # The CNAME only answers if there's nothing of the right type
+        exact = [row for row in rows if row[0] == rtype]
+        return exact or rows
+
+    def get(self, request):
+        key = None
+        if self.cache is not None:
+            key = (request.name, request.qtype)
+            entry = self.cache.get(key)
+            if entry is not None and monotonic() < entry[1]:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        name = request.name
+        records = [
+            self.record_class(name, parse_rdata(rtype, rdata), rtype, ttl)
+            for rtype, ttl, rdata in self.query(request)
+        ]
+        if key is not None:
+            self.cache.put(key, (records, monotonic() + self.cache_ttl))
+        return records
+
+    def owns(self, request):
+        return self.connection.execute(
+            SELECT_NAME, (request.name,)
+        ).fetchone() is not None
+
+    def close(self):
+        '''
+        Close every thread's connection.
+        '''
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        self.local = threading.local()
@@ -0,0 +1,161 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from pymads import const
+from pymads.sources.source import Source
+
+ANY   = const.RECORD_TYPES['ANY']
+CNAME = const.RECORD_TYPES['CNAME']
+WILDCARD = '*'
+
+class Node(object):
+    '''
+    One label in a TrieSource. Children and RRsets are only allocated
+    for nodes that have them, so large zones stay small.
+    '''
+    __slots__ = ('children', 'rrsets')
+
+    def __init__(self):
+        self.children = None # label -> Node
+        self.rrsets   = None # type code -> [Record]
+
+    def child(self, label):
+        if self.children is None:
+            return None
+        return self.children.get(label)
+
+    def add_child(self, label):
+        if self.children is None:
+            self.children = {}
+        node = self.children.get(label)
+        if node is None:
+            node = self.children[label] = Node()
+        return node
+
+    def add(self, record):
+        if self.rrsets is None:
+            self.rrsets = {}
+        self.rrsets.setdefault(record.rtypecode, []).append(record)
+
+    def get(self, qtype):
+        if self.rrsets is None:
+            return []
+        if qtype == ANY:
+            return [r for rrset in self.rrsets.values() for r in rrset]
+        return self.rrsets.get(qtype) or self.rrsets.get(CNAME, [])
+
+def split(name):
+    '''
+    Labels of a domain name, lowercased, from the root down.
+
+    'WWW.Example.com' -> ['com', 'example', 'www']
+    '''
+    labels = [label for label in name.lower().split('.') if label]
+    labels.reverse()
+    return labels
+
+class TrieSource(Source):
+    '''
+    In-memory source that stores names in a trie of labels, from the
+    root down, so every lookup costs one dict access per label.
+
+    Takes the same data format as DictSource, and also answers:
+
+     * wildcard names, like '*.svc.example.com', which match any name
+       below 'svc.example.com' that doesn't exist in its own right
+       (RFC 4592). Synthesized records carry the queried name.
+     * which names exist, including empty non-terminals such as
+       'svc.example.com' above, so the server can tell NODATA from
+       NXDOMAIN.
+
+    Names are matched case-insensitively.
+    '''
+    def __init__(self, data = {}):
+        self.root = self.build(data)
+
+    @staticmethod
+    def build(data):
+        '''
+        Build a trie from a dict of {name: [records]}.
+        '''
+        root = Node()
+        for name, records in data.items():
+            node = root
+            for label in split(name):
+                node = node.add_child(label)
+            for record in records:
+                node.add(record)
+        return root
+
+    def load(self, data):
+        '''
+        Replace all data in the source, and notify subscribers.
+        '''
+        self.root = self.build(data)
+        self.changed()
+
+    def find(self, name):
+        '''
+        Walk the trie towards name. Returns (node, depth, labels), where
+        node is the closest encloser, depth the number of labels it
+        matched, and labels those of name. The name exists exactly when
+        depth equals len(labels).
+        '''
+        labels = split(name)
+        node = self.root
+        depth = 0
+        for label in labels:
+            child = node.child(label)
+            if child is None:
+                break
+            node = child
+            depth += 1
+        return node, depth, labels
+
+    def closest_encloser(self, name):
+        '''
+        Longest existing ancestor of name (or name itself), as a string.
+        '''
+        node, depth, labels = self.find(name)
+        return '.'.join(reversed(labels[:depth]))
+
+    def lookup(self, name):
+        '''
+        Node that answers for name: its own node, a matching wildcard,
+        or None if the name doesn't exist. Also returns whether the
+        match was a wildcard.
+        '''
+        node, depth, labels = self.find(name)
+        if depth == len(labels):
+            return node, False
+        wildcard = node.child(WILDCARD)
+        if wildcard is not None:
+            return wildcard, True
+        return None, False
+
+    def get(self, request):
+        node, synthesized = self.lookup(request.name)
+        if node is None:
+            return []
+        records = node.get(request.qtype)
+        if synthesized:
+            records = [r.copy(domain_name=request.name) for r in records]
+        return records
+
+    def owns(self, request):
+        node, synthesized = self.lookup(request.name)
+        return node is not None
@@ -0,0 +1,250 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import absolute_import
+
+import os
+import re
+import socket
+import logging
+
+from pymads import const
+from pymads.record import Record, SOAType
+from pymads.sources.dict import DictSource
+
+DEFAULT_TTL = 1800 # Same as Record's, for zones with no $TTL or TTLs
+SUPPORTED_TYPES = ('A', 'AAAA', 'NS', 'CNAME', 'SOA')
+DOMAIN_TYPES = ('NS', 'CNAME')
+
+TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[()]|;|[^\s()";]+')
+TTL_PART = re.compile(r'(\d+)([smhdw]?)', re.I)
+TTL_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+def parse_ttl(text):
+    '''
+    Parse a TTL, in seconds or with BIND-style units.
+
+    '3600' -> 3600, '1h30m' -> 5400
+    '''
+    total = 0
+    end = 0
+    for match in TTL_PART.finditer(text):
+        if match.start() != end:
+            break
+        total += int(match.group(1)) * TTL_UNITS[match.group(2).lower()]
+        end = match.end()
+    if end == 0 or end != len(text):
+        raise ValueError("Invalid TTL %r" % text)
+    return total
+
+def is_ttl(text):
+    return text[0].isdigit()
+
+class ZoneParser(object):
+    '''
+    Streaming parser for RFC 1035 master files.
+
+    Handles $ORIGIN, $TTL, $INCLUDE, comments, quoted strings, parentheses
+    continuing an entry over several lines, '@', relative names, and
+    omitted owners, TTLs and classes. Records of types that pymads can't
+    serve are skipped with a warning.
+
+    for record in ZoneParser('example.com').parse('example.com.zone'): ...
+    '''
+    def __init__(self, origin=None, record_class=Record):
+        self.origin       = origin and origin.rstrip('.').lower()
+        self.record_class = record_class
+        self.skipped      = 0 # Records of unsupported types
+        self.logger       = logging.getLogger('loader')
+
+    def parse(self, path, origin=None):
+        '''
+        Generate the records in a zone file, and the files it includes.
+        '''
+        state = {
+            'origin': self.origin if origin is None else origin,
+            'ttl'   : None, # From $TTL
+            'last_ttl': DEFAULT_TTL,
+            'owner' : None,
+            'rclass': 'IN',
+        }
+        with open(path) as zonefile:
+            for lineno, blank_owner, tokens in self.entries(zonefile, path):
+                where = '%s:%d' % (path, lineno)
+                try:
+                    if tokens[0].startswith('$'):
+                        for record in self.directive(path, state, tokens):
+                            yield record
+                        continue
+                    record = self.record(state, blank_owner, tokens)
+                except (ValueError, TypeError, IndexError, KeyError,
+                        socket.error) as exc:
+                    raise ValueError('%s: %s' % (where, exc))
+                if record is not None:
+                    yield record
+
+    def entries(self, lines, path):
+        '''
+        Split lines into entries, joining lines inside parentheses.
+        Generates (line number, owner omitted?, tokens).
+        '''
+        tokens = []
+        depth = 0
+        start = None
+        blank_owner = False
+        for lineno, line in enumerate(lines, 1):
+            if depth == 0:
+                start = lineno
+                blank_owner = line[:1] in (' ', '\t')
+            if depth == 0 and '"' not in line and ';' not in line \
+                    and '(' not in line and ')' not in line:
+                tokens = line.split() # Fast path for plain lines
+            else:
+                for token in TOKEN.findall(line):
+                    if token == ';':
+                        break
+                    elif token == '(':
+                        depth += 1
+                    elif token == ')':
+                        depth -= 1
+                        if depth < 0:
+                            raise ValueError('%s:%d: unbalanced )' % (
+                                path, lineno))
+                    else:
+                        tokens.append(token)
+            if depth == 0 and tokens:
+                yield start, blank_owner, tokens
+            if depth == 0:
+                tokens = []
+        if depth:
+            raise ValueError('%s:%d: unbalanced (' % (path, start))
+
+    def directive(self, path, state, tokens):
+        name = tokens[0].upper()
+        if name == '$ORIGIN':
+            state['origin'] = self.absolute(tokens[1], state['origin'])
+        elif name == '$TTL':
+            state['ttl'] = parse_ttl(tokens[1])
+        elif name == '$INCLUDE':
+            include = os.path.join(os.path.dirname(path), tokens[1])
+            origin = state['origin']
+            if len(tokens) > 2:
+                origin = self.absolute(tokens[2], origin)
+            for record in self.parse(include, origin):
+                yield record
+        else:
+            self.logger.warning('%s: skipping unsupported %s' % (path, name))
+
+    def absolute(self, name, origin):
+        '''
+        Turn a name from the zone file into a full name without the
+        trailing dot. Names are lowercased, to match how requests are
+        parsed off the wire.
+        '''
+        name = name.lower()
+        if name == '@':
+            if origin is None:
+                raise ValueError("'@' used with no $ORIGIN")
+            return origin
+        if name.endswith('.'):
+            return name[:-1]
+        if origin is None:
+            raise ValueError('Relative name %r with no $ORIGIN' % name)
+        if not origin:
+            return name
+        return name + '.' + origin
+
+    def record(self, state, blank_owner, tokens):
+        '''
+        Make a record from the tokens of one entry, or None to skip it.
+        '''
+        index = 0
+        if blank_owner:
+            owner = state['owner']
+            if owner is None:
+                raise ValueError('No owner name for the first record')
+        else:
+            owner = state['owner'] = self.absolute(tokens[0], state['origin'])
+            index = 1
+
+        ttl = None
+        rclass = state['rclass']
+        # TTL and class come in either order, and are both optional
+        for _ in range(2):
+            token = tokens[index]
+            if is_ttl(token):
+                ttl = parse_ttl(token)
+                index += 1
+            elif token.upper() in const.RECORD_CLASSES:
+                rclass = state['rclass'] = token.upper()
+                index += 1
+
+        rtype = tokens[index].upper()
+        rdata = tokens[index+1:]
+        if ttl is not None:
+            state['last_ttl'] = ttl
+        elif state['ttl'] is not None:
+            ttl = state['ttl']
+        else:
+            ttl = state['last_ttl']
+
+        if rtype not in SUPPORTED_TYPES:
+            self.skipped += 1
+            self.logger.warning('Skipping %s record for %s' % (rtype, owner))
+            return None
+        if rtype in DOMAIN_TYPES:
+            value = self.absolute(rdata[0], state['origin'])
+        elif rtype == 'SOA':
+            value = SOAType(
+                self.absolute(rdata[0], state['origin']),
+                self.absolute(rdata[1], state['origin']),
+                int(rdata[2]),
+                *[parse_ttl(field) for field in rdata[3:7]]
+            )
+        else:
+            value = rdata[0]
+        return self.record_class(owner, value, rtype, ttl, rclass)
+
+class ZoneFileSource(DictSource):
+    '''
+    Subclass of DictSource, pulls data from a BIND-style zone file.
+
+    origin is the zone's name, for relative names before any $ORIGIN.
+    The file is parsed as a stream, straight into records, and can be
+    reload()ed or watch()ed like a JSONSource.
+    '''
+    def __init__(self, path, origin=None, record_class=Record):
+        self.path = path
+        self.origin = origin
+        self.record_class = record_class
+        DictSource.__init__(self, self.read())
+
+    def read(self):
+        '''
+        Parse the zone file into a dict of records by name.
+        '''
+        data = {}
+        parser = ZoneParser(self.origin, self.record_class)
+        for record in parser.parse(self.path):
+            data.setdefault(record.domain_name, []).append(record)
+        return data
+
+    def reload(self):
+        '''
+        Parse the file again, and swap in its records.
+        '''
+        self.load(self.read())
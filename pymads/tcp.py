@@ -0,0 +1,255 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import absolute_import
+
+import errno
+import select
+import socket
+import struct
+import threading
+
+from pymads.extern import monotonic
+from pymads.packet import TCP_MAX_SIZE
+
+LENGTH = struct.Struct('!H')
+MAX_OUTPUT = 256 * 1024 # Unsent answer bytes before we give up on a client
+
+class TcpConnection(object):
+    '''
+    One client connection to a TcpListener.
+
+    Queries are framed with a two-byte length prefix (RFC 1035 section
+    4.2.2). Any number of them may arrive back to back, and each answer
+    is written as soon as it is ready, in whatever order that happens.
+
+    The socket is non-blocking. Whatever doesn't fit in the kernel's send
+    buffer waits in `out`, for the listener to flush when the socket is
+    writable. A client that lets more than MAX_OUTPUT bytes pile up is
+    disconnected, rather than holding up anyone else.
+    '''
+    max_size = TCP_MAX_SIZE
+
+    def __init__(self, sock, addr):
+        self.sock     = sock
+        self.addr     = addr
+        self.buf      = bytearray()
+        self.out      = bytearray()
+        self.lock     = threading.Lock()
+        self.pending  = 0
+        self.closed   = False
+        self.eof      = False # Client is done sending
+        self.last_active = monotonic()
+
+    def __repr__(self):
+        return '<pymads tcp connection from %r>' % (self.addr,)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def feed(self, data):
+        '''
+        Add received data. Returns a list of complete query packets.
+        '''
+        self.last_active = monotonic()
+        self.buf += data
+        packets = []
+        while len(self.buf) >= 2:
+            length, = LENGTH.unpack_from(self.buf)
+            if len(self.buf) < 2 + length:
+                break
+            packets.append(bytes(self.buf[2:2+length]))
+            del self.buf[:2+length]
+        with self.lock:
+            self.pending += len(packets)
+        return packets
+
+    def reply(self, data):
+        '''
+        Queue one framed answer, and send what we can without blocking.
+        Safe to call from any thread.
+        '''
+        with self.lock:
+            self.pending -= 1
+            if self.closed:
+                return
+            self.out += LENGTH.pack(len(data)) + data
+            self.flush_locked()
+
+    def flush(self):
+        '''
+        Send as much queued output as the socket takes right now.
+        '''
+        with self.lock:
+            if not self.closed:
+                self.flush_locked()
+
+    def flush_locked(self):
+        try:
+            while self.out:
+                sent = self.sock.send(self.out)
+                del self.out[:sent]
+                self.last_active = monotonic()
+        except socket.error as exc:
+            if getattr(exc, 'errno', None) not in \
+                    (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                self.close()
+                return
+        if len(self.out) > MAX_OUTPUT:
+            self.close()
+        elif self.eof and self.pending <= 0 and not self.out:
+            self.close()
+
+    def idle(self, now, timeout):
+        '''
+        True if nothing is in flight, and nothing has happened for a while.
+        '''
+        return self.pending <= 0 and now - self.last_active > timeout
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+
+class TcpListener(object):
+    '''
+    Answers DNS over TCP on the same address as a DnsServer.
+
+    A single thread accepts connections and reads queries from all of
+    them. Queries go to the server's queue when it has consumer threads,
+    and are otherwise answered right here.
+    '''
+    def __init__(self, server):
+        self.server = server
+        self.socket = None
+        self.thread = None
+        self.connections = []
+
+    @property
+    def idle_timeout(self):
+        return self.server.config['tcp_idle_timeout']
+
+    @property
+    def max_connections(self):
+        return self.server.config['tcp_max_connections']
+
+    def bind(self):
+        '''
+        Bind and listen on the server's address.
+        '''
+        family, address = self.server.address
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.server.config['reuse_port']:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.socket.bind(address)
+        self.socket.listen(self.max_connections)
+
+    def start(self):
+        '''
+        Start serving in a background thread.
+        '''
+        self.thread = threading.Thread(target=self.serve, name='pymads-tcp')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        '''
+        Accept and read connections until the server stops.
+        '''
+        while self.server.serving:
+            self.expire()
+            try:
+                readable, writable = select.select(
+                    [self.socket] + [c for c in self.connections if not c.eof],
+                    [c for c in self.connections if c.out],
+                    [], 1
+                )[:2]
+            except (select.error, socket.error, ValueError):
+                # A socket was closed underneath us
+                self.connections = [c for c in self.connections
+                                    if not c.closed]
+                continue
+
+            for conn in writable:
+                conn.flush()
+            for item in readable:
+                if item is self.socket:
+                    self.accept()
+                else:
+                    self.read(item)
+
+    def accept(self):
+        try:
+            sock, addr = self.socket.accept()
+        except socket.error:
+            return
+        if len(self.connections) >= self.max_connections:
+            sock.close()
+            return
+        sock.setblocking(False)
+        self.connections.append(TcpConnection(sock, addr))
+
+    def read(self, conn):
+        try:
+            data = conn.sock.recv(TCP_MAX_SIZE)
+        except socket.error as exc:
+            if getattr(exc, 'errno', None) in (errno.EAGAIN, errno.EINTR):
+                return
+            data = b''
+        if not data:
+            with conn.lock:
+                conn.eof = True # Close once the answers are out
+                done = conn.pending <= 0 and not conn.out
+            if done:
+                self.drop(conn)
+            return
+
+        for packet in conn.feed(data):
+            self.server.queries += 1
+            if self.server.consume_inline:
+                consumer = self.server._default_consumer
+                conn.reply(consumer.process(packet, conn.max_size))
+            else:
+                self.server.queue.put((packet, conn))
+
+    def expire(self):
+        '''
+        Close connections that have been idle for too long.
+        '''
+        now = monotonic()
+        for conn in list(self.connections):
+            if conn.closed or conn.idle(now, self.idle_timeout):
+                self.drop(conn)
+
+    def drop(self, conn):
+        conn.close()
+        if conn in self.connections:
+            self.connections.remove(conn)
+
+    def stop(self):
+        '''
+        Stop accepting, and close every connection.
+        '''
+        if self.thread:
+            self.thread.join(2)
+        for conn in list(self.connections):
+            self.drop(conn)
+        if self.socket:
+            self.socket.close()
@@ -0,0 +1,40 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+# Async test helpers, kept out of the test modules themselves so test
+# discovery still compiles them on Pythons without async syntax.
+
+import asyncio
+
+from pymads.errors import NegativeAnswer
+
+class SlowSource(object):
+    ''' Async source that takes a while to answer. '''
+    def __init__(self, record, delay, soa=None):
+        self.record = record
+        self.delay  = delay
+        self.soa    = soa
+        self.calls  = 0
+
+    async def aget(self, request):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if request.name == self.record.domain_name:
+            return [self.record]
+        if self.soa is not None:
+            raise NegativeAnswer('NXDOMAIN', self.soa)
+        return []
@@ -0,0 +1,205 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import unicode_literals
+
+import socket
+import struct
+import threading
+import time
+
+from pymads.extern import unittest
+from pymads.chain  import Chain
+from pymads.record import Record
+from pymads.request  import Request
+from pymads.response import Response
+from pymads.sources.dict import DictSource
+
+try:
+    import asyncio
+    from pymads.aio import AsyncDnsServer, resolve
+    from pymads.tests.aio_sources import SlowSource
+except (ImportError, SyntaxError):
+    asyncio = None
+
+test_host = '127.0.0.1'
+test_port = 53020
+
+@unittest.skipUnless(asyncio, 'needs asyncio')
+class TestAsyncServer(unittest.TestCase):
+    ''' Full-stack test of the asyncio engine '''
+
+    def setUp(self):
+        self.server = AsyncDnsServer(
+            listen_host = test_host,
+            listen_port = test_port,
+        )
+        self.server.bind()
+        self.thread = threading.Thread(target=self.server.serve)
+        self.thread.start()
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.settimeout(2)
+
+    def send(self, qid, domain_name='example.com'):
+        req = Request(qid, [], 'A')
+        req.name = domain_name
+        self.socket.sendto(req.pack(), (test_host, test_port))
+
+    def recv(self):
+        resp = Response()
+        resp.unpack(self.socket.recv(512))
+        return resp
+
+    def test_sync_chain(self):
+        record = Record('example.com', '9.9.9.9')
+        self.server.config['chains'] = [
+            Chain([DictSource({'example.com': [record]})])
+        ]
+        self.send(1)
+        resp = self.recv()
+        self.assertEqual(resp.qid, 1)
+        self.assertEqual(resp.records, [record])
+
+    def test_async_chain(self):
+        record = Record('example.com', '9.9.9.9')
+        self.server.config['chains'] = [Chain([SlowSource(record, 0.5)])]
+
+        # Both queries should be in flight at the same time
+        start = time.time()
+        self.send(1)
+        self.send(2)
+        answers = [self.recv(), self.recv()]
+        self.assertTrue(time.time() - start < 0.9)
+
+        self.assertEqual(sorted(r.qid for r in answers), [1, 2])
+        for resp in answers:
+            self.assertEqual(resp.records, [record])
+
+    def test_NXDOMAIN(self):
+        record = Record('example.com', '9.9.9.9')
+        self.server.config['chains'] = [Chain([SlowSource(record, 0)])]
+        self.send(3, 'sushi.org')
+        self.assertEqual(self.recv().flag_rcode, 3)
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join(2)
+        self.socket.close()
+
+@unittest.skipUnless(asyncio, 'needs asyncio')
+class TestAsyncTcp(TestAsyncServer):
+    ''' The asyncio engine, answering over TCP too '''
+
+    def setUp(self):
+        self.server = AsyncDnsServer(
+            listen_host = test_host,
+            listen_port = test_port,
+            tcp = True,
+        )
+        self.server.bind()
+        self.thread = threading.Thread(target=self.server.serve)
+        self.thread.start()
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.settimeout(2)
+
+    def ask_tcp(self, conn, qid, name):
+        req = Request(qid, [], 'A')
+        req.name = name
+        data = req.pack()
+        conn.sendall(struct.pack('!H', len(data)) + data)
+        length, = struct.unpack('!H', recv_exactly(conn, 2))
+        resp = Response()
+        resp.unpack(recv_exactly(conn, length))
+        return resp
+
+    def test_tcp(self):
+        record = Record('example.com', '9.9.9.9')
+        self.server.config['chains'] = [Chain([SlowSource(record, 0.1)])]
+        conn = socket.create_connection((test_host, test_port), 2)
+        try:
+            for qid in (1, 2):
+                resp = self.ask_tcp(conn, qid, 'example.com')
+                self.assertEqual(resp.qid, qid)
+                self.assertEqual(resp.records, [record])
+            self.assertEqual(self.ask_tcp(conn, 3, 'sushi.org').flag_rcode, 3)
+        finally:
+            conn.close()
+
+def recv_exactly(conn, size):
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise socket.error('Connection closed')
+        data += chunk
+    return data
+
+@unittest.skipUnless(asyncio, 'needs asyncio')
+class TestResolve(unittest.TestCase):
+    ''' Filters in front of awaited sources '''
+
+    def setUp(self):
+        from pymads.filters.cache import CacheFilter
+        from pymads.record import SOAType
+
+        self.record = Record('example.com', '9.9.9.9')
+        self.soa = Record('example.com', SOAType('ns1.example.com',
+            'hostmaster.example.com', 1, 7200, 900, 1209600, 300), 'SOA')
+        self.source = SlowSource(self.record, 0.01, self.soa)
+        self.filter = CacheFilter()
+        self.chain  = Chain([self.source], [self.filter])
+        self.loop   = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def resolve(self, *names):
+        requests = []
+        for name in names:
+            request = Request()
+            request.name = name
+            requests.append(resolve(self.chain, request))
+        return self.loop.run_until_complete(asyncio.gather(
+            *requests, return_exceptions=True))
+
+    def test_cache_hits(self):
+        for attempt in range(3):
+            self.assertEqual(self.resolve('example.com'), [[self.record]])
+        self.assertEqual(self.source.calls, 1)
+        self.assertEqual(self.filter.stats()['hits'], 2)
+        self.assertFalse(hasattr(self.filter, 'source'))
+
+    def test_negative(self):
+        from pymads.errors import NegativeAnswer
+
+        for attempt in range(3):
+            error, = self.resolve('nope.example.com')
+            self.assertTrue(isinstance(error, NegativeAnswer))
+            self.assertEqual(error.soa, self.soa)
+        self.assertEqual(self.source.calls, 1)
+        self.assertEqual(self.filter.stats()['negative_hits'], 2)
+
+    def test_coalesced(self):
+        answers = self.resolve(*['example.com'] * 5)
+        self.assertEqual(answers, [[self.record]] * 5)
+        self.assertEqual(self.source.calls, 1)
+        self.assertEqual(self.filter.stats()['coalesced'], 4)
+        self.assertEqual(self.filter.async_inflight, {})
@@ -41,5 +41,8 @@ class TestImports(unittest.TestCase):
         from pymads.sources.dict import DictSource
         from pymads.sources.dns  import DnsSource
 
+    def test_import_workers(self):
+        from pymads.workers import Supervisor
+
     def test_import_filters(self):
         from pymads.filters.cache import CacheFilter
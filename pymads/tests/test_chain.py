@@ -15,9 +15,13 @@ You should have received a copy of the GNU Lesser General Public License
 along with Pymads.  If not, see <http://www.gnu.org/licenses/>
 '''
 
+import threading
+import time
+
 from pymads.extern import unittest
 from pymads.chain  import Chain
 from pymads.record import Record
+from pymads.request import Request
 
 class TestChains(unittest.TestCase):
     ''' Test various aspects of chains. '''
@@ -37,6 +41,67 @@ class TestChains(unittest.TestCase):
         )
         self.assertEqual(chain.get_domain_string('not'+hostname), [])
 
+    def test_dictsource_qtype(self):
+        from pymads.sources.dict import DictSource
+        from pymads.request import Request
+
+        def query(name, qtype):
+            request = Request(qtype=qtype)
+            request.name = name
+            return request
+
+        address = Record('example.com', '9.9.9.9')
+        address6 = Record('example.com', 'fcd9::1', 'AAAA')
+        alias = Record('www.example.com', 'example.com', 'CNAME')
+        source = DictSource({
+            'example.com': [address, address6],
+            'www.example.com': [alias],
+        })
+
+        self.assertEqual(source.get(query('example.com', 'A')), [address])
+        self.assertEqual(source.get(query('example.com', 'AAAA')), [address6])
+        self.assertEqual(
+            source.get(query('example.com', 'ANY')),
+            [address, address6]
+        )
+        self.assertEqual(source.get(query('example.com', 'MX')), [])
+        self.assertEqual(source.get(query('www.example.com', 'A')), [alias])
+
+        self.assertTrue(source.owns(query('example.com', 'MX')))
+        self.assertFalse(source.owns(query('example.org', 'A')))
+
+        # Replacing the data rebuilds the index
+        source.data = {'example.org': [address]}
+        self.assertEqual(source.get(query('example.com', 'A')), [])
+        self.assertEqual(source.get(query('example.org', 'A')), [address])
+
+    def test_nodata(self):
+        from pymads.sources.dict import DictSource
+        from pymads.server import DnsServer
+        from pymads.request import Request
+        from pymads.response import Response
+
+        record = Record('example.com', '9.9.9.9')
+        server = DnsServer(chains = [Chain([DictSource({
+            'example.com': [record],
+        })])])
+
+        def ask(name):
+            request = Request(qtype='AAAA')
+            request.name = name
+            response = Response()
+            response.unpack(
+                server._default_consumer.process(request.pack())
+            )
+            return response
+
+        # The name exists, just not with that type
+        response = ask('example.com')
+        self.assertEqual(response.flag_rcode, 0)
+        self.assertEqual(response.records, [])
+
+        self.assertEqual(ask('example.org').flag_rcode, 3) # NXDOMAIN
+
     def test_jsonsource(self):
         from pymads.sources.json import JSONSource
 
@@ -79,6 +144,98 @@ class TestChains(unittest.TestCase):
             [record]
         )
 
+    def test_cacheinvalidate(self):
+        from pymads.sources.dict  import DictSource
+        from pymads.filters.cache import CacheFilter
+
+        record = Record('example.com', '9.9.9.9')
+        other  = Record('example.org', '9.9.9.9')
+        source = DictSource({'example.com': [record], 'example.org': [other]})
+        chain  = Chain([source], [CacheFilter()])
+        chain.get_domain_string('example.com')
+        chain.get_domain_string('example.org')
+
+        # Reloading the source drops what changed from the cache
+        moved = Record('example.com', '8.8.8.8')
+        source.load({'example.com': [moved]})
+        self.assertEqual(chain.get_domain_string('example.com'), [moved])
+        self.assertEqual(chain.get_domain_string('example.org'), [])
+
+    def test_cachebounded(self):
+        from pymads.sources.dict  import DictSource
+        from pymads.filters.cache import CacheFilter
+
+        data = dict(
+            ('host%d.example.com' % i,
+             [Record('host%d.example.com' % i, '9.9.9.9')])
+            for i in range(20)
+        )
+        filter = CacheFilter(size=5)
+        chain  = Chain([DictSource(data)], [filter])
+        for name in sorted(data):
+            chain.get_domain_string(name)
+        stats = filter.stats()
+        self.assertEqual(stats['entries'], 5)
+        self.assertEqual(stats['evictions'], 15)
+        self.assertEqual(stats['misses'], 20)
+
+        # The most recent names are still cached, and sized
+        chain.get_domain_string(sorted(data)[-1])
+        self.assertEqual(filter.stats()['hits'], 1)
+        self.assertTrue(filter.stats()['bytes'] > 0)
+
+        # A byte budget of about two entries keeps about two
+        filter = CacheFilter(max_bytes=filter.stats()['bytes'] * 2 // 5)
+        chain  = Chain([DictSource(data)], [filter])
+        for name in sorted(data):
+            chain.get_domain_string(name)
+        self.assertEqual(filter.stats()['entries'], 2)
+        self.assertEqual(filter.stats()['evictions'], 18)
+
+    def test_cachepurge(self):
+        from pymads.sources.dict  import DictSource
+        from pymads.filters.cache import CacheFilter
+        from pymads.extern import monotonic
+
+        source = DictSource({
+            'example.com': [Record('example.com', '9.9.9.9', rttl=10)],
+            'example.org': [Record('example.org', '9.9.9.9', rttl=1800)],
+        })
+        filter = CacheFilter()
+        chain  = Chain([source], [filter])
+        chain.get_domain_string('example.com')
+        chain.get_domain_string('example.org')
+        self.assertEqual(filter.stats()['entries'], 2)
+
+        filter.purge(monotonic() + 60)
+        self.assertEqual(filter.stats()['entries'], 1)
+        self.assertEqual(filter.stats()['expirations'], 1)
+        self.assertEqual(len(filter.heap), 1)
+
+    def test_cachekey(self):
+        from pymads.sources.dict  import DictSource
+        from pymads.filters.cache import CacheFilter
+
+        record = Record('example.com', '9.9.9.9')
+        record6 = Record('example.com', 'fcd9::1', 'AAAA')
+        filter = CacheFilter()
+        chain  = Chain([DictSource({'example.com': [record, record6]})],
+            [filter])
+        self.assertEqual(chain.get_domain_string('Example.COM'), [record])
+
+        request = Request(qtype='AAAA')
+        request.name = 'example.com'
+        self.assertEqual(chain.get(request), [record6])
+        self.assertEqual(sorted(filter.cache.data), [
+            ('example.com', 1, 1),
+            ('example.com', 28, 1),
+        ])
+
+        # Cached records are shared, not stamped with deadlines
+        self.assertFalse(hasattr(record, 'ttl'))
+        self.assertEqual(chain.get_domain_string('example.com'), [record])
+        self.assertEqual(filter.stats()['hits'], 1)
+
     def test_cachesetexpired(self):
         from pymads.sources.dict  import DictSource
         from pymads.filters.cache import CacheFilter
@@ -109,3 +266,250 @@ class TestChains(unittest.TestCase):
         self.assertEqual(chain.get_domain_string(hostname1), [])
         self.assertEqual(chain.get_domain_string(hostname2), [])
         self.assertEqual(chain.get_domain_string(hostname3), [record3])
+
+class TestNegativeCache(unittest.TestCase):
+    ''' NXDOMAIN and NODATA from upstream, cached per RFC 2308 '''
+
+    def setUp(self):
+        from pymads.record import SOAType
+        from pymads.response import Response
+        from pymads.sources.dns import DummyDnsSource
+
+        self.soa = Record('example.com', SOAType('ns1.example.com',
+            'hostmaster.example.com', 1, 7200, 900, 1209600, 300),
+            'SOA', 3600)
+        upstream = Response(1, ['nope', 'example', 'com'], code=3)
+        upstream.set_sections([], [self.soa])
+        self.source = DummyDnsSource(upstream.pack())
+        self.exchanges = 0
+        exchange = self.source._exchange_data
+        def counting(req_pkt):
+            self.exchanges += 1
+            return exchange(req_pkt)
+        self.source._exchange_data = counting
+
+    def test_source(self):
+        from pymads.errors import NegativeAnswer
+
+        with self.assertRaises(NegativeAnswer) as assertion:
+            self.source.get_domain_string('nope.example.com')
+        self.assertEqual(assertion.exception.label, 'NXDOMAIN')
+        self.assertEqual(assertion.exception.soa, self.soa)
+        self.assertEqual(assertion.exception.ttl, 300) # SOA minimum
+
+    def test_cache(self):
+        from pymads.errors import NegativeAnswer
+        from pymads.filters.cache import CacheFilter
+
+        filter = CacheFilter(size=1, negative_size=1)
+        chain  = Chain([self.source], [filter])
+        for attempt in range(3):
+            with self.assertRaises(NegativeAnswer) as assertion:
+                chain.get_domain_string('nope.example.com')
+            self.assertEqual(assertion.exception.soa, self.soa)
+        self.assertEqual(self.exchanges, 1)
+        stats = filter.stats()
+        self.assertEqual(stats['negative_entries'], 1)
+        self.assertEqual(stats['negative_hits'], 2)
+        self.assertEqual(stats['entries'], 0)
+
+    def test_separate_cap(self):
+        from pymads.errors import NegativeAnswer
+        from pymads.filters.cache import CacheFilter
+        from pymads.sources.source import Source
+
+        record = Record('example.org', '9.9.9.9')
+        upstream = self.source
+        class Upstream(Source):
+            def get(self, request):
+                if request.name == 'example.org':
+                    return [record]
+                return upstream.get(request)
+
+        filter = CacheFilter(negative_size=5)
+        chain  = Chain([Upstream()], [filter])
+        chain.get_domain_string('example.org')
+        for i in range(20):
+            self.assertRaises(NegativeAnswer,
+                chain.get_domain_string, 'nope%d.example.com' % i)
+
+        stats = filter.stats()
+        self.assertEqual(stats['negative_entries'], 5)
+        self.assertEqual(stats['evictions'], 15)
+        self.assertEqual(chain.get_domain_string('example.org'), [record])
+        self.assertEqual(filter.stats()['hits'], 1)
+
+    def test_authority(self):
+        from pymads.filters.cache import CacheFilter
+        from pymads.server import DnsServer
+        from pymads.response import Response
+
+        server = DnsServer(chains = [Chain([self.source], [CacheFilter()])])
+        for attempt in range(2):
+            request = Request(qid=attempt)
+            request.name = 'nope.example.com'
+            response = Response()
+            response.unpack(
+                server._default_consumer.process(request.pack())
+            )
+            self.assertEqual(response.flag_rcode, 3)
+            self.assertEqual(response.an_records, [])
+            self.assertEqual(response.ns_records, [self.soa])
+        self.assertEqual(self.exchanges, 1)
+
+class TestStaleCache(unittest.TestCase):
+    ''' Prefetch and serve-stale (RFC 8767) in CacheFilter '''
+
+    def setUp(self):
+        from pymads.filters import cache
+        from pymads.sources.source import Source
+
+        self.cache_module = cache
+        self.now = 1000.0
+        cache.monotonic = lambda: self.now
+
+        test = self
+        self.record = Record('example.com', '9.9.9.9', rttl=100)
+        self.fetched = threading.Event()
+        self.calls = 0
+        self.failing = False
+        class Upstream(Source):
+            def get(self, request):
+                test.calls += 1
+                test.fetched.set()
+                if test.failing:
+                    raise Exception('Upstream is down')
+                return [test.record]
+
+        self.filter = cache.CacheFilter(prefetch=0.1, max_stale=3600,
+            stale_ttl=30)
+        self.chain  = Chain([Upstream()], [self.filter])
+        self.assertEqual(self.get(), [self.record])
+
+    def tearDown(self):
+        from pymads.extern import monotonic
+        self.cache_module.monotonic = monotonic
+
+    def get(self):
+        return self.chain.get_domain_string('example.com')
+
+    def wait_for_prefetch(self):
+        self.assertTrue(self.fetched.wait(2))
+        for attempt in range(200):
+            if not self.filter.inflight:
+                return
+            time.sleep(0.01)
+        self.fail('Prefetch never finished')
+
+    def test_prefetch(self):
+        self.now += 50
+        self.assertEqual(self.get(), [self.record])
+        self.assertEqual(self.calls, 1)
+
+        # Within the last 10% of the TTL, hits refresh in the background
+        self.fetched.clear()
+        self.now += 45
+        self.assertEqual(self.get(), [self.record])
+        self.wait_for_prefetch()
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.filter.stats()['prefetches'], 1)
+
+        # Which pushed the expiry back
+        self.now += 80
+        self.assertEqual(self.get(), [self.record])
+        self.assertEqual(self.calls, 2)
+
+    def test_prefetch_off(self):
+        filter = self.cache_module.CacheFilter()
+        chain  = Chain(self.chain.sources, [filter])
+        chain.get_domain_string('example.com')
+        self.now += 95
+        chain.get_domain_string('example.com')
+        self.assertEqual(filter.stats()['prefetches'], 0)
+        self.assertEqual(filter.refresh_queue, None)
+        self.assertEqual(self.calls, 2)
+
+    def test_stale(self):
+        self.failing = True
+        self.now += 200
+        stale = self.get()
+        self.assertEqual([r.rdata for r in stale], ['9.9.9.9'])
+        self.assertEqual([r.rttl for r in stale], [30])
+        self.assertEqual(self.record.rttl, 100)
+        self.assertEqual(self.calls, 2)
+
+        # No retries until stale_ttl has passed
+        self.get()
+        self.assertEqual(self.calls, 2)
+        self.now += 31
+        self.get()
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(self.filter.stats()['failures'], 2)
+        self.assertEqual(self.filter.stats()['stale_hits'], 3)
+
+        # Upstream recovers
+        self.failing = False
+        self.now += 31
+        self.assertEqual(self.get(), [self.record])
+
+    def test_stale_limit(self):
+        self.failing = True
+        self.now += 100 + 3600
+        self.assertRaises(Exception, self.get)
+        self.assertEqual(self.filter.stats()['entries'], 0)
+
+class TestCoalescing(unittest.TestCase):
+    ''' Concurrent misses for one name share a single fetch '''
+
+    def setUp(self):
+        from pymads.filters.cache import CacheFilter
+        from pymads.sources.source import Source
+
+        test = self
+        self.record = Record('example.com', '9.9.9.9')
+        self.gate = threading.Event()
+        self.calls = 0
+        self.error = None
+        class Upstream(Source):
+            def get(self, request):
+                test.calls += 1
+                test.gate.wait(5)
+                if test.error:
+                    raise test.error
+                return [test.record]
+
+        self.filter = CacheFilter()
+        self.chain  = Chain([Upstream()], [self.filter])
+
+    def burst(self, count=10):
+        results = []
+        def query():
+            try:
+                results.append(self.chain.get_domain_string('example.com'))
+            except Exception as exc:
+                results.append(exc)
+        threads = [threading.Thread(target=query) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for attempt in range(500):
+            if self.filter.coalesced == count - 1:
+                break
+            time.sleep(0.01)
+        self.gate.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_coalesced(self):
+        results = self.burst()
+        self.assertEqual(results, [[self.record]] * 10)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.filter.stats()['coalesced'], 9)
+        self.assertEqual(self.filter.inflight, {})
+
+    def test_error(self):
+        self.error = ValueError('Upstream is down')
+        results = self.burst()
+        self.assertEqual(results, [self.error] * 10)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.filter.inflight, {})
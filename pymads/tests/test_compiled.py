@@ -0,0 +1,101 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+import os
+import shutil
+import tempfile
+
+from pymads.extern import unittest
+from pymads.chain  import Chain
+from pymads.record import Record
+from pymads.request import Request
+from pymads.sources.compiled import (CompiledSource, compile_zone,
+    compile_data)
+
+def query(name, qtype='A'):
+    request = Request(qtype=qtype)
+    request.name = name
+    return request
+
+class TestCompiledSource(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'zone.bin')
+
+        self.apex = Record('example.com', '9.9.9.9')
+        self.apex6 = Record('example.com', 'fcd9::1', 'AAAA')
+        self.www = Record('www.example.com', 'example.com', 'CNAME')
+        self.data = {
+            'example.com': [self.apex, self.apex6],
+            'www.example.com': [self.www],
+        }
+        for i in range(1000):
+            name = 'host%d.example.com' % i
+            self.data[name] = [Record(name, '10.0.%d.%d' % (i >> 8, i & 0xff))]
+        compile_zone(self.data, self.path)
+        self.source = CompiledSource(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_get(self):
+        get = self.source.get
+        self.assertEqual(get(query('example.com')), [self.apex])
+        self.assertEqual(get(query('EXAMPLE.com.', 'AAAA')), [self.apex6])
+        self.assertEqual(
+            get(query('example.com', 'ANY')),
+            [self.apex, self.apex6]
+        )
+        self.assertEqual(get(query('www.example.com', 'AAAA')), [self.www])
+        self.assertEqual(get(query('example.com', 'MX')), [])
+        self.assertEqual(get(query('nope.example.com')), [])
+
+    def test_every_name(self):
+        for name, records in self.data.items():
+            self.assertEqual(self.source.get(query(name, 'ANY')), records)
+
+    def test_owns(self):
+        self.assertTrue(self.source.owns(query('example.com', 'MX')))
+        self.assertFalse(self.source.owns(query('example.org')))
+
+    def test_load(self):
+        names = []
+        self.source.subscribe(names.append)
+        compile_zone({'example.org': [self.apex]}, self.path)
+        self.source.load()
+        self.assertEqual(names, [None])
+        self.assertEqual(self.source.get(query('example.com')), [])
+        self.assertEqual(self.source.get(query('example.org')), [self.apex])
+
+    def test_not_compiled(self):
+        with open(self.path, 'wb') as junk:
+            junk.write(b'{"example.com": []}')
+        self.assertRaises(ValueError, CompiledSource, self.path)
+
+    def test_from_buffer(self):
+        image = compile_data(self.data)
+        with open(self.path, 'rb') as compiled:
+            self.assertEqual(image, compiled.read())
+
+        source = CompiledSource.from_buffer(image)
+        for name, records in self.data.items():
+            self.assertEqual(source.get(query(name, 'ANY')), records)
+        self.assertRaises(ValueError, CompiledSource.from_buffer, b'junk')
+
+    def test_chain(self):
+        chain = Chain([self.source])
+        self.assertEqual(chain.get_domain_string('example.com'), [self.apex])
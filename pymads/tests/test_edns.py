@@ -0,0 +1,128 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import unicode_literals
+
+from pymads.extern import unittest
+from pymads.server import DnsServer
+from pymads.chain  import Chain
+from pymads.record import Record
+from pymads.request  import Request
+from pymads.response import Response
+from pymads.sources.dict import DictSource
+from pymads.errors import DnsError
+
+def make_query(qid, name, qtype='A', edns_size=None, version=0, do=False):
+    req = Request(qid, [], qtype)
+    req.name = name
+    req.edns_size = edns_size
+    req.edns_version = version
+    req.edns_do = do
+    return req.pack()
+
+def parse(data):
+    resp = Response()
+    resp.unpack(data)
+    return resp
+
+class TestEdns(unittest.TestCase):
+    def setUp(self):
+        # 40 AAAA records make a ~1.1KB answer
+        self.big = [
+            Record('big.example.com', 'fcd9::%x' % (i+1), 'AAAA')
+            for i in range(40)
+        ]
+        self.source = DictSource({
+            'example.com': [Record('example.com', '9.9.9.9')],
+            'big.example.com': self.big,
+        })
+        self.server = DnsServer(chains = [Chain([self.source])])
+        self.consumer = self.server._default_consumer
+
+    def test_parse(self):
+        req = Request()
+        req.unpack(make_query(1, 'example.com', edns_size=4096, do=True))
+        self.assertEqual(req.edns_size, 4096)
+        self.assertEqual(req.edns_version, 0)
+        self.assertTrue(req.edns_do)
+
+        req = Request()
+        req.unpack(make_query(1, 'example.com'))
+        self.assertEqual(req.edns_size, None)
+
+    def test_duplicate_opt(self):
+        data = bytearray(make_query(1, 'example.com', edns_size=4096))
+        data[11] = 2 # Two additional records
+        data += data[-11:]
+        req = Request()
+        self.assertRaises(DnsError, req.unpack, bytes(data))
+
+    def test_echo(self):
+        resp = parse(self.consumer.process(
+            make_query(1, 'example.com', edns_size=4096, do=True)
+        ))
+        self.assertEqual(resp.edns_size, 1232)
+        self.assertTrue(resp.edns_do)
+        self.assertEqual(len(resp.records), 1)
+
+        resp = parse(self.consumer.process(make_query(1, 'example.com')))
+        self.assertEqual(resp.edns_size, None)
+
+    def test_large_answer(self):
+        data = self.consumer.process(make_query(1, 'big.example.com', 'AAAA'))
+        self.assertTrue(len(data) <= 512)
+        self.assertEqual(parse(data).flag_tc, 1)
+
+        data = self.consumer.process(
+            make_query(1, 'big.example.com', 'AAAA', edns_size=4096)
+        )
+        self.assertTrue(512 < len(data) <= 1232)
+        resp = parse(data)
+        self.assertEqual(resp.flag_tc, 0)
+        self.assertEqual(resp.records, self.big)
+
+    def test_small_payload(self):
+        # Clients can't ask for less than 512 bytes
+        data = self.consumer.process(
+            make_query(1, 'example.com', edns_size=100)
+        )
+        self.assertEqual(parse(data).flag_tc, 0)
+
+    def test_bad_version(self):
+        resp = parse(self.consumer.process(
+            make_query(1, 'example.com', edns_size=4096, version=1)
+        ))
+        self.assertEqual(resp.flag_rcode, 0)
+        self.assertEqual(resp.edns_rcode, 1) # BADVERS, upper bits
+        self.assertEqual(resp.records, [])
+
+    def test_cache(self):
+        self.server = DnsServer(
+            chains = [Chain([self.source])],
+            wire_cache = 10,
+        )
+        self.consumer = self.server._default_consumer
+        query = make_query(1, 'big.example.com', 'AAAA', edns_size=4096)
+        first = self.consumer.process(query)
+        again = self.consumer.process(query)
+        self.assertEqual(first, again)
+        self.assertEqual(self.server.wire_cache.hits, 1)
+
+        # Without EDNS, the answer is different, and cached separately
+        plain = self.consumer.process(make_query(1, 'big.example.com', 'AAAA'))
+        self.assertEqual(parse(plain).flag_tc, 1)
+        self.assertEqual(self.server.wire_cache.hits, 1)
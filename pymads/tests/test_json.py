@@ -0,0 +1,140 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+import io
+import os
+import json
+import time
+import shutil
+import tempfile
+
+from pymads.extern import unittest
+from pymads.record import Record
+from pymads.sources.json import JSONSource, EntryStream, streamRecordDict
+
+ZONE = {
+    'example.com': [
+        {'rdata': '9.9.9.9'},
+        {'rtype': 'AAAA', 'rdata': 'fcd9::1', 'rttl': 60},
+    ],
+    'www.example.com': [
+        {'rtype': 'CNAME', 'rdata': 'example.com'},
+    ],
+    'empty.example.com': [],
+    'quoted "name" {with} [brackets], and: colons': [],
+}
+
+class TestJSONStream(unittest.TestCase):
+    def test_entries(self):
+        text = json.dumps(ZONE, indent=4)
+        # Tiny chunks, so values span many reads
+        for chunk_size in (1, 7, 64, len(text)):
+            entries = dict(EntryStream(io.StringIO(text), chunk_size))
+            self.assertEqual(entries, ZONE)
+
+    def test_empty(self):
+        self.assertEqual(list(EntryStream(io.StringIO(' { } \n'))), [])
+
+    def test_errors(self):
+        text = json.dumps(ZONE)
+        for bad in (text[:-1], text[:len(text)//2], text + '{}', '{"a" []}'):
+            stream = EntryStream(io.StringIO(bad), 5)
+            self.assertRaises(ValueError, list, stream)
+
+        self.assertRaises(TypeError, list, EntryStream(io.StringIO('[]')))
+        self.assertRaises(
+            TypeError,
+            streamRecordDict, io.StringIO('{"example.com": {}}')
+        )
+
+    def test_records(self):
+        calls = []
+        data = streamRecordDict(
+            io.StringIO(json.dumps(ZONE)),
+            progress = lambda *args: calls.append(args),
+        )
+        self.assertEqual(data['example.com'], [
+            Record('example.com', '9.9.9.9'),
+            Record('example.com', 'fcd9::1', 'AAAA', 60),
+        ])
+        self.assertEqual(len(data), len(ZONE))
+        self.assertEqual(calls, [(len(json.dumps(ZONE)), None, len(ZONE))])
+
+    def test_source(self):
+        source = JSONSource(io.StringIO(json.dumps(ZONE)))
+        self.assertEqual(
+            source.get_domain_string('www.example.com'),
+            [Record('www.example.com', 'example.com', 'CNAME')]
+        )
+
+class TestJSONReload(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'zone.json')
+        self.write(ZONE)
+        self.source = JSONSource(self.path)
+        self.changes = []
+        self.source.subscribe(self.changes.append)
+
+    def tearDown(self):
+        if hasattr(self.source, 'watcher'):
+            self.source.watcher.stop()
+        shutil.rmtree(self.dir)
+
+    def write(self, zone):
+        # Write and rename, like a deployment would
+        with open(self.path + '.tmp', 'w') as output:
+            json.dump(zone, output)
+        os.rename(self.path + '.tmp', self.path)
+
+    def test_reload(self):
+        zone = dict(ZONE)
+        zone['example.com'] = [{'rdata': '8.8.8.8'}]
+        zone['new.example.com'] = [{'rdata': '7.7.7.7'}]
+        del zone['www.example.com']
+        self.write(zone)
+        self.source.reload()
+
+        self.assertEqual(self.changes, [set([
+            'example.com', 'new.example.com', 'www.example.com'
+        ])])
+        self.assertEqual(
+            self.source.get_domain_string('example.com'),
+            [Record('example.com', '8.8.8.8')]
+        )
+
+    def test_watch(self):
+        watcher = self.source.watch(0.01)
+        self.write({'example.com': [{'rdata': '8.8.8.8'}]})
+        deadline = time.time() + 5
+        while not self.changes and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(
+            self.source.get_domain_string('example.com'),
+            [Record('example.com', '8.8.8.8')]
+        )
+
+        # Broken files are skipped, keeping the old data
+        watcher.stop()
+        with open(self.path, 'a') as output:
+            output.write('garbage')
+        self.assertTrue(watcher.check())
+        self.assertEqual(len(self.changes), 1)
+        self.assertEqual(
+            self.source.get_domain_string('example.com'),
+            [Record('example.com', '8.8.8.8')]
+        )
@@ -50,6 +50,13 @@ class TestPacket(unittest.TestCase):
         p_clone.unpack(p_orig.pack())
         self.assertEquals(p_orig.pack(), p_clone.pack())
 
+        # Parsing from a RawData buffer should agree
+        p_slow = Packet()
+        p_slow.unpack_header(RawData(p_orig.pack()))
+        p_slow.unpack_body(RawData(p_orig.pack()))
+        self.assertEqual(p_slow.question, p_clone.question)
+        self.assertEqual(p_slow.records, p_clone.records)
+
     def test_cycle_request(self):
         from pymads.request import Request
 
@@ -104,7 +111,7 @@ class TestPacket(unittest.TestCase):
         # Edit packet to use pointer instead of second label
         label_len = sum(1+len(x) for x in domain.split('.')) + 1
         question_len = label_len + 4
-        resp_pkt  = resp.pack()
+        resp_pkt  = RawData(resp.pack(compress=False))
         record_start = question_len + 12 # HEADER_LENGTH
         pointer   = b'\xc0\x0c'
         resp_pkt  = \
@@ -119,3 +126,83 @@ class TestPacket(unittest.TestCase):
             resp.pack(),
             p_clone.pack()
         )
+
+    def test_compression(self):
+        from pymads.request import Request
+        from pymads.record  import Record, SOAType
+
+        req = Request(12, [], 'ANY')
+        req.name = 'www.example.com'
+        records = [
+            Record('www.example.com', '9.9.9.%d' % i) for i in range(4)
+        ] + [
+            Record('www.example.com', 'Example.com', 'CNAME'),
+            Record('example.com', 'ns1.example.com', 'NS'),
+            Record('example.com', SOAType('ns1.example.com',
+                'hostmaster.example.com', 1, 7200, 900, 1209600, 300), 'SOA'),
+        ]
+        resp = req.respond(0, records)
+
+        packed = resp.pack()
+        uncompressed = resp.pack(compress=False)
+        self.assertTrue(len(packed) < len(uncompressed))
+        # Each repeat of www.example.com is just a pointer to the question
+        self.assertEqual(packed.count(b'\x03www'), 1)
+        self.assertEqual(packed.count(b'\x07example'), 1)
+
+        for data in (packed, uncompressed):
+            p_clone = Packet()
+            p_clone.unpack(data)
+            self.assertEqual(
+                p_clone.records,
+                resp.an_records + resp.ns_records
+            )
+            self.assertEqual(p_clone.pack(), packed)
+
+    def test_parse_pointer_loop(self):
+        from pymads.errors import DnsError
+
+        # Header, then a question name that points at itself
+        packet = b'\x00\x01\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00' + \
+            b'\xc0\x0c\x00\x01\x00\x01'
+        with self.assertRaises(DnsError) as assertion:
+            Packet().unpack(packet)
+        self.assertEqual(assertion.exception.label, 'FORMERR')
+
+    def test_parse_truncated(self):
+        from pymads.errors import DnsError
+        from pymads.request import Request
+        from pymads.record  import Record
+
+        req = Request(12, [], 'A')
+        req.name = 'example.com'
+        resp_pkt = req.respond(0, [Record('example.com', '9.9.9.9')]).pack()
+
+        for length in (5, 20, len(resp_pkt) - 2):
+            with self.assertRaises(DnsError) as assertion:
+                Packet().unpack(resp_pkt[:length])
+            self.assertEqual(assertion.exception.label, 'FORMERR')
+
+    def test_request_question_only(self):
+        import struct
+        from pymads.errors  import DnsError
+        from pymads.request import Request
+
+        req = Request(12, [], 'AAAA')
+        req.name = 'example.com'
+        query = req.pack()
+
+        # Trailing junk after the question is never looked at
+        junk = query + b'\xff' * 40
+        parsed = Request()
+        parsed.unpack(junk)
+        self.assertEqual(parsed.name, 'example.com')
+        self.assertEqual(parsed.qtype, 28)
+        self.assertEqual(parsed.records, [])
+
+        # But the question count has to be exactly one, with no answers
+        for counts in ((0, 0, 0), (2, 0, 0), (1, 1, 0), (1, 0, 1)):
+            bad = query[:4] + struct.pack('!HHH', *counts) + query[10:]
+            with self.assertRaises(DnsError) as assertion:
+                Request().unpack(bad)
+            self.assertEqual(assertion.exception.label, 'FORMERR')
@@ -0,0 +1,106 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from pymads.extern import unittest
+from pymads.record import Record, CompactRecord, SOAType
+from pymads.wire   import Builder
+
+def packed(record):
+    builder = Builder()
+    record.pack_into(builder)
+    return builder.getvalue()
+
+class TestCompactRecord(unittest.TestCase):
+    def setUp(self):
+        soa = SOAType('ns1.example.com', 'hostmaster.example.com',
+            1, 7200, 900, 1209600, 300)
+        self.fields = [
+            ('example.com', '9.9.9.9', 'A', 300),
+            ('example.com', 'fcd9::1', 'AAAA', 300),
+            ('www.example.com', 'example.com', 'CNAME', 60),
+            ('example.com', soa, 'SOA', 3600),
+        ]
+
+    def test_same_as_record(self):
+        for fields in self.fields:
+            record  = Record(*fields)
+            compact = CompactRecord(*fields)
+            self.assertEqual(compact, record)
+            self.assertEqual(str(compact), str(record))
+            self.assertEqual(compact.rdata, record.rdata)
+            self.assertEqual(compact.rtypecode, record.rtypecode)
+            self.assertEqual(compact.rclass, 'IN')
+            self.assertEqual(packed(compact), packed(record))
+
+    def test_compact(self):
+        record = CompactRecord('example.com', '9.9.9.9')
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertTrue(isinstance(record.rdata_packed, bytes))
+
+        name = ''.join(['example', '.com'])
+        self.assertTrue(CompactRecord(name, '9.9.9.8').domain_name
+            is record.domain_name)
+
+    def test_wire(self):
+        for fields in self.fields:
+            data = packed(Record(*fields))
+            record, offset = CompactRecord.from_wire(memoryview(data))
+            self.assertEqual(offset, len(data))
+            self.assertTrue(isinstance(record, CompactRecord))
+            self.assertEqual(record, Record(*fields))
+
+    def test_copy(self):
+        record = CompactRecord('*.example.com', '9.9.9.9')
+        copy = record.copy(domain_name='www.example.com')
+        self.assertTrue(isinstance(copy, CompactRecord))
+        self.assertEqual(copy, CompactRecord('www.example.com', '9.9.9.9'))
+
+    def test_jsonsource(self):
+        from pymads.sources.json import JSONSource
+
+        source = JSONSource('examples/sushi.json', CompactRecord)
+        records = source.get_domain_string('sushi.org')
+        self.assertEqual(records, [Record('sushi.org', '5.4.3.2')])
+        self.assertTrue(isinstance(records[0], CompactRecord))
+
+class TestRecordWire(unittest.TestCase):
+    def test_setters(self):
+        record = Record('example.com', '9.9.9.9')
+        self.assertEqual(packed(record), packed(Record('example.com', '9.9.9.9')))
+
+        changes = [
+            ('domain_name', 'example.org'),
+            ('rttl', 60),
+            ('rdata', '9.9.9.8'),
+            ('rclass', 'CHAOS'),
+        ]
+        for field, value in changes:
+            setattr(record, field, value)
+            fresh = Record(record.domain_name, record.rdata, record.rtype,
+                record.rttl, record.rclass)
+            self.assertEqual(packed(record), packed(fresh))
+            self.assertEqual(record.pack().export(), fresh.pack().export())
+
+    def test_compression(self):
+        builder = Builder()
+        builder.write_domain('example.com')
+        Record('example.com', '9.9.9.9').pack_into(builder)
+        self.assertEqual(
+            builder.getvalue(),
+            b'\x07example\x03com\x00\xc0\x00'
+            b'\x00\x01\x00\x01\x00\x00\x07\x08\x00\x04\t\t\t\t'
+        )
@@ -35,6 +35,19 @@ class TestRecursion(unittest.TestCase):
             self.source.get_domain_string('google.com')
         )
 
+    def test_sockets(self):
+        # Each exchange gets its own port, so they can run concurrently
+        first  = self.source.make_socket()
+        second = self.source.make_socket()
+        try:
+            self.assertNotEqual(
+                first.getsockname()[1],
+                second.getsockname()[1]
+            )
+        finally:
+            first.close()
+            second.close()
+
     def test_multidns(self):
         addr = self.source.remote_addr
         mdns = MultiDNS()
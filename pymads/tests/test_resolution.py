@@ -18,6 +18,7 @@ along with Pymads.  If not, see <http://www.gnu.org/licenses/>
 from __future__ import unicode_literals
 import re
 import threading
+import time
 
 from persei import RawData
 
@@ -308,6 +309,38 @@ class TestResolution(unittest.TestCase):
             const.ERROR_CODES['FORMERR']
         )
 
+    def query(self, domain_name, qtype='A'):
+        '''
+        Send a query from a raw socket, and parse the response.
+        '''
+        from pymads.request  import Request
+        from pymads.response import Response
+
+        req = Request(7, [], qtype)
+        req.name = domain_name
+
+        if not hasattr(self, 'socket'):
+            self.socket = self.make_socket()
+        self.socket.sendto(
+            req.pack(),
+            self.server.socket.getsockname()
+        )
+        resp = Response()
+        resp.unpack(self.socket.recv(512))
+        return resp
+
+    def test_raw_query(self):
+        '''
+        Resolve a record without relying on dig.
+        '''
+        record = Record('example.com', '9.9.9.9')
+        self.setup_chain(record)
+
+        resp = self.query('example.com')
+        self.assertEqual(resp.qid, 7)
+        self.assertEqual(resp.flag_rcode, 0)
+        self.assertEqual(resp.records, [record])
+
     def tearDown(self):
         self.server.stop()
         self.thread.join(2)
@@ -345,3 +378,95 @@ class TestResolutionIPv6(TestResolution):
         s.bind(addr)
         s.settimeout(1)
         return s
+
+class TestResolutionBatched(TestResolution):
+    ''' Full-stack integration test - batched datagram I/O '''
+
+    def setUp(self):
+        self.server = DnsServer(
+                                listen_host = test_host,
+                                listen_port = test_port,
+                                batch_io    = True,
+                      )
+        self.server.bind()
+        self.thread = threading.Thread(target=self.server.serve)
+        self.thread.start()
+
+class TestResolutionPooled(TestResolution):
+    ''' Full-stack integration test - managed consumer threads '''
+
+    def setUp(self):
+        self.server = DnsServer(
+                                listen_host = test_host,
+                                listen_port = test_port,
+                                consumers   = 4,
+                      )
+        self.server.bind()
+        self.thread = threading.Thread(target=self.server.serve)
+        self.thread.start()
+
+    def test_pool_stats(self):
+        '''
+        Queries are answered by named pool threads, which get counted.
+        '''
+        record = Record('example.com', '9.9.9.9')
+        self.setup_chain(record)
+        for _ in range(5):
+            self.assertEqual(self.query('example.com').records, [record])
+
+        # Counters are bumped just after the answer goes out
+        for _ in range(20):
+            stats = self.server.stats()
+            if sum(c['handled'] for c in stats['consumers']) == 5:
+                break
+            time.sleep(0.05)
+
+        self.assertEqual(stats['queries'], 5)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(
+            [c['name'] for c in stats['consumers']],
+            ['pymads-consumer-%d' % i for i in range(4)]
+        )
+        self.assertTrue(all(c['alive'] for c in stats['consumers']))
+        self.assertEqual(sum(c['handled'] for c in stats['consumers']), 5)
+
+    def test_stop_late_datagram(self):
+        '''
+        A datagram queued after the pool has stopped doesn't hang stop().
+        '''
+        while self.server.pool is None or self.server.loop_done is None:
+            time.sleep(0.01)
+        pool = self.server.pool
+        pool_stop = pool.stop
+        def stop_then_enqueue(*args):
+            pool_stop(*args)
+            self.server.queue.put((b'late', ('127.0.0.1', 9)))
+        pool.stop = stop_then_enqueue
+
+        stopper = threading.Thread(target=self.server.stop)
+        stopper.start()
+        stopper.join(5)
+        self.assertFalse(stopper.is_alive())
+        self.thread.join(2)
+        self.assertFalse(self.thread.is_alive())
+
+    def test_pool_restart(self):
+        '''
+        A consumer thread that dies gets replaced.
+        '''
+        record = Record('example.com', '9.9.9.9')
+        self.setup_chain(record)
+        self.query('example.com') # Pool is definitely running now
+
+        pool = self.server.pool
+        def explode():
+            raise Exception('Consumer crashed')
+        pool.consumers[0].consume = explode
+        dead = pool.threads[0]
+        dead.join(2)
+        self.assertFalse(dead.is_alive())
+        del pool.consumers[0].consume
+        pool.check()
+
+        self.assertEqual(pool.restarts, 1)
+        self.assertTrue(pool.threads[0].is_alive())
@@ -0,0 +1,106 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+import os
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+from pymads.extern import unittest
+from pymads.record import Record, SOAType
+from pymads.request import Request
+from pymads.sources.sqlite import SQLiteSource, create_database, INSERT
+
+def query(name, qtype='A'):
+    request = Request(qtype=qtype)
+    request.name = name
+    return request
+
+class TestSQLiteSource(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'zone.db')
+        self.apex = Record('example.com', '9.9.9.9')
+        self.apex6 = Record('example.com', 'fcd9::1', 'AAAA', 60)
+        self.soa = Record('example.com', SOAType('ns1.example.com',
+            'hostmaster.example.com', 1, 7200, 900, 1209600, 300), 'SOA')
+        self.www = Record('www.example.com', 'example.com', 'CNAME')
+        create_database(self.path, {
+            'example.com': [self.apex, self.apex6, self.soa],
+            'www.example.com': [self.www],
+        })
+        self.source = SQLiteSource(self.path)
+
+    def tearDown(self):
+        self.source.close()
+        shutil.rmtree(self.dir)
+
+    def insert(self, record):
+        connection = sqlite3.connect(self.path)
+        connection.execute(INSERT, (record.domain_name, record.rtype,
+            record.rttl, record.rdata))
+        connection.commit()
+        connection.close()
+
+    def test_get(self):
+        get = self.source.get
+        self.assertEqual(get(query('example.com')), [self.apex])
+        self.assertEqual(get(query('example.com', 'AAAA')), [self.apex6])
+        self.assertEqual(get(query('example.com', 'SOA')), [self.soa])
+        self.assertEqual(
+            sorted(get(query('example.com', 'ANY')), key=str),
+            sorted([self.apex, self.apex6, self.soa], key=str)
+        )
+        self.assertEqual(get(query('www.example.com', 'AAAA')), [self.www])
+        self.assertEqual(get(query('example.com', 'MX')), [])
+        self.assertEqual(get(query('example.org')), [])
+
+    def test_owns(self):
+        self.assertTrue(self.source.owns(query('example.com', 'MX')))
+        self.assertFalse(self.source.owns(query('example.org')))
+
+    def test_updates(self):
+        other = Record('example.org', '8.8.8.8')
+        self.insert(other)
+        self.assertEqual(self.source.get(query('example.org')), [other])
+
+    def test_cache(self):
+        source = SQLiteSource(self.path, cache_size=10, cache_ttl=0.1)
+        self.assertEqual(source.get(query('example.org')), [])
+        other = Record('example.org', '8.8.8.8')
+        self.insert(other)
+        self.assertEqual(source.get(query('example.org')), [])
+        self.assertEqual(source.hits, 1)
+
+        time.sleep(0.1)
+        self.assertEqual(source.get(query('example.org')), [other])
+        source.close()
+
+    def test_threads(self):
+        results = []
+        def lookup():
+            for _ in range(50):
+                results.append(self.source.get(query('example.com')))
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [[self.apex]] * 400)
+        self.assertEqual(len(self.source.connections), 8)
@@ -0,0 +1,198 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import unicode_literals
+
+import socket
+import struct
+import threading
+import time
+
+from pymads.extern import unittest
+from pymads.server import DnsServer
+from pymads.chain  import Chain
+from pymads.record import Record
+from pymads.request  import Request
+from pymads.response import Response
+from pymads.sources.dict import DictSource
+
+test_host = '127.0.0.1'
+test_port = 53030
+
+# Enough records that the answer won't fit in a 512 byte datagram
+big_rrset = [Record('big.example.com', 'fcd9::%x' % (i + 1), 'AAAA')
+    for i in range(40)]
+
+class SlowSource(object):
+    ''' Takes half a second to answer for slow.example.com. '''
+    def get(self, request):
+        if request.name == 'slow.example.com':
+            time.sleep(0.5)
+        return []
+
+def query(qid, name, qtype='A'):
+    req = Request(qid, [], qtype)
+    req.name = name
+    return req.pack()
+
+class TestTcp(unittest.TestCase):
+    ''' DNS over TCP, and truncation of big UDP answers '''
+
+    consumers = 0
+
+    def setUp(self):
+        source = DictSource({
+            'example.com' : [Record('example.com', '9.9.9.9')],
+            'slow.example.com' : [Record('slow.example.com', '9.9.9.8')],
+            'big.example.com' : big_rrset,
+        })
+        self.server = DnsServer(
+            listen_host = test_host,
+            listen_port = test_port,
+            chains      = [Chain([SlowSource(), source])],
+            consumers   = self.consumers,
+            tcp         = True,
+            tcp_idle_timeout    = 0.5,
+            tcp_max_connections = 2,
+        )
+        self.server.bind()
+        self.thread = threading.Thread(target=self.server.serve)
+        self.thread.start()
+        self.sockets = []
+
+    def connect(self):
+        sock = socket.create_connection((test_host, test_port), 2)
+        self.sockets.append(sock)
+        return sock
+
+    def send(self, sock, *packets):
+        sock.sendall(b''.join(
+            struct.pack('!H', len(p)) + p for p in packets
+        ))
+
+    def recv_exactly(self, sock, length):
+        data = b''
+        while len(data) < length:
+            chunk = sock.recv(length - len(data))
+            if not chunk:
+                raise EOFError('Connection closed')
+            data += chunk
+        return data
+
+    def recv(self, sock):
+        length, = struct.unpack('!H', self.recv_exactly(sock, 2))
+        resp = Response()
+        resp.unpack(self.recv_exactly(sock, length))
+        return resp
+
+    def test_pipelined(self):
+        sock = self.connect()
+        self.send(sock, query(1, 'example.com'), query(2, 'example.com'))
+        answers = [self.recv(sock), self.recv(sock)]
+        self.assertEqual(sorted(r.qid for r in answers), [1, 2])
+        for resp in answers:
+            self.assertEqual(resp.records[0].rdata, '9.9.9.9')
+
+        # Connection is reusable afterwards
+        self.send(sock, query(3, 'example.com'))
+        self.assertEqual(self.recv(sock).qid, 3)
+
+    def test_truncation(self):
+        udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sockets.append(udp)
+        udp.settimeout(2)
+        udp.sendto(query(4, 'big.example.com', 'AAAA'), (test_host, test_port))
+        resp = Response()
+        resp.unpack(udp.recv(512))
+        self.assertEqual(resp.flag_tc, 1)
+        self.assertEqual(resp.records, [])
+
+        sock = self.connect()
+        self.send(sock, query(5, 'big.example.com', 'AAAA'))
+        resp = self.recv(sock)
+        self.assertEqual(resp.flag_tc, 0)
+        self.assertEqual(resp.records, big_rrset)
+
+    def test_idle_timeout(self):
+        sock = self.connect()
+        self.send(sock, query(1, 'example.com'))
+        self.recv(sock)
+        sock.settimeout(3)
+        self.assertEqual(sock.recv(2), b'')
+
+    def test_slow_reader(self):
+        # A client that pipelines queries but never reads its answers
+        self.server.config['tcp_idle_timeout'] = 5
+        greedy = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        greedy.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        greedy.connect((test_host, test_port))
+        self.sockets.append(greedy)
+
+        # Keep the kernel from soaking up the answers on our side, too
+        def connected():
+            return [conn for conn in self.server.tcp.connections
+                if conn.addr == greedy.getsockname()]
+        for attempt in range(50):
+            if connected():
+                break
+            time.sleep(0.01)
+        connected()[0].sock.setsockopt(
+            socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+
+        self.send(greedy, *[query(i, 'big.example.com', 'AAAA')
+            for i in range(1000)])
+
+        # Doesn't hold up anyone else
+        sock = self.connect()
+        start = time.time()
+        self.send(sock, query(1, 'example.com'))
+        self.assertEqual(self.recv(sock).qid, 1)
+        self.assertTrue(time.time() - start < 0.5)
+
+        # And gets dropped once too much output piles up
+        for attempt in range(50):
+            if not connected():
+                break
+            time.sleep(0.05)
+        self.assertEqual(connected(), [])
+
+    def test_max_connections(self):
+        first  = self.connect()
+        second = self.connect()
+        self.send(first, query(1, 'example.com'))
+        self.recv(first)
+
+        third = self.connect()
+        self.send(third, query(1, 'example.com'))
+        self.assertRaises((EOFError, socket.error), self.recv, third)
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join(2)
+        for sock in self.sockets:
+            sock.close()
+
+class TestTcpPooled(TestTcp):
+    ''' DNS over TCP, answered by consumer threads '''
+
+    consumers = 2
+
+    def test_out_of_order(self):
+        sock = self.connect()
+        self.send(sock, query(1, 'slow.example.com'), query(2, 'example.com'))
+        self.assertEqual(self.recv(sock).qid, 2)
+        self.assertEqual(self.recv(sock).qid, 1)
@@ -0,0 +1,100 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from pymads.extern import unittest
+from pymads.chain  import Chain
+from pymads.record import Record
+from pymads.request import Request
+from pymads.sources.trie import TrieSource
+
+def query(name, qtype='A'):
+    request = Request(qtype=qtype)
+    request.name = name
+    return request
+
+class TestTrieSource(unittest.TestCase):
+    def setUp(self):
+        self.apex = Record('example.com', '9.9.9.9')
+        self.apex6 = Record('example.com', 'fcd9::1', 'AAAA')
+        self.www = Record('www.example.com', 'example.com', 'CNAME')
+        self.wild = Record('*.svc.example.com', '10.0.0.1')
+        self.db = Record('db.svc.example.com', '10.0.0.2')
+        self.source = TrieSource({
+            'example.com': [self.apex, self.apex6],
+            'www.example.com': [self.www],
+            '*.svc.example.com': [self.wild],
+            'db.svc.example.com': [self.db],
+        })
+
+    def test_exact(self):
+        self.assertEqual(self.source.get(query('example.com')), [self.apex])
+        self.assertEqual(self.source.get(query('Example.COM.')), [self.apex])
+        self.assertEqual(
+            self.source.get(query('example.com', 'ANY')),
+            [self.apex, self.apex6]
+        )
+        self.assertEqual(
+            self.source.get(query('www.example.com', 'AAAA')),
+            [self.www]
+        )
+
+    def test_wildcard(self):
+        records = self.source.get(query('web.svc.example.com'))
+        self.assertEqual(records, [self.wild.copy(
+            domain_name='web.svc.example.com'
+        )])
+        # Deeper names are covered too
+        self.assertEqual(
+            self.source.get(query('a.b.svc.example.com'))[0].domain_name,
+            'a.b.svc.example.com'
+        )
+        # But names that exist are never synthesized
+        self.assertEqual(
+            self.source.get(query('db.svc.example.com')),
+            [self.db]
+        )
+        self.assertEqual(self.source.get(query('db.svc.example.com', 'MX')), [])
+
+    def test_nxdomain_nodata(self):
+        owns = lambda name: self.source.owns(query(name))
+        self.assertTrue(owns('example.com'))
+        self.assertTrue(owns('svc.example.com')) # Empty non-terminal
+        self.assertTrue(owns('anything.svc.example.com'))
+        self.assertFalse(owns('nope.example.com'))
+        self.assertFalse(owns('example.org'))
+
+        self.assertEqual(self.source.get(query('svc.example.com')), [])
+        self.assertEqual(self.source.get(query('nope.example.com')), [])
+
+    def test_closest_encloser(self):
+        encloser = self.source.closest_encloser
+        self.assertEqual(encloser('a.b.www.example.com'), 'www.example.com')
+        self.assertEqual(encloser('x.svc.example.com'), 'svc.example.com')
+        self.assertEqual(encloser('example.org'), '')
+
+    def test_load(self):
+        names = []
+        self.source.subscribe(names.append)
+        self.source.load({'example.org': [self.apex]})
+        self.assertEqual(names, [None])
+        self.assertEqual(self.source.get(query('example.com')), [])
+        self.assertEqual(self.source.get(query('example.org')), [self.apex])
+
+    def test_chain(self):
+        chain = Chain([self.source])
+        self.assertTrue(chain.owns(query('svc.example.com')))
+        self.assertEqual(chain.get_domain_string('example.com'), [self.apex])
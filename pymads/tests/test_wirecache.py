@@ -0,0 +1,118 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import unicode_literals
+
+from pymads.extern import unittest
+from pymads.server import DnsServer
+from pymads.chain  import Chain
+from pymads.record import Record
+from pymads.request  import Request
+from pymads.response import Response
+from pymads.sources.dict import DictSource
+from pymads.wirecache import WireCache
+
+def make_query(qid, name, qtype='A', rd=False):
+    req = Request(qid, [], qtype)
+    req.name = name
+    req.flag_rd = rd
+    return req.pack()
+
+class TestWireCache(unittest.TestCase):
+    def setUp(self):
+        self.record = Record('example.com', '9.9.9.9')
+        self.source = DictSource({'example.com': [self.record]})
+        self.server = DnsServer(
+            chains = [Chain([self.source])],
+            wire_cache = 100,
+        )
+        self.cache = self.server.wire_cache
+        self.consumer = self.server._default_consumer
+
+    def test_key(self):
+        key = WireCache.key(make_query(1, 'example.com'), 512)
+        self.assertEqual(
+            key,
+            WireCache.key(make_query(2, 'Example.COM'), 512)
+        )
+        for other in (
+                    WireCache.key(make_query(1, 'example.org'), 512),
+                    WireCache.key(make_query(1, 'example.com', 'AAAA'), 512),
+                    WireCache.key(make_query(1, 'example.com'), 65535),
+                ):
+            self.assertNotEqual(key, other)
+
+        for junk in (b'Random garbage', make_query(1, 'example.com') + b'x'):
+            self.assertEqual(WireCache.key(junk, 512), None)
+
+    def test_hit(self):
+        first = self.consumer.process(make_query(1, 'example.com'))
+        again = self.consumer.process(make_query(2, 'EXAMPLE.com', rd=True))
+        self.assertEqual(self.cache.hits, 1)
+
+        resp = Response()
+        resp.unpack(again)
+        self.assertEqual(resp.qid, 2)
+        self.assertEqual(resp.flag_rd, 1)
+        self.assertEqual(resp.records, [self.record])
+        self.assertEqual(first[4:], again[4:])
+
+    def test_ttl(self):
+        self.source.load({
+            'example.com': [Record('example.com', '9.9.9.9', rttl=0)]
+        })
+        self.consumer.process(make_query(1, 'example.com'))
+        self.consumer.process(make_query(1, 'example.com'))
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(len(self.cache.entries), 0)
+
+    def test_reload(self):
+        self.consumer.process(make_query(1, 'example.com'))
+        self.assertEqual(len(self.cache.entries), 1)
+
+        other = Record('example.com', '8.8.8.8')
+        self.source.load({'example.com': [other]})
+        self.assertEqual(len(self.cache.entries), 0)
+
+        resp = Response()
+        resp.unpack(self.consumer.process(make_query(1, 'example.com')))
+        self.assertEqual(resp.records, [other])
+
+    def test_reload_diff(self):
+        self.source.load({
+            'example.com': [self.record],
+            'example.org': [Record('example.org', '9.9.9.8')],
+        })
+        self.consumer.process(make_query(1, 'example.com'))
+        self.consumer.process(make_query(1, 'Example.ORG'))
+        self.assertEqual(len(self.cache.entries), 2)
+
+        # Only the name that changed is dropped
+        self.source.load({
+            'example.com': [self.record],
+            'example.org': [Record('example.org', '8.8.8.8')],
+        })
+        self.assertEqual(len(self.cache.entries), 1)
+        self.consumer.process(make_query(1, 'example.com'))
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_new_chains(self):
+        self.consumer.process(make_query(1, 'example.com'))
+        self.server.config['chains'] = []
+        resp = Response()
+        resp.unpack(self.consumer.process(make_query(1, 'example.com')))
+        self.assertEqual(resp.flag_rcode, 3)
@@ -0,0 +1,189 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import unicode_literals
+
+import os
+import signal
+import socket
+import time
+
+from pymads.extern import unittest
+from pymads.server import DnsServer
+from pymads.chain  import Chain
+from pymads.record import Record
+from pymads.request  import Request
+from pymads.response import Response
+from pymads.sources.dict import DictSource
+from pymads.workers import Supervisor, unique_memory, RESTART_DELAY
+
+try:
+    import asyncio
+    from pymads.aio import AsyncDnsServer
+except (ImportError, SyntaxError):
+    asyncio = None
+
+test_host = '127.0.0.1'
+test_port = 53010
+
+def make_server():
+    record = Record('example.com', '9.9.9.9')
+    return DnsServer(
+        listen_host = test_host,
+        listen_port = test_port,
+        chains = [Chain([DictSource({'example.com': [record]})])],
+    )
+
+def make_async_server():
+    record = Record('example.com', '9.9.9.9')
+    return AsyncDnsServer(
+        listen_host = test_host,
+        listen_port = test_port,
+        chains = [Chain([DictSource({'example.com': [record]})])],
+    )
+
+class TestUniqueMemory(unittest.TestCase):
+    @unittest.skipUnless(os.path.exists('/proc/self/smaps'), 'needs /proc')
+    def test_self(self):
+        uss = unique_memory(os.getpid())
+        self.assertTrue(uss > 0)
+
+    def test_missing(self):
+        self.assertEqual(unique_memory(-1), None)
+
+@unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT'), 'needs SO_REUSEPORT')
+class TestSupervisor(unittest.TestCase):
+    ''' Pre-fork worker processes '''
+
+    def setUp(self):
+        self.supervisor = Supervisor(make_server, workers=2)
+        self.supervisor.running = True
+        for slot in range(2):
+            self.supervisor.spawn(slot)
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.settimeout(1)
+
+    def query(self, qid):
+        req = Request(qid, [], 'A')
+        req.name = 'example.com'
+        for attempt in range(10):
+            self.socket.sendto(req.pack(), (test_host, test_port))
+            try:
+                data = self.socket.recv(512)
+            except socket.timeout:
+                continue # Workers may still be binding
+            resp = Response()
+            resp.unpack(data)
+            return resp
+        self.fail('No answer from workers')
+
+    def wait_restart(self, pid, slot):
+        for attempt in range(50):
+            self.supervisor.reap()
+            if pid not in self.supervisor.pids and \
+                    slot in self.supervisor.pids.values():
+                break
+            time.sleep(0.1)
+
+    def test_serve(self):
+        for qid in range(1, 20):
+            resp = self.query(qid)
+            self.assertEqual(resp.qid, qid)
+            self.assertEqual(resp.records[0].rdata, '9.9.9.9')
+
+        time.sleep(1) # Let the counters get published
+        stats = self.supervisor.stats()
+        self.assertEqual(sorted(stats), [0, 1])
+        self.assertTrue(sum(qps for (pid, qps) in stats.values()) > 0)
+
+    def test_memory(self):
+        memory = self.supervisor.memory()
+        self.assertEqual(sorted(memory), [0, 1])
+        for pid, uss in memory.values():
+            self.assertIn(pid, self.supervisor.pids)
+            if uss is not None:
+                self.assertTrue(uss > 0)
+
+    def test_restart(self):
+        pid = list(self.supervisor.pids)[0]
+        slot = self.supervisor.pids[pid]
+        os.kill(pid, signal.SIGKILL)
+        self.wait_restart(pid, slot)
+
+        self.assertNotIn(pid, self.supervisor.pids)
+        self.assertIn(slot, self.supervisor.pids.values())
+        self.assertEqual(len(self.supervisor.pids), 2)
+        self.query(1)
+
+    def test_backoff(self):
+        # Dying right after starting, again and again
+        delays = []
+        for kill in range(3):
+            pid = [pid for (pid, slot) in self.supervisor.pids.items()
+                if slot == 0][0]
+            os.kill(pid, signal.SIGKILL)
+            self.wait_restart(pid, 0)
+            delays.append(self.supervisor.delays[0])
+        self.assertEqual(delays,
+            [RESTART_DELAY, RESTART_DELAY * 2, RESTART_DELAY * 4])
+        self.query(1)
+
+    def tearDown(self):
+        self.supervisor.stop()
+        self.socket.close()
+
+@unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT'), 'needs SO_REUSEPORT')
+@unittest.skipUnless(asyncio, 'needs asyncio')
+class TestAsyncWorker(unittest.TestCase):
+    ''' Pre-fork worker running the asyncio engine '''
+
+    def setUp(self):
+        self.supervisor = Supervisor(make_async_server, workers=1)
+        self.supervisor.running = True
+        self.pid = self.supervisor.spawn(0)
+
+    def test_sigterm(self):
+        # Wait until it's serving, so SIGTERM finds the loop running
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(0.2)
+        req = Request(1, [], 'A')
+        req.name = 'example.com'
+        try:
+            for attempt in range(25):
+                sock.sendto(req.pack(), (test_host, test_port))
+                try:
+                    sock.recv(512)
+                    break
+                except socket.timeout:
+                    continue
+            else:
+                self.fail('No answer from worker')
+        finally:
+            sock.close()
+
+        os.kill(self.pid, signal.SIGTERM)
+        for attempt in range(30):
+            if os.waitpid(self.pid, os.WNOHANG)[0] == self.pid:
+                break
+            time.sleep(0.1)
+        else:
+            self.fail('Worker still running 3s after SIGTERM')
+        del self.supervisor.pids[self.pid]
+
+    def tearDown(self):
+        self.supervisor.stop()
@@ -0,0 +1,131 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+import os
+import shutil
+import tempfile
+
+from pymads.extern import unittest
+from pymads.record import Record, SOAType
+from pymads.sources.zone import ZoneFileSource, parse_ttl
+
+ZONE = '''\
+$ORIGIN example.com.
+$TTL 1h
+@   IN  SOA ns1 hostmaster (
+            2024010101 ; serial
+            2h         ; refresh
+            15m 2w
+            300 )
+    IN  NS  ns1
+    IN  NS  ns2.example.net.
+    IN  A   9.9.9.9
+    60  AAAA fcd9::1
+ns1 A 10.0.0.1
+www 300 IN CNAME @
+; A comment on its own line
+mail IN MX 10 mail ; not supported, skipped
+$INCLUDE sub.zone sub
+'''
+
+SUB = '''\
+host IN A 10.0.1.1
+WWW.Example.Org. A 10.0.1.2
+'''
+
+class TestZoneFile(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'example.com.zone')
+        with open(self.path, 'w') as zonefile:
+            zonefile.write(ZONE)
+        with open(os.path.join(self.dir, 'sub.zone'), 'w') as zonefile:
+            zonefile.write(SUB)
+        self.source = ZoneFileSource(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, text):
+        with open(self.path, 'w') as zonefile:
+            zonefile.write(text)
+
+    def test_records(self):
+        data = self.source.data
+        self.assertEqual(data['example.com'], [
+            Record('example.com', SOAType('ns1.example.com',
+                'hostmaster.example.com', 2024010101, 7200, 900, 1209600,
+                300), 'SOA', 3600),
+            Record('example.com', 'ns1.example.com', 'NS', 3600),
+            Record('example.com', 'ns2.example.net', 'NS', 3600),
+            Record('example.com', '9.9.9.9', 'A', 3600),
+            Record('example.com', 'fcd9::1', 'AAAA', 60),
+        ])
+        self.assertEqual(data['ns1.example.com'],
+            [Record('ns1.example.com', '10.0.0.1', 'A', 3600)])
+        self.assertEqual(data['www.example.com'],
+            [Record('www.example.com', 'example.com', 'CNAME', 300)])
+        self.assertFalse('mail.example.com' in data)
+
+    def test_include(self):
+        data = self.source.data
+        self.assertEqual(data['host.sub.example.com'],
+            [Record('host.sub.example.com', '10.0.1.1', 'A', 1800)])
+        self.assertEqual(data['www.example.org'],
+            [Record('www.example.org', '10.0.1.2', 'A', 1800)])
+
+    def test_case(self):
+        self.write('$ORIGIN Example.COM.\nWWW CNAME Host.Example.COM.\n')
+        self.source.reload()
+        self.assertEqual(
+            self.source.get_domain_string('www.example.com'),
+            [Record('www.example.com', 'host.example.com', 'CNAME', 1800)]
+        )
+
+    def test_lookup(self):
+        self.assertEqual(
+            self.source.get_domain_string('ns1.example.com'),
+            [Record('ns1.example.com', '10.0.0.1', 'A', 3600)]
+        )
+
+    def test_origin(self):
+        self.write('www A 10.0.0.1\n')
+        self.assertRaises(ValueError, ZoneFileSource, self.path)
+        source = ZoneFileSource(self.path, 'example.org.')
+        self.assertEqual(list(source.data), ['www.example.org'])
+
+    def test_errors(self):
+        for text in (
+                    '@ IN SOA ns1 hostmaster ( 1 2 3 4 5\n',
+                    'www A 10.0.0.1 )\n',
+                    '  A 10.0.0.1\n',
+                    'www A not-an-address\n',
+                ):
+            self.write('$ORIGIN example.com.\n' + text)
+            self.assertRaises(ValueError, ZoneFileSource, self.path)
+
+    def test_reload(self):
+        self.write('$ORIGIN example.com.\nwww A 10.0.0.2\n')
+        self.source.reload()
+        self.assertEqual(list(self.source.data), ['www.example.com'])
+
+    def test_ttl(self):
+        self.assertEqual(parse_ttl('3600'), 3600)
+        self.assertEqual(parse_ttl('1h30M'), 5400)
+        self.assertEqual(parse_ttl('1w'), 604800)
+        for bad in ('', 'h', '1x', '1h 2m'):
+            self.assertRaises(ValueError, parse_ttl, bad)
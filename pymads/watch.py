@@ -0,0 +1,78 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+import os
+import logging
+import threading
+
+class FileWatcher(object):
+    '''
+    Polls a file's modification time, size and inode, and calls
+    callback() from a background thread whenever they change.
+
+    Polling is cheap (one stat per interval) and works everywhere,
+    including for files replaced by a rename.
+    '''
+    def __init__(self, path, callback, interval=1.0):
+        self.path     = path
+        self.callback = callback
+        self.interval = interval
+        self.stamp    = self.stat()
+        self.stopping = threading.Event()
+        self.thread   = None
+        self.logger   = logging.getLogger('loader')
+
+    def stat(self):
+        '''
+        What we compare between polls, or None if the file is missing.
+        '''
+        try:
+            info = os.stat(self.path)
+        except OSError:
+            return None
+        return (info.st_mtime, info.st_size, info.st_ino)
+
+    def check(self):
+        '''
+        Call the callback if the file changed since the last check.
+        Returns whether it did.
+        '''
+        stamp = self.stat()
+        if stamp is None or stamp == self.stamp:
+            return False
+        self.stamp = stamp
+        try:
+            self.callback()
+        except Exception:
+            # Most likely a half-written file. Keep serving the old data,
+            # and try again when the file changes next.
+            self.logger.exception('Reloading %s failed' % self.path)
+        return True
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='pymads-watch')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.check()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,182 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+import struct
+
+from persei import RawData
+from pymads.errors import DnsError
+
+# Precompiled formats, for use with unpack_from and pack_into
+HEADER   = struct.Struct('!HHHHHH')
+QUESTION = struct.Struct('!HH')
+RR       = struct.Struct('!HHIH')
+RR_HEAD  = struct.Struct('!HHI')
+SOA      = struct.Struct('!IiiiI')
+BYTE     = struct.Struct('!B')
+POINTER  = struct.Struct('!H')
+
+MAX_POINTERS = 64
+
+def as_view(packet):
+    '''
+    Wrap packet data in a memoryview, so slicing it doesn't copy.
+
+    Accepts bytes, bytearray, memoryview, or persei RawData.
+    '''
+    if isinstance(packet, RawData):
+        packet = packet.export()
+    return memoryview(packet)
+
+def read_name(view, offset):
+    '''
+    Read a domain name from a buffer, following compression pointers.
+
+    Same contract as utils.str2labels, but labels come back as bytes and
+    nothing but the labels themselves is copied.
+
+    view, 18 -> (31, [b'google', b'com'])
+    '''
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        length, = BYTE.unpack_from(view, offset)
+        if length >= 0xc0:
+            pointer, = POINTER.unpack_from(view, offset)
+            pointer &= 0x3fff
+            if pointer >= len(view) or jumps >= MAX_POINTERS:
+                raise DnsError('FORMERR', 'Bad pointer')
+            if end is None:
+                end = offset + 2
+            jumps += 1
+            offset = pointer
+            continue
+        elif length & 0xc0:
+            raise DnsError('FORMERR', 'Bad label type')
+
+        offset += 1
+        if length == 0:
+            break
+        if offset + length > len(view):
+            raise DnsError('FORMERR', 'Truncated label')
+        labels.append(view[offset:offset+length].tobytes())
+        offset += length
+
+    if end is None:
+        end = offset
+    return end, labels
+
+def read_domain(view, offset):
+    '''
+    Like read_name, but returns the name as a dotted string.
+    '''
+    offset, labels = read_name(view, offset)
+    return offset, '.'.join(label.decode('utf-8') for label in labels)
+
+def encode_domain(name):
+    '''
+    Uncompressed wire form of a dotted domain name. Also returns the name
+    the way Builder keys it, without empty labels.
+
+    'example.com.' -> ('example.com', b'\\x07example\\x03com\\x00')
+    '''
+    labels = [label for label in name.split('.') if label]
+    parts = []
+    for label in labels:
+        encoded = label.encode('utf-8')
+        if len(encoded) > 63:
+            raise ValueError('Label too long: %r' % label)
+        parts.append(BYTE.pack(len(encoded)))
+        parts.append(encoded)
+    parts.append(b'\x00')
+    return '.'.join(labels), b''.join(parts)
+
+class Builder(object):
+    '''
+    Serializes a packet into a single bytearray.
+
+    Names written through write_domain() are remembered, so that later
+    occurrences of the same name (or any suffix of it) become two-byte
+    compression pointers, as described in RFC 1035 section 4.1.4.
+    Matching is case-sensitive, so names keep the case they were given.
+    '''
+    def __init__(self, compress=True):
+        self.buf = bytearray()
+        self.compress = compress
+        self.names = {} # name suffix -> offset
+
+    def __len__(self):
+        return len(self.buf)
+
+    def write(self, data):
+        '''
+        Append raw bytes.
+        '''
+        self.buf += data
+
+    def write_domain(self, name):
+        '''
+        Append a dotted domain name, compressing where possible.
+        '''
+        labels = [label for label in name.split('.') if label]
+        for index, label in enumerate(labels):
+            if self.compress:
+                suffix = '.'.join(labels[index:])
+                pointer = self.names.get(suffix)
+                if pointer is not None:
+                    self.buf += POINTER.pack(0xc000 | pointer)
+                    return
+                if len(self.buf) < 0x4000:
+                    self.names[suffix] = len(self.buf)
+
+            encoded = label.encode('utf-8')
+            if len(encoded) > 63:
+                raise ValueError('Label too long: %r' % label)
+            self.buf.append(len(encoded))
+            self.buf += encoded
+        self.buf.append(0)
+
+    def write_encoded(self, name, encoded):
+        '''
+        Like write_domain(), given the result of encode_domain(). Much
+        cheaper when the name (typically the query name) was written
+        before, or when compression is off.
+        '''
+        if not self.compress:
+            self.buf += encoded
+            return
+        pointer = self.names.get(name)
+        if pointer is not None:
+            self.buf += POINTER.pack(0xc000 | pointer)
+        else:
+            self.write_domain(name)
+
+    def start_rdata(self):
+        '''
+        Reserve the rdata length field. Returns a marker for end_rdata().
+        '''
+        self.buf += b'\x00\x00'
+        return len(self.buf)
+
+    def end_rdata(self, marker):
+        '''
+        Fill in the rdata length, now that the rdata has been written.
+        '''
+        POINTER.pack_into(self.buf, marker - 2, len(self.buf) - marker)
+
+    def getvalue(self):
+        return bytes(self.buf)
@@ -0,0 +1,156 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+import struct
+
+from pymads.extern import monotonic
+from pymads.lru import LRU
+
+HEADER = struct.Struct('!HHHHHH')
+ID_FLAGS = struct.Struct('!HH')
+
+FLAG_QR = 0x8000
+FLAG_OPCODE = 0x7800
+FLAG_RD = 0x0100
+
+OPT_HEAD = b'\x00\x00\x29' # Root owner name, type OPT
+OPT_LENGTH = 11
+
+class WireCache(object):
+    '''
+    Cache of fully packed answers, in front of Consumer.make_response.
+
+    Keys are taken straight from the request datagram (lowercased qname,
+    qtype and qclass), so a hit skips parsing, the chains, and packing.
+    Only the query id and RD flag get patched into the stored answer.
+
+    Entries live as long as the shortest TTL in the answer, and are
+    dropped when a source in the server's chains reports a change.
+    '''
+    def __init__(self, size=10000):
+        self.entries = LRU(size)
+        self.chains  = None
+        self.hits    = 0
+        self.misses  = 0
+
+    def __repr__(self):
+        return '<pymads wire cache with %d entries>' % len(self.entries)
+
+    @staticmethod
+    def key(packet, max_size):
+        '''
+        Cache key for a raw request packet, or None if it's not a plain
+        single-question query that we can answer from cache.
+
+        The answer size limit is part of the key, since it decides
+        whether the answer is truncated. So is a trailing OPT record
+        without options, which carries the client's EDNS0 payload size.
+        '''
+        try:
+            qid, flags, qdcount, ancount, nscount, arcount = \
+                HEADER.unpack_from(packet)
+        except struct.error:
+            return None
+        if flags & (FLAG_QR | FLAG_OPCODE) or qdcount != 1 \
+                or ancount or nscount or arcount > 1:
+            return None
+
+        offset = 12
+        length = len(packet)
+        while offset < length:
+            label_length = bytearray(packet[offset:offset+1])[0]
+            if label_length & 0xc0:
+                return None # Compression pointer, not worth handling
+            offset += 1 + label_length
+            if label_length == 0:
+                break
+        end = offset + 4
+        if arcount:
+            if length != end + OPT_LENGTH \
+                    or bytes(packet[end:end+3]) != OPT_HEAD \
+                    or bytes(packet[length-2:]) != b'\x00\x00':
+                return None
+        elif end != length:
+            return None
+        return (
+            bytes(packet[12:offset]).lower() + bytes(packet[offset:]),
+            max_size,
+        )
+
+    def attach(self, chains):
+        '''
+        Start tracking a (new) list of chains, dropping everything we
+        cached for the old one.
+        '''
+        if self.chains is not None:
+            for chain in self.chains:
+                chain.unsubscribe(self.invalidate)
+        self.entries.clear()
+        self.chains = chains
+        for chain in chains:
+            chain.subscribe(self.invalidate)
+
+    def get(self, key, packet):
+        '''
+        Retrieve a cached answer, patched up to match the request packet.
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        data, expires, name = entry
+        if monotonic() >= expires:
+            self.entries.pop(key)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        qid, flags = ID_FLAGS.unpack_from(packet)
+        resp_flags, = struct.unpack_from('!H', data, 2)
+        resp_flags = (resp_flags & ~FLAG_RD) | (flags & FLAG_RD)
+        return ID_FLAGS.pack(qid, resp_flags) + data[4:]
+
+    def put(self, key, name, records, data):
+        '''
+        Store a packed answer, as long as its records' TTLs allow.
+        Empty (NODATA) answers have no TTL to go by, and aren't stored.
+        '''
+        if not records:
+            return
+        ttl = min(r.rttl for r in records)
+        if ttl > 0:
+            self.entries.put(key, (data, monotonic() + ttl, name.lower()))
+
+    def invalidate(self, names=None):
+        '''
+        Drop cached answers for the given names, or everything for None.
+        '''
+        if names is None:
+            self.entries.clear()
+            return
+        names = set(name.lower() for name in names)
+        for key, (data, expires, name) in self.entries.items():
+            if name in names:
+                self.entries.pop(key)
+
+    def stats(self):
+        return {
+            'entries'  : len(self.entries),
+            'hits'     : self.hits,
+            'misses'   : self.misses,
+            'evictions': self.entries.evictions,
+        }
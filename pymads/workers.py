@@ -0,0 +1,286 @@
+'''
+This file is part of Pymads.
+
+Pymads is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Pymads is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Pymads.  If not, see <http://www.gnu.org/licenses/>
+'''
+
+from __future__ import absolute_import
+
+import os
+import gc
+import errno
+import signal
+import logging
+import threading
+import time
+from multiprocessing.sharedctypes import RawArray
+
+RESTART_DELAY     = 0.5  # First wait before restarting a crash-looping worker
+MAX_RESTART_DELAY = 30   # Longest we'll ever wait between restarts
+MIN_UPTIME        = 5    # Seconds a worker must live to count as healthy
+
+def unique_memory(pid):
+    '''
+    Bytes of memory only this process uses (its USS): private pages, not
+    shared with a parent or sibling. None where /proc can't tell us.
+    '''
+    for name in ('smaps_rollup', 'smaps'):
+        try:
+            with open('/proc/%d/%s' % (pid, name)) as smaps:
+                total = 0
+                for line in smaps:
+                    if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                        total += int(line.split()[1]) * 1024
+                return total
+        except (IOError, OSError):
+            continue
+    return None
+
+def freeze():
+    '''
+    Move everything allocated so far out of the garbage collector's sight
+    (Python 3.7+), so collections in forked children don't write to, and
+    so copy, the pages they share with us.
+    '''
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+class Supervisor(object):
+    '''
+    Runs several forked copies of a DnsServer, which all bind the same
+    address with SO_REUSEPORT so the kernel spreads queries across them.
+
+    Each worker builds its own server by calling factory(). Dead workers
+    are restarted, with a growing delay if they keep dying right after
+    they start, and per-worker throughput and unique memory are logged
+    periodically.
+
+    Anything the factory closes over is loaded once, before forking, and
+    shared copy-on-write by every worker (see freeze()).
+    '''
+    def __init__(self, factory, workers=2, report_interval=10,
+                 log='WARN'):
+        '''
+        factory         : Callable returning an unbound DnsServer.
+        workers         : Number of worker processes to keep running.
+        report_interval : Seconds between throughput reports, or 0 for
+                          no reports.
+        log             : Logging level for the supervisor itself.
+        '''
+        self.factory  = factory
+        self.workers  = int(workers)
+        self.report_interval = report_interval
+        self.logger   = logging.getLogger('supervisor')
+        self.logger.setLevel(log.upper() if isinstance(log, str) else log)
+        self.running  = False
+        self.pids     = {} # pid -> worker slot
+        self.started  = {} # slot -> time of the last spawn
+        self.delays   = {} # slot -> seconds we waited before that spawn
+        self.restarts = {} # slot -> time to restart a dead worker
+
+        # Shared with the children, which publish their query counts here
+        self.counters = RawArray('d', self.workers)
+        self.last_counts = [0.0] * self.workers
+        self.last_report = None
+
+    def __repr__(self):
+        return '<pymads supervisor for %d workers>' % self.workers
+
+    # Parent side -----------------------------------------
+
+    def run(self):
+        '''
+        Start the workers and babysit them until stop() or a signal.
+        '''
+        self.running = True
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT,  self._on_signal)
+
+        freeze()
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+        self.last_report = time.time()
+        try:
+            while self.running:
+                time.sleep(0.2)
+                self.reap()
+                if self.report_interval and \
+                        time.time() - self.last_report >= self.report_interval:
+                    self.report()
+        finally:
+            self.stop()
+
+    def _on_signal(self, signum, frame):
+        self.running = False
+
+    def spawn(self, slot):
+        '''
+        Fork a worker process for the given slot.
+        '''
+        self.counters[slot] = 0
+        self.last_counts[slot] = 0.0
+        self.started[slot] = time.time()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                self.run_worker(slot)
+                status = 0
+            except Exception:
+                self.logger.exception('Worker %d crashed' % slot)
+            finally:
+                os._exit(status)
+
+        self.pids[pid] = slot
+        self.logger.info('Started worker %d (pid %d)' % (slot, pid))
+        return pid
+
+    def reap(self):
+        '''
+        Collect dead workers, and restart them if we're still running.
+
+        A worker that dies within MIN_UPTIME of starting waits twice as
+        long as last time before its restart, up to MAX_RESTART_DELAY, so
+        a broken config doesn't fork in a tight loop.
+        '''
+        while self.pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as exc:
+                if exc.errno == errno.ECHILD:
+                    self.pids.clear()
+                    break
+                raise
+            if pid == 0:
+                break
+
+            slot = self.pids.pop(pid, None)
+            if slot is None or not self.running:
+                continue
+            now = time.time()
+            if now - self.started.get(slot, 0) < MIN_UPTIME:
+                delay = min(self.delays.get(slot, 0) * 2 or RESTART_DELAY,
+                    MAX_RESTART_DELAY)
+            else:
+                delay = 0
+            self.delays[slot] = delay
+            self.restarts[slot] = now + delay
+            self.logger.warning(
+                'Worker %d (pid %d) died with status %d, restarting in %.1fs'
+                % (slot, pid, status, delay)
+            )
+
+        now = time.time()
+        for slot, due in list(self.restarts.items()):
+            if self.running and due <= now:
+                del self.restarts[slot]
+                self.spawn(slot)
+
+    def stats(self):
+        '''
+        Returns {slot: (pid, qps)} since the previous call.
+        '''
+        now = time.time()
+        elapsed = max(now - (self.last_report or now), 1e-6)
+        self.last_report = now
+
+        slots = dict((slot, pid) for (pid, slot) in self.pids.items())
+        result = {}
+        for slot in range(self.workers):
+            count = self.counters[slot]
+            qps = max(count - self.last_counts[slot], 0) / elapsed
+            self.last_counts[slot] = count
+            result[slot] = (slots.get(slot), qps)
+        return result
+
+    def memory(self):
+        '''
+        Returns {slot: (pid, unique bytes or None)}.
+        '''
+        return dict(
+            (slot, (pid, unique_memory(pid)))
+            for (pid, slot) in self.pids.items()
+        )
+
+    def report(self):
+        '''
+        Log per-worker throughput and unique memory. These are logged as
+        warnings, so they show up at the default log level.
+        '''
+        stats = self.stats()
+        memory = self.memory()
+        for slot in sorted(stats):
+            pid, qps = stats[slot]
+            uss = memory.get(slot, (pid, None))[1]
+            self.logger.warning('worker %d pid %s: %.1f qps, %s unique' % (
+                slot, pid, qps,
+                '%.1f MB' % (uss / 1e6) if uss is not None else 'unknown'
+            ))
+        self.logger.warning('total: %.1f qps' % sum(
+            qps for (pid, qps) in stats.values()
+        ))
+        return stats
+
+    def stop(self):
+        '''
+        Terminate all workers and wait for them to exit.
+        '''
+        self.running = False
+        self.restarts.clear()
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in list(self.pids):
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+            self.pids.pop(pid, None)
+
+    # Worker side -----------------------------------------
+
+    def run_worker(self, slot):
+        '''
+        Body of a worker process.
+        '''
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        server = self.factory()
+        server.config['reuse_port'] = True
+        server.bind()
+
+        def shutdown(signum, frame):
+            server.serving = False
+        signal.signal(signal.SIGTERM, shutdown)
+
+        publisher = threading.Thread(
+            target = self._publish,
+            args   = (server, slot),
+            name   = 'pymads-worker-%d-stats' % slot,
+        )
+        publisher.daemon = True
+        publisher.start()
+
+        server.serve()
+
+    def _publish(self, server, slot):
+        '''
+        Copy the worker's query count into shared memory, periodically.
+        '''
+        while server.serving:
+            self.counters[slot] = server.queries
+            time.sleep(0.5)